@@ -1,18 +1,81 @@
 from abc import ABC, abstractmethod
 from typing import List, Tuple
-from abracadabra.fingerprint import Fingerprint
+from abracadabra.fingerprint import Fingerprints
+from abracadabra.scoring import Candidate, Histogram, offset_histogram, rank_matches
+import numpy as np
 
 
 class AbstractFingerprintDB(ABC):
+    # Index songs by fingerprinting the decoder output of `stream_audio` as it
+    # arrives, instead of loading each song with `load_audio` first
+    streaming_ingest = False
+    # Optional AudioCache of decoded audio and fingerprints used when indexing
+    audio_cache = None
+    # Whether add_songs may be called from several threads at once
+    concurrent_writes = False
+    # Bumped by every write of this object, so cached match results ranked
+    # against an older index can be told apart (see cache.RecognitionCache)
+    index_generation = 0
+
     @abstractmethod
-    def add_song(
-        self, song_id: int, title: str, fingerprints: List[Fingerprint]
-    ) -> None:
+    def add_song(self, song_id: int, title: str, fingerprints: Fingerprints) -> None:
+        """
+        Accepts either a list of fingerprint dicts or `FingerprintArrays`.
+        """
         pass
 
+    def add_songs(self, songs: List[Tuple[int, str, Fingerprints]]) -> None:
+        """
+        Adds several (song_id, title, fingerprints) at once. Backends with a
+        cheaper bulk path override this.
+        """
+        for song_id, title, fingerprints in songs:
+            self.add_song(song_id, title, fingerprints)
+
     @abstractmethod
-    def get_matches(self, query_fps: List[Fingerprint]) -> List[Tuple[int, int]]:
+    def get_matches(self, query_fps: Fingerprints) -> List[Tuple[int, int]]:
         """
         Returns list of (song_id, time_offset) matches.
         """
         pass
+
+    def get_match_arrays(
+        self, query_fps: Fingerprints
+    ) -> Tuple[np.ndarray, np.ndarray]:
+        """
+        `get_matches` as parallel (song_ids, offsets) arrays.
+        """
+        matches = self.get_matches(query_fps)
+        if not matches:
+            return np.empty(0, dtype=np.int64), np.empty(0, dtype=np.int64)
+        song_ids, offsets = zip(*matches)
+        return np.array(song_ids), np.array(offsets)
+
+    def get_offset_histogram(
+        self, query_fps: Fingerprints, offset_tolerance: int = 0, max_bins: int = None
+    ) -> Histogram:
+        """
+        `scoring.offset_histogram` of the matches of `query_fps`, keeping only
+        the `max_bins` fullest (song, offset) bins when given. Backends can
+        override this to aggregate closer to the data.
+        """
+        song_ids, bins, counts = offset_histogram(
+            *self.get_match_arrays(query_fps), offset_tolerance=offset_tolerance
+        )
+        if max_bins is not None and len(counts) > max_bins:
+            keep = np.sort(np.argsort(-counts, kind="stable")[:max_bins])
+            song_ids, bins, counts = song_ids[keep], bins[keep], counts[keep]
+        return song_ids, bins, counts
+
+    def get_top_matches(
+        self, query_fps: Fingerprints, top_k: int = 5, offset_tolerance: int = 0
+    ) -> List[Candidate]:
+        """
+        Returns up to `top_k` (song_id, time_offset, score) candidates, best
+        first, scored by `scoring.rank_matches`. Backends can override this
+        to score closer to the data.
+        """
+        song_ids, offsets = self.get_match_arrays(query_fps)
+        return rank_matches(
+            song_ids, offsets, top_k=top_k, offset_tolerance=offset_tolerance
+        )
@@ -1,21 +1,36 @@
 import os
 import psycopg2
-from psycopg2.extras import execute_values
-from typing import List, Tuple, Dict
+from typing import Dict, Iterable, Iterator, List, Tuple
 import sys
 
 sys.path.insert(
     0, os.path.abspath(os.path.join(os.path.dirname(__file__), "../../src"))
 )
 from abracadabra.AbstractFingerprintDB import AbstractFingerprintDB
-from google.cloud import secretmanager
+from abracadabra.audio import decode_audio, iter_decode_audio
+from abracadabra.bloom import BloomFilter
+from abracadabra.cache import TTLCache
+from abracadabra import clients
+from abracadabra.db_pool import ConnectionPool, get_connection_pool
+from abracadabra.fingerprint import (
+    FINGERPRINT_PARAM_VERSION,
+    FingerprintArrays,
+    Fingerprints,
+    to_fingerprint_arrays,
+)
+from abracadabra.scoring import Candidate, Histogram
 import yt_dlp
-from pydub import AudioSegment
-import numpy as np
 import re
 import logging
+import struct
+import json
+import contextlib
+import threading
+import time
+from io import BytesIO
+import numpy as np
 from psycopg2 import sql
-from datetime import datetime
+from datetime import datetime, timedelta
 
 logging.basicConfig(
     level=logging.INFO, format="%(asctime)s - %(levelname)s - %(message)s"
@@ -24,10 +39,7 @@ logger = logging.getLogger(__name__)
 
 
 def get_secret(secret_id: str, project_id: str):
-    client = secretmanager.SecretManagerServiceClient()
-    name = f"projects/{project_id}/secrets/{secret_id}/versions/latest"
-    response = client.access_secret_version(request={"name": name})
-    return response.payload.data.decode("utf-8").replace("\n", "")
+    return clients.get_secret(secret_id, project_id)
 
 
 def sanitize_filename(name: str) -> str:
@@ -52,23 +64,194 @@ def parse_date(date_str):
         return None
 
 
+def _parse_int(value):
+    if isinstance(value, str):
+        value = value.strip()
+        return int(value) if value.isdigit() else None
+    return value
+
+
+def _parse_bool(value):
+    if isinstance(value, str):
+        value = value.strip().lower()
+        return value == "true" if value else None
+    return value
+
+
+def _track_row(song_info: Dict):
+    """
+    Normalizes a song_info dict into a tracks row followed by its genre list.
+    Values may be typed (Spotify API) or strings (CSV): genres are a list or
+    a comma-separated string. Returns None if the URI or name is missing.
+    """
+    track_uri = song_info.get("Track URI")
+    track_name = song_info.get("Track Name")
+    if not track_uri:
+        logger.warning("Skipping song due to missing 'Track URI'.")
+        return None
+    if not track_name:
+        logger.warning(
+            f"Skipping row song (URI: {track_uri}) due to missing 'Track Name'."
+        )
+        return None
+
+    genres = song_info.get("Artist Genres") or []
+    if isinstance(genres, str):
+        genres = genres.split(",")
+    genres = sorted({genre.strip() for genre in genres if genre and genre.strip()})
+
+    return (
+        track_uri,
+        track_name,
+        song_info.get("Artist Name(s)"),
+        song_info.get("Album Name"),
+        parse_date(song_info.get("Album Release Date")),
+        song_info.get("Album Image URL"),
+        _parse_int(song_info.get("Track Duration (ms)")),
+        _parse_bool(song_info.get("Explicit")),
+        _parse_int(song_info.get("Popularity")),
+        song_info.get("youtube_title"),
+        song_info.get("youtube_url"),
+        genres,
+    )
+
+
+# Binary COPY layout of one fingerprints_staging row: field count, then
+# (length, value) per column. All integers are big endian.
+COPY_ROW_DTYPE = np.dtype(
+    [
+        ("n_fields", ">i2"),
+        ("song_id_len", ">i4"),
+        ("song_id", ">i4"),
+        ("hash_len", ">i4"),
+        ("hash", ">i8"),
+        ("timestamp_len", ">i4"),
+        ("timestamp", ">f8"),
+    ]
+)
+COPY_HEADER = b"PGCOPY\n\xff\r\n\0" + struct.pack(">ii", 0, 0)
+COPY_TRAILER = struct.pack(">h", -1)
+
+
+def to_copy_binary(
+    song_ids: np.ndarray, hashes: np.ndarray, timestamps: np.ndarray
+) -> bytes:
+    """
+    Encodes fingerprint rows in PostgreSQL's binary COPY format.
+    """
+    rows = np.empty(len(hashes), dtype=COPY_ROW_DTYPE)
+    rows["n_fields"] = 3
+    rows["song_id_len"] = 4
+    rows["song_id"] = song_ids
+    rows["hash_len"] = 8
+    rows["hash"] = hashes
+    rows["timestamp_len"] = 8
+    rows["timestamp"] = timestamps
+    return COPY_HEADER + rows.tobytes() + COPY_TRAILER
+
+
+# Binary COPY output of a single BIGINT column: field count, length, value
+COPY_HASH_DTYPE = np.dtype([("n_fields", ">i2"), ("hash_len", ">i4"), ("hash", ">i8")])
+
+
+class _CopyHashSink:
+    """
+    File-like target for `copy_expert` that parses a binary COPY of one
+    BIGINT column and adds the values to a Bloom filter. psycopg2 writes one
+    row per call, so rows are buffered and added `batch_rows` at a time, under
+    `lock` when the filter is shared; call `flush` once the COPY is done.
+    """
+
+    def __init__(
+        self,
+        bloom: BloomFilter,
+        batch_rows: int = 1 << 20,
+        lock=contextlib.nullcontext(),
+    ):
+        self.bloom = bloom
+        self.lock = lock
+        self.batch_bytes = batch_rows * COPY_HASH_DTYPE.itemsize
+        self.chunks = []
+        self.buffered = 0
+        self.header_pending = True
+
+    def write(self, data) -> int:
+        self.chunks.append(bytes(data))
+        self.buffered += len(data)
+        if self.buffered >= self.batch_bytes:
+            self._add_rows()
+        return len(data)
+
+    def _add_rows(self) -> None:
+        data = b"".join(self.chunks)
+        start = 0
+        if self.header_pending and len(data) >= len(COPY_HEADER):
+            start = len(COPY_HEADER)
+            self.header_pending = False
+        n_rows = (len(data) - start) // COPY_HASH_DTYPE.itemsize
+        rows = np.frombuffer(data, dtype=COPY_HASH_DTYPE, count=n_rows, offset=start)
+        if n_rows:
+            with self.lock:
+                self.bloom.add(rows["hash"].astype(np.int64))
+        # Keep a partial row (or the 2-byte trailer) for the next batch
+        consumed = start + n_rows * COPY_HASH_DTYPE.itemsize
+        rest = data[consumed:]
+        self.chunks = [rest]
+        self.buffered = len(rest)
+
+    def flush(self) -> None:
+        self._add_rows()
+
+
 class GCPFingerprintDB(AbstractFingerprintDB):
-    def __init__(self, project_id: str = "cloud-computing-project-458205"):
+    # Table read and written by the matching/indexing queries, and its
+    # anchor-time column. Subclasses targeting another schema override these.
+    fingerprints_table = "fingerprints"
+    time_column = "timestamp"
+    # One row per indexed song: fingerprint count, FINGERPRINT_PARAM_VERSION
+    # and time of indexing, written in the same transaction as the fingerprints
+    indexed_songs_table = "indexed_songs"
+
+    # Optional Bloom filter of all stored hashes, see enable_hash_filter
+    hash_filter = None
+    # Seconds between background checks for songs indexed by other processes,
+    # and how far before the last check each one looks, to catch writes that
+    # were still uncommitted at the time
+    hash_filter_refresh_interval = 60.0
+    hash_filter_sync_overlap = timedelta(minutes=5)
+
+    # Track metadata returned by check_song_info, keyed by song_id
+    song_info_cache = None
+    # Writers check out their own pooled connection per transaction
+    concurrent_writes = True
+
+    def __init__(
+        self,
+        project_id: str = "cloud-computing-project-458205",
+        pool: ConnectionPool = None,
+    ):
         self.project_id = project_id
-        self.dbname = os.getenv("DB_NAME", "database-instance")
-        self.user = get_secret("DB_USER", project_id)
-        self.password = get_secret("DB_PASSWORD", project_id)
-        self.host = get_secret("DB_HOST", project_id)
-        self.port = os.getenv("DB_PORT", "5432")
-
-        self.conn = psycopg2.connect(
-            dbname=self.dbname,
-            user=self.user,
-            password=self.password,
-            host=self.host,
-            port=self.port,
+
+        # Connections come from a process-wide pool and are checked out per
+        # call, so one instance can be shared between threads and requests.
+        if pool is None:
+            self.dbname = os.getenv("DB_NAME", "database-instance")
+            self.user = get_secret("DB_USER", project_id)
+            self.password = get_secret("DB_PASSWORD", project_id)
+            self.host = get_secret("DB_HOST", project_id)
+            self.port = os.getenv("DB_PORT", "5432")
+            pool = get_connection_pool(
+                dbname=self.dbname,
+                user=self.user,
+                password=self.password,
+                host=self.host,
+                port=self.port,
+            )
+        self.pool = pool
+        self.song_info_cache = TTLCache(
+            maxsize=int(os.getenv("SONG_INFO_CACHE_SIZE", "4096")),
+            ttl=float(os.getenv("SONG_INFO_CACHE_TTL", "600")),
         )
-        self.conn.autocommit = True
 
     @staticmethod
     def load_audio(
@@ -121,12 +304,7 @@ class GCPFingerprintDB(AbstractFingerprintDB):
 
         # Decode audio
         try:
-            audio = AudioSegment.from_file(output_path_m4a)
-            audio = audio.set_channels(1).set_frame_rate(sr)
-            samples = (
-                np.array(audio.get_array_of_samples()).astype(np.float32) / 32768.0
-            )
-            return samples, sr
+            return decode_audio(output_path_m4a, sr=sr), sr
         except Exception as e:
             print(f"Error decoding audio for track {song_id}: {e}")
             return None
@@ -134,90 +312,472 @@ class GCPFingerprintDB(AbstractFingerprintDB):
             if os.path.exists(output_path_m4a):
                 os.remove(output_path_m4a)
 
-    def load_tracks_from_db(self, min_id: int = None):
-        id_condition = ""
-        if min_id is not None:
-            id_condition = f" AND track_id > {min_id}"
-        with self.conn.cursor() as cur:
+    @staticmethod
+    def stream_audio(youtube_url: str, sr: int = 22050) -> Iterator[np.ndarray]:
+        """
+        Streaming counterpart of `load_audio`: yt_dlp only resolves the media
+        URL of the best audio format, which ffmpeg fetches and decodes into
+        float32 chunks as it downloads, so nothing is written to disk.
+        """
+        ydl_opts = {
+            "format": "bestaudio/best",
+            "quiet": True,
+            "no_warnings": True,
+            "cookiefile": "abracadabra/www.youtube.com_cookies.txt",
+            "noplaylist": True,
+        }
+        with yt_dlp.YoutubeDL(ydl_opts) as ydl:
+            info = ydl.extract_info(youtube_url, download=False)
+        if not info.get("url"):
+            raise ValueError(f"No direct audio URL for {youtube_url}")
+        return iter_decode_audio(
+            info["url"], sr=sr, http_headers=info.get("http_headers")
+        )
+
+    def _sql(self, query: str) -> sql.Composed:
+        """
+        Fills the {fingerprints}, {t} and {indexed_songs} placeholders of `query`.
+        """
+        return sql.SQL(query).format(
+            fingerprints=sql.Identifier(self.fingerprints_table),
+            t=sql.Identifier(self.time_column),
+            indexed_songs=sql.Identifier(self.indexed_songs_table),
+        )
+
+    def enable_hash_filter(self, path: str = None, error_rate: float = 0.01) -> None:
+        """
+        Keeps an in-process Bloom filter of every hash in the fingerprints
+        table, so matching only sends the database query hashes that may be
+        indexed; with microphone recordings most of them are not.
+
+        The filter is built in memory by streaming all hashes from the
+        database on a background thread, and queries are not filtered until it
+        is ready. With `path`, it is also saved there and loaded from it on the
+        next start instead. It is updated by add_song(s), and the same thread
+        adds the songs other processes indexed (found through
+        indexed_songs.indexed_at) every `hash_filter_refresh_interval` seconds,
+        and rebuilds the filter once its false-positive rate has doubled, so
+        queries never wait for the database. Filters cannot forget, so removed
+        songs only cost false positives.
+        """
+        self._hash_filter_lock = threading.Lock()
+        self._hash_filter_path = path
+        self._hash_filter_error_rate = error_rate
+        # song_id -> indexed_at of the songs added since the last sync began,
+        # so the overlap of the next one skips them
+        self._hash_filter_songs = {}
+        threading.Thread(
+            target=self._run_hash_filter, name="hash-filter", daemon=True
+        ).start()
+
+    def _run_hash_filter(self) -> None:
+        try:
+            self._load_hash_filter()
+        except Exception:
+            # The first sync builds it from the database instead
+            logger.exception(
+                f"Could not load the hash filter from {self._hash_filter_path}, rebuilding it"
+            )
+        while True:
+            try:
+                self._sync_hash_filter()
+            except Exception:
+                logger.exception("Could not sync the hash filter")
+            time.sleep(self.hash_filter_refresh_interval)
+
+    def _load_hash_filter(self) -> None:
+        path = self._hash_filter_path
+        if not (path and os.path.exists(path) and os.path.exists(f"{path}.json")):
+            return
+        with open(f"{path}.json") as f:
+            meta = json.load(f)
+        if meta.get("fingerprints_table") != self.fingerprints_table:
+            return
+        bloom = BloomFilter.load(path)
+        with self._hash_filter_lock:
+            self._hash_filter_synced_at = datetime.fromisoformat(meta["synced_at"])
+            self.hash_filter = bloom
+
+    def _build_hash_filter(self) -> None:
+        start = time.perf_counter()
+        with self.pool.connection() as conn, conn.cursor() as cur:
             cur.execute(
-                "SELECT track_id, track_name, youtube_url FROM tracks "
-                f"WHERE youtube_url != ''{id_condition};"
+                self._sql(
+                    "SELECT now(), coalesce(sum(fingerprint_count), 0) FROM {indexed_songs};"
+                )
+            )
+            synced_at, n_fingerprints = cur.fetchone()
+            # Headroom for songs indexed while this process runs
+            bloom = BloomFilter.for_capacity(
+                max(2 * int(n_fingerprints), 1_000_000), self._hash_filter_error_rate
+            )
+            sink = _CopyHashSink(bloom)
+            cur.copy_expert(
+                self._sql(
+                    "COPY (SELECT hash FROM {fingerprints}) TO STDOUT WITH (FORMAT binary);"
+                ).as_string(conn),
+                sink,
             )
+            sink.flush()
+        # Songs written by add_song(s) meanwhile went to the old filter; the
+        # sync that follows adds them again from the database
+        with self._hash_filter_lock:
+            self.hash_filter = bloom
+            self._hash_filter_synced_at = synced_at
+            self._hash_filter_songs = {}
+        logger.info(
+            f"Built hash filter from {len(bloom)} fingerprints "
+            f"({bloom.nbytes / 1e6:.1f} MB) in {time.perf_counter() - start:.1f}s"
+        )
+        self._save_hash_filter()
+
+    def _save_hash_filter(self) -> None:
+        if not self._hash_filter_path:
+            return
+        self.hash_filter.save(self._hash_filter_path)
+        meta_path = f"{self._hash_filter_path}.json"
+        with open(f"{meta_path}.tmp", "w") as f:
+            json.dump(
+                {
+                    "fingerprints_table": self.fingerprints_table,
+                    "synced_at": self._hash_filter_synced_at.isoformat(),
+                },
+                f,
+            )
+        os.replace(f"{meta_path}.tmp", meta_path)
+
+    def _sync_hash_filter(self) -> None:
+        """
+        Adds the hashes of songs indexed since the last sync that are not in
+        the filter yet, after (re)building it if there is none or so many
+        bits are set that its false-positive rate has doubled.
+        """
+        bloom = self.hash_filter
+        max_rate = 2 * self._hash_filter_error_rate
+        if bloom is None or bloom.false_positive_rate() > max_rate:
+            self._build_hash_filter()
+
+        since = self._hash_filter_synced_at - self.hash_filter_sync_overlap
+        with self.pool.connection() as conn, conn.cursor() as cur:
+            cur.execute("SELECT now();")
+            (synced_at,) = cur.fetchone()
+            cur.execute(
+                self._sql(
+                    "SELECT song_id, indexed_at FROM {indexed_songs} WHERE indexed_at > %s;"
+                ),
+                (since,),
+            )
+            indexed = cur.fetchall()
+            with self._hash_filter_lock:
+                new_song_ids = [
+                    song_id
+                    for song_id, indexed_at in indexed
+                    if self._hash_filter_songs.get(song_id) != indexed_at
+                ]
+            if new_song_ids:
+                query = self._sql(
+                    "COPY (SELECT hash FROM {fingerprints} WHERE song_id = ANY(%s)) "
+                    "TO STDOUT WITH (FORMAT binary);"
+                )
+                sink = _CopyHashSink(self.hash_filter, lock=self._hash_filter_lock)
+                cur.copy_expert(cur.mogrify(query, (new_song_ids,)).decode(), sink)
+                sink.flush()
+
+        next_since = synced_at - self.hash_filter_sync_overlap
+        with self._hash_filter_lock:
+            songs = self._hash_filter_songs
+            songs.update(indexed)
+            self._hash_filter_songs = {
+                song_id: indexed_at
+                for song_id, indexed_at in songs.items()
+                if indexed_at > next_since
+            }
+            self._hash_filter_synced_at = synced_at
+        if new_song_ids:
+            # Cached match results may miss the songs other processes indexed
+            self.index_generation += 1
+            self._save_hash_filter()
+
+    def _add_to_hash_filter(self, hashes: np.ndarray, indexed: list) -> None:
+        """
+        Adds the hashes of songs just written, with their (song_id,
+        indexed_at) rows, so the next sync does not add them again.
+        """
+        if self.hash_filter is not None:
+            with self._hash_filter_lock:
+                self.hash_filter.add(hashes)
+                self._hash_filter_songs.update(indexed)
+
+    def _filter_known_hashes(self, fps: FingerprintArrays) -> FingerprintArrays:
+        """
+        Drops query fingerprints whose hash is certainly not indexed.
+        """
+        bloom = self.hash_filter
+        if bloom is None or len(fps) == 0:
+            return fps
+        keep = bloom.might_contain(fps.hashes)
+        return FingerprintArrays(*(np.asarray(column)[keep] for column in fps))
+
+    def load_tracks_from_db(self, min_id: int = None, limit: int = None):
+        """
+        (track_id, track_name, youtube_url) of tracks with a YouTube URL. With
+        `limit`, the first `limit` tracks after `min_id` in track_id order, so
+        the table can be walked in keyset batches.
+        """
+        query = "SELECT track_id, track_name, youtube_url FROM tracks WHERE youtube_url != ''"
+        params = []
+        if min_id is not None:
+            query += " AND track_id > %s"
+            params.append(min_id)
+        if limit is not None:
+            query += " ORDER BY track_id LIMIT %s"
+            params.append(limit)
+        with self.pool.connection(autocommit=True) as conn, conn.cursor() as cur:
+            cur.execute(query + ";", params)
             rows = cur.fetchall()
             return rows
 
-    def add_song(
-        self, song_id: int, title: str, fingerprints: List[Dict[str, any]]
-    ) -> None:
-
-        # Insert fingerprints in bulk
-        records = []
-        for fp in fingerprints:
-            # Convert hash dict to a consistent string key
-            hash_val = tuple(fp["hash"].values())
-            hash_str = str(hash_val)
-            timestamp = float(fp["timestamp"])
-            records.append((int(song_id), hash_str, timestamp))
-
-        with self.conn.cursor() as cur:
-            # Insert fingerprints; ON CONFLICT do nothing to avoid duplicates
-            insert_query = """
-                INSERT INTO fingerprints (song_id, hash, timestamp)
-                VALUES %s
-                ON CONFLICT (song_id, hash, timestamp) DO NOTHING;
-            """
-            execute_values(cur, insert_query, records)
-
-    def get_matches(
-        self, fingerprints: List[Dict[str, any]]
-    ) -> List[Tuple[int, float]]:
+    def add_song(self, song_id: int, title: str, fingerprints: Fingerprints) -> None:
+        # One write path: binary COPY through the staging table, see add_songs
+        self.add_songs([(song_id, title, fingerprints)])
+
+    def add_songs(self, songs: List[Tuple[int, str, Fingerprints]]) -> None:
+        """
+        Bulk ingest of several (song_id, title, fingerprints) at once.
+
+        All rows are streamed with a single binary COPY into the unlogged
+        fingerprints_staging table and moved into fingerprints with one
+        set-based statement, in one transaction that also updates their
+        indexed_songs entries. Existing fingerprints of these songs are
+        replaced, so re-indexing a song is idempotent. Databases created
+        before the staging table need utils/add_fingerprints_staging.sql.
+        """
+        if not songs:
+            return
+        columns = [to_fingerprint_arrays(fingerprints) for _, _, fingerprints in songs]
+        song_ids = np.concatenate(
+            [
+                np.full(len(fps), song_id, dtype=np.int32)
+                for (song_id, _, _), fps in zip(songs, columns)
+            ]
+        )
+        payload = to_copy_binary(
+            song_ids,
+            np.concatenate([fps.hashes for fps in columns]),
+            np.concatenate([fps.timestamp for fps in columns]),
+        )
+
+        with self.pool.connection() as conn, conn.cursor() as cur:
+            cur.copy_expert(
+                "COPY fingerprints_staging (song_id, hash, timestamp) "
+                "FROM STDIN WITH (FORMAT binary);",
+                BytesIO(payload),
+            )
+            # Staged rows are only visible to this transaction, so each writer
+            # moves exactly its own batch.
+            cur.execute(
+                self._sql(
+                    """
+                    DELETE FROM {fingerprints} WHERE song_id = ANY(%(song_ids)s);
+                    WITH staged AS (
+                        DELETE FROM fingerprints_staging RETURNING song_id, hash, timestamp
+                    ), inserted AS (
+                        INSERT INTO {fingerprints} (song_id, hash, {t})
+                        SELECT DISTINCT song_id, hash, timestamp FROM staged
+                        RETURNING song_id
+                    )
+                    INSERT INTO {indexed_songs} (song_id, fingerprint_count, param_version)
+                    SELECT s.song_id, count(i.song_id), %(version)s
+                    FROM unnest(%(song_ids)s::integer[]) AS s(song_id)
+                    LEFT JOIN inserted i ON i.song_id = s.song_id
+                    GROUP BY s.song_id
+                    ON CONFLICT (song_id) DO UPDATE SET
+                        fingerprint_count = EXCLUDED.fingerprint_count,
+                        param_version = EXCLUDED.param_version,
+                        indexed_at = CURRENT_TIMESTAMP
+                    RETURNING song_id, indexed_at;
+                    """
+                ),
+                {
+                    "song_ids": [int(song_id) for song_id, _, _ in songs],
+                    "version": FINGERPRINT_PARAM_VERSION,
+                },
+            )
+            indexed = cur.fetchall()
+        self.index_generation += 1
+        self._add_to_hash_filter(
+            np.concatenate([fps.hashes for fps in columns]), indexed
+        )
+
+    def get_matches(self, fingerprints: Fingerprints) -> List[Tuple[int, float]]:
         matches = []
-        if not fingerprints:
+        fps = self._filter_known_hashes(to_fingerprint_arrays(fingerprints))
+        if len(fps) == 0:
             return matches
 
-        # Prepare list of hash strings for query
-        hash_list = [str(tuple(fp["hash"].values())) for fp in fingerprints]
+        # Map packed hash to query timestamps for fast lookup
+        hash_to_query_timestamps = {}
+        for hash_val, timestamp in zip(fps.hashes.tolist(), fps.timestamp.tolist()):
+            hash_to_query_timestamps.setdefault(hash_val, []).append(timestamp)
 
-        with self.conn.cursor() as cur:
+        with self.pool.connection(autocommit=True) as conn, conn.cursor() as cur:
             # Query matching fingerprints from DB
-            query = """
-                SELECT song_id, timestamp FROM fingerprints
-                WHERE hash = ANY(%s);
-            """
-            cur.execute(query, (hash_list,))
+            query = self._sql(
+                """
+                SELECT hash, song_id, {t} FROM {fingerprints}
+                WHERE hash = ANY(%s::bigint[]);
+                """
+            )
+            cur.execute(query, (list(hash_to_query_timestamps),))
             results = cur.fetchall()
 
         # For each match, compute offset = DB_timestamp - query_timestamp
-        # Use dict to map hash to query timestamps for fast lookup
-        hash_to_query_timestamps = {}
-        for fp in fingerprints:
-            hash_str = str(tuple(fp["hash"].values()))
-            hash_to_query_timestamps.setdefault(hash_str, []).append(fp["timestamp"])
-
-        for song_id, db_timestamp in results:
-            # Calculate offsets for all query timestamps with the same hash
-            # Append all matches
-            for query_timestamp in hash_to_query_timestamps.get(
-                str(tuple(fp["hash"].values())), []
-            ):
-                offset = db_timestamp - query_timestamp
-                matches.append((song_id, offset))
+        # for all query timestamps with the same hash
+        for hash_val, song_id, db_timestamp in results:
+            for query_timestamp in hash_to_query_timestamps.get(hash_val, []):
+                matches.append((song_id, db_timestamp - query_timestamp))
 
         return matches
 
+    def get_top_matches(
+        self, fingerprints: Fingerprints, top_k: int = 5, offset_tolerance: int = 0
+    ) -> List[Candidate]:
+        """
+        Offset-histogram scoring done in Postgres: query hashes and timestamps
+        are shipped as arrays, the (song_id, offset) histogram is built with
+        GROUP BY and only the best bin of the top `top_k` songs comes back.
+        Binning, including the pairing of neighbouring bins, follows
+        `scoring.rank_matches`.
+        """
+        fps = self._filter_known_hashes(to_fingerprint_arrays(fingerprints))
+        if len(fps) == 0:
+            return []
+
+        with self.pool.connection(autocommit=True) as conn, conn.cursor() as cur:
+            query = self._sql(
+                """
+                WITH query_fps AS (
+                    SELECT *
+                    FROM unnest(%(hashes)s::bigint[], %(timestamps)s::float8[])
+                        AS q(hash, timestamp)
+                ),
+                histogram AS (
+                    SELECT f.song_id,
+                           (floor((f.{t} - q.timestamp + %(tolerance)s) / %(width)s)
+                            * %(width)s)::bigint AS time_offset,
+                           COUNT(*) AS score
+                    FROM query_fps q
+                    JOIN {fingerprints} f ON f.hash = q.hash
+                    GROUP BY f.song_id, time_offset
+                ),
+                neighbours AS (
+                    SELECT song_id, time_offset, score,
+                           lead(time_offset) OVER w AS next_offset,
+                           CASE WHEN %(tolerance)s > 0
+                                AND lead(time_offset) OVER w = time_offset + %(width)s
+                           THEN lead(score) OVER w END AS next_score
+                    FROM histogram
+                    WINDOW w AS (PARTITION BY song_id ORDER BY time_offset)
+                ),
+                paired AS (
+                    SELECT song_id,
+                           CASE WHEN next_score > score THEN next_offset
+                                ELSE time_offset END AS time_offset,
+                           score + coalesce(next_score, 0) AS score
+                    FROM neighbours
+                ),
+                best_per_song AS (
+                    SELECT DISTINCT ON (song_id) song_id, time_offset, score
+                    FROM paired
+                    ORDER BY song_id, score DESC
+                )
+                SELECT song_id, time_offset, score FROM best_per_song
+                ORDER BY score DESC
+                LIMIT %(top_k)s;
+                """
+            )
+            cur.execute(
+                query,
+                {
+                    "hashes": fps.hashes.tolist(),
+                    "timestamps": fps.timestamp.astype(float).tolist(),
+                    "tolerance": offset_tolerance,
+                    "width": 2 * offset_tolerance + 1,
+                    "top_k": top_k,
+                },
+            )
+            return [tuple(row) for row in cur.fetchall()]
+
+    def get_offset_histogram(
+        self,
+        fingerprints: Fingerprints,
+        offset_tolerance: int = 0,
+        max_bins: int = None,
+    ) -> Histogram:
+        """
+        The (song_id, offset bin) histogram of `get_top_matches`, built with
+        GROUP BY in Postgres; only the `max_bins` fullest bins come back.
+        """
+        fps = self._filter_known_hashes(to_fingerprint_arrays(fingerprints))
+        if len(fps) == 0:
+            empty = np.empty(0, dtype=np.int64)
+            return empty, empty, empty
+
+        with self.pool.connection(autocommit=True) as conn, conn.cursor() as cur:
+            query = self._sql(
+                """
+                WITH query_fps AS (
+                    SELECT *
+                    FROM unnest(%(hashes)s::bigint[], %(timestamps)s::float8[])
+                        AS q(hash, timestamp)
+                )
+                SELECT f.song_id,
+                       floor((f.{t} - q.timestamp + %(tolerance)s) / %(width)s)::bigint
+                           AS time_bin,
+                       COUNT(*) AS score
+                FROM query_fps q
+                JOIN {fingerprints} f ON f.hash = q.hash
+                GROUP BY f.song_id, time_bin
+                ORDER BY score DESC
+                LIMIT %(max_bins)s;
+                """
+            )
+            cur.execute(
+                query,
+                {
+                    "hashes": fps.hashes.tolist(),
+                    "timestamps": fps.timestamp.astype(float).tolist(),
+                    "tolerance": offset_tolerance,
+                    "width": 2 * offset_tolerance + 1,
+                    "max_bins": max_bins,
+                },
+            )
+            rows = cur.fetchall()
+        if not rows:
+            empty = np.empty(0, dtype=np.int64)
+            return empty, empty, empty
+        song_ids, bins, counts = np.array(rows, dtype=np.int64).T
+        return song_ids, bins, counts
+
     def show_table(self):
-        with self.conn.cursor() as cur:
+        with self.pool.connection(autocommit=True) as conn, conn.cursor() as cur:
             cur.execute(
-                "SELECT DISTINCT fingerprints.song_id, tracks.track_name FROM fingerprints "
-                "JOIN tracks ON fingerprints.song_id = tracks.track_id "
-                "ORDER BY fingerprints.song_id;"
+                self._sql(
+                    "SELECT s.song_id, tracks.track_name FROM {indexed_songs} s "
+                    "JOIN tracks ON s.song_id = tracks.track_id "
+                    "ORDER BY s.song_id;"
+                )
             )
             rows = cur.fetchall()
             for row in rows:
                 print(row)
 
     def check_song_info(self, song_id: int) -> dict:
-        with self.conn.cursor() as cur:
+        cached = self.song_info_cache.get(song_id)
+        if cached is not None:
+            return dict(cached)
+
+        with self.pool.connection(autocommit=True) as conn, conn.cursor() as cur:
             cur.execute(
                 "SELECT "
                 "track_name, artist_names, album_name, album_release_date, "
@@ -227,7 +787,7 @@ class GCPFingerprintDB(AbstractFingerprintDB):
             )
             row = cur.fetchone()
             if row:
-                return {
+                info = {
                     "track_name": row[0],
                     "artist_names": row[1],
                     "album_name": row[2],
@@ -237,177 +797,168 @@ class GCPFingerprintDB(AbstractFingerprintDB):
                     "explicit": row[6],
                     "youtube_url": row[7],
                 }
+                self.song_info_cache.put(song_id, info)
+                return dict(info)
             else:
                 return {}
 
-    def get_indexed_song_ids(self) -> List[int]:
-        with self.conn.cursor() as cur:
-            cur.execute("SELECT DISTINCT song_id FROM fingerprints;")
+    def get_indexed_song_ids(
+        self, param_version: int = None, song_ids: Iterable[int] = None
+    ) -> List[int]:
+        """
+        IDs of indexed songs; with `param_version`, only those fingerprinted
+        with that FINGERPRINT_PARAM_VERSION (others need re-indexing), and with
+        `song_ids`, only those among them.
+        """
+        conditions, params = [], []
+        if param_version is not None:
+            conditions.append("param_version = %s")
+            params.append(param_version)
+        if song_ids is not None:
+            conditions.append("song_id = ANY(%s)")
+            params.append([int(song_id) for song_id in song_ids])
+        query = "SELECT song_id FROM {indexed_songs}"
+        if conditions:
+            query += " WHERE " + " AND ".join(conditions)
+        with self.pool.connection(autocommit=True) as conn, conn.cursor() as cur:
+            cur.execute(self._sql(query + ";"), params)
             return [row[0] for row in cur.fetchall()]
 
-    def load_song_to_tracks(self, song_info: Dict):
-        with self.conn.cursor() as cursor:
-            try:
-                # 1. Extract and prepare track data
-                original_track_uri = song_info["Track URI"]
-                track_name = song_info["Track Name"]
-
-                if not original_track_uri:
-                    logger.warning("Skipping song due to missing 'Track URI'.")
-                    return
-                if not track_name:
-                    logger.warning(
-                        f"Skipping row song (URI: {original_track_uri}) "
-                        f"due to missing 'Track Name'."
-                    )
-                    return
-
-                artist_names = song_info["Artist Name(s)"]
-                album_name = song_info["Album Name"]
-                album_release_date_str = song_info["Album Release Date"]
-                album_image_url = song_info["Album Image URL"]
-
-                track_duration_ms = song_info["Track Duration (ms)"]
-
-                explicit = song_info["Explicit"]
-
-                popularity = song_info["Popularity"]
-
-                youtube_title = song_info["youtube_title"]
-                youtube_url = song_info["youtube_url"]
-                artist_genres = song_info["Artist Genres"]
-
-                album_release_date = parse_date(album_release_date_str)
+    def get_stale_song_ids(self) -> List[int]:
+        """
+        IDs of songs indexed with other parameters than the current
+        FINGERPRINT_PARAM_VERSION.
+        """
+        with self.pool.connection(autocommit=True) as conn, conn.cursor() as cur:
+            cur.execute(
+                self._sql(
+                    "SELECT song_id FROM {indexed_songs} WHERE param_version <> %s "
+                    "ORDER BY song_id;"
+                ),
+                (FINGERPRINT_PARAM_VERSION,),
+            )
+            return [row[0] for row in cur.fetchall()]
 
-                logger.info(
-                    f"Processing song: {track_name} by {artist_names} (URI: {original_track_uri})"
+    def get_index_stats(self) -> dict:
+        """
+        Catalogue statistics from the indexed_songs registry, without touching
+        the fingerprints table.
+        """
+        with self.pool.connection(autocommit=True) as conn, conn.cursor() as cur:
+            cur.execute(
+                self._sql(
+                    "SELECT param_version, count(*), coalesce(sum(fingerprint_count), 0), "
+                    "max(indexed_at) FROM {indexed_songs} GROUP BY param_version;"
                 )
+            )
+            rows = cur.fetchall()
+        return {
+            "songs": sum(row[1] for row in rows),
+            "fingerprints": int(sum(row[2] for row in rows)),
+            "songs_by_param_version": {row[0]: row[1] for row in rows},
+            "stale_songs": sum(
+                row[1] for row in rows if row[0] != FINGERPRINT_PARAM_VERSION
+            ),
+            "last_indexed_at": max((row[3] for row in rows), default=None),
+        }
 
-                # 2. Insert/Update Track and get track_id
-                track_sql = sql.SQL(
-                    """
-                    INSERT INTO tracks (
-                        original_track_uri, track_name, artist_names, album_name,
-                        album_release_date, album_image_url, track_duration_ms,
-                        explicit, popularity, youtube_title, youtube_url
-                    ) VALUES (
-                        %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s
-                    )
-                    ON CONFLICT (original_track_uri) DO UPDATE SET
-                        track_name = EXCLUDED.track_name,
-                        artist_names = EXCLUDED.artist_names,
-                        album_name = EXCLUDED.album_name,
-                        album_release_date = EXCLUDED.album_release_date,
-                        album_image_url = EXCLUDED.album_image_url,
-                        track_duration_ms = EXCLUDED.track_duration_ms,
-                        explicit = EXCLUDED.explicit,
-                        popularity = EXCLUDED.popularity,
-                        youtube_title = EXCLUDED.youtube_title,
-                        youtube_url = EXCLUDED.youtube_url,
-                        updated_at = CURRENT_TIMESTAMP
-                    RETURNING track_id, (xmax = 0) AS inserted;
+    def load_song_to_tracks(self, song_info: Dict):
+        """
+        Upserts one track and its genres, returning its track_id (None on
+        failure). See `load_songs_to_tracks`.
+        """
+        try:
+            track_ids = self.load_songs_to_tracks([song_info])
+        except psycopg2.Error as db_err:
+            logger.error(
+                f"Database error processing song "
+                f"(Track URI: {song_info.get('Track URI')}): {db_err}"
+            )
+            return None
+        return track_ids.get(song_info.get("Track URI"))
+
+    def load_songs_to_tracks(self, song_infos: Iterable[Dict]) -> Dict[str, int]:
+        """
+        Upserts many tracks (Spotify metadata dicts, or rows of a tracks CSV
+        such as data/top_songs_curated.csv) with their genres and track_genres
+        links in a single transaction of three set-based statements.
+
+        Returns {Track URI: track_id}. Rows without a URI or name are skipped;
+        when a URI appears more than once, the last row wins.
+        """
+        rows = {}
+        for song_info in song_infos:
+            row = _track_row(song_info)
+            if row is not None:
+                rows[row[0]] = row
+        if not rows:
+            return {}
+
+        columns = list(zip(*rows.values()))
+        track_columns = [list(column) for column in columns[:-1]]
+        links = [(uri, genre) for uri, *_, genres in rows.values() for genre in genres]
+        genre_names = sorted({genre for _, genre in links})
+
+        with self.pool.connection() as conn, conn.cursor() as cur:
+            cur.execute(
                 """
+                INSERT INTO tracks (
+                    original_track_uri, track_name, artist_names, album_name,
+                    album_release_date, album_image_url, track_duration_ms,
+                    explicit, popularity, youtube_title, youtube_url
                 )
-
-                cursor.execute(
-                    track_sql,
-                    (
-                        original_track_uri,
-                        track_name,
-                        artist_names,
-                        album_name,
-                        album_release_date,
-                        album_image_url,
-                        track_duration_ms,
-                        explicit,
-                        popularity,
-                        youtube_title,
-                        youtube_url,
-                    ),
+                SELECT * FROM unnest(
+                    %s::text[], %s::text[], %s::text[], %s::text[],
+                    %s::date[], %s::text[], %s::integer[],
+                    %s::boolean[], %s::integer[], %s::text[], %s::text[]
                 )
-                track_id_result = cursor.fetchone()
-                if not track_id_result:
-                    logger.error(
-                        f"Failed to insert or update track (URI: {original_track_uri}). "
-                        f"Skipping genre processing for this track."
-                    )
-                    return
-
-                track_id, was_inserted = track_id_result
-
-                # 3. Process and Insert Genres and Track-Genre links
-                if len(artist_genres) != 0:
-                    for genre_name in artist_genres:
-                        if not genre_name:
-                            continue
-
-                        # a. Insert Genre if not exists, and get genre_id
-                        genre_id = None
-                        cursor.execute(
-                            sql.SQL(
-                                "INSERT INTO genres (genre_name) "
-                                "VALUES (%s) ON CONFLICT (genre_name) "
-                                "DO NOTHING RETURNING genre_id;"
-                            ),
-                            (genre_name,),
-                        )
-                        result = cursor.fetchone()
-                        if result:
-                            genre_id = result[0]
-                            # logger.info(f"Inserted new genre: '{genre_name}' with ID: {genre_id}")
-                        else:  # Genre already existed, fetch its ID
-                            cursor.execute(
-                                sql.SQL(
-                                    "SELECT genre_id FROM genres WHERE genre_name = %s;"
-                                ),
-                                (genre_name,),
-                            )
-                            result = cursor.fetchone()
-                            if result:
-                                genre_id = result[0]
-                            else:
-                                logger.error(
-                                    f"Could not find or insert genre: '{genre_name}' "
-                                    f"for track ID {track_id}. Skipping this genre link."
-                                )
-                                continue
-
-                        # b. Insert Track-Genre link
-                        try:
-                            cursor.execute(
-                                sql.SQL(
-                                    "INSERT INTO track_genres (track_id, genre_id) VALUES (%s, %s) "
-                                    "ON CONFLICT (track_id, genre_id) DO NOTHING;"
-                                ),
-                                (track_id, genre_id),
-                            )
-                            # if (
-                            #     cursor.rowcount > 0
-                            # ):  # rowcount is 1 if inserted, 0 if conflict and did nothing
-                            #     linked_track_genres += 1
-                        except psycopg2.Error as link_err:
-                            logger.error(
-                                f"Error linking track ID {track_id} "
-                                f"to genre ID {genre_id} ('{genre_name}'): {link_err}"
-                            )
-
-            except psycopg2.Error as db_err:
-                logger.error(
-                    f"Database error processing song "
-                    f"(Track URI: {song_info['Track URI']}): {db_err}"
+                ON CONFLICT (original_track_uri) DO UPDATE SET
+                    track_name = EXCLUDED.track_name,
+                    artist_names = EXCLUDED.artist_names,
+                    album_name = EXCLUDED.album_name,
+                    album_release_date = EXCLUDED.album_release_date,
+                    album_image_url = EXCLUDED.album_image_url,
+                    track_duration_ms = EXCLUDED.track_duration_ms,
+                    explicit = EXCLUDED.explicit,
+                    popularity = EXCLUDED.popularity,
+                    youtube_title = EXCLUDED.youtube_title,
+                    youtube_url = EXCLUDED.youtube_url,
+                    updated_at = CURRENT_TIMESTAMP
+                RETURNING original_track_uri, track_id;
+                """,
+                track_columns,
+            )
+            track_ids = dict(cur.fetchall())
+
+            if links:
+                # Sorted so concurrent loaders take the genre row locks in
+                # the same order
+                cur.execute(
+                    "INSERT INTO genres (genre_name) SELECT unnest(%s::text[]) "
+                    "ON CONFLICT (genre_name) DO NOTHING;",
+                    (genre_names,),
                 )
-                self.conn.rollback()  # Rollback current transaction segment
-                # Decide if you want to continue with the next row or stop
-            except Exception as e:
-                logger.error(
-                    f"General error processing song (Track URI: {song_info['Track URI']}): {e}"
+                uris, genres = (list(column) for column in zip(*links))
+                cur.execute(
+                    """
+                    INSERT INTO track_genres (track_id, genre_id)
+                    SELECT DISTINCT t.track_id, g.genre_id
+                    FROM unnest(%s::text[], %s::text[]) AS l(track_uri, genre_name)
+                    JOIN tracks t ON t.original_track_uri = l.track_uri
+                    JOIN genres g ON g.genre_name = l.genre_name
+                    ON CONFLICT (track_id, genre_id) DO NOTHING;
+                    """,
+                    (uris, genres),
                 )
-                self.conn.rollback()  # Rollback current transaction segment
-
-            self.conn.commit()  # Final commit for any remaining operations
-            logger.info("ETL process completed.")
 
-        return track_id
+        logger.info(
+            f"Loaded {len(track_ids)} tracks and {len(genre_names)} genres "
+            f"({len(links)} track-genre links)"
+        )
+        for track_id in track_ids.values():
+            self.song_info_cache.discard(track_id)
+        return track_ids
 
     def close(self):
-        self.conn.close()
+        # Connections belong to the shared pool and stay open for reuse
+        pass
@@ -1,40 +1,174 @@
-from collections import defaultdict
-from AbstractFingerprintDB import AbstractFingerprintDB
-from typing import List, Tuple, Dict
-from pydub import AudioSegment
+from abracadabra.AbstractFingerprintDB import AbstractFingerprintDB
+from abracadabra.audio import decode_audio, iter_decode_audio
+from abracadabra.fingerprint import Fingerprints, to_fingerprint_arrays
+from typing import Iterator, List, Tuple, Dict
 import numpy as np
+import json
+import os
+import struct
+
+# On-disk index layout (little endian):
+#   header  magic[8] | version u32 | reserved u32 | n_fingerprints u64 | titles_len u64
+#           padded to INDEX_HEADER_SIZE bytes
+#   body    hashes int64[n] | song_ids int32[n] | times int32[n] | titles (JSON, utf-8)
+INDEX_MAGIC = b"ABRAIDX\0"
+INDEX_VERSION = 1
+INDEX_HEADER = struct.Struct("<8sIIQQ")
+INDEX_HEADER_SIZE = 64
 
 
 class InMemoryFingerprintDB(AbstractFingerprintDB):
-    def __init__(self):
-        self.db: Dict[str, List[Tuple[int, float]]] = defaultdict(list)
+    """
+    Inverted index kept as three parallel NumPy arrays (hash, song_id, time)
+    sorted by hash, i.e. 16 bytes per fingerprint. New songs go to an append
+    buffer that is merged into the sorted arrays once it holds
+    `merge_threshold` fingerprints, or before the next lookup.
+    """
+
+    def __init__(self, merge_threshold: int = 1_000_000):
         self.song_ids: Dict[int, str] = {}
+        self.merge_threshold = merge_threshold
+
+        self.hashes = np.empty(0, dtype=np.int64)
+        self.fp_song_ids = np.empty(0, dtype=np.int32)
+        self.times = np.empty(0, dtype=np.int32)
+
+        self._buffer: List[Tuple[np.ndarray, np.ndarray, np.ndarray]] = []
+        self._buffered = 0
+
+    def __len__(self) -> int:
+        return len(self.hashes) + self._buffered
 
-    def add_song(self, song_id: int, title: str, fingerprints: List[dict]) -> None:
+    def add_song(self, song_id: int, title: str, fingerprints: Fingerprints) -> None:
         self.song_ids[song_id] = title
-        for fingerprint in fingerprints:
-            hash_tuple = (
-                fingerprint["hash"]["f1"],
-                fingerprint["hash"]["f2"],
-                fingerprint["hash"]["delta_t"],
+        self.index_generation += 1
+        fps = to_fingerprint_arrays(fingerprints)
+        if len(fps) == 0:
+            return
+
+        self._buffer.append(
+            (
+                fps.hashes,
+                np.full(len(fps), song_id, dtype=np.int32),
+                fps.timestamp.astype(np.int32),
             )
-            self.db[str(hash_tuple)].append((song_id, fingerprint["timestamp"]))
-
-    def get_matches(self, fingerprints: List[dict]) -> List[Tuple[int, float]]:
-        matches: List[Tuple[int, float]] = []
-        for fingerprint in fingerprints:
-            hash_tuple = (
-                fingerprint["hash"]["f1"],
-                fingerprint["hash"]["f2"],
-                fingerprint["hash"]["delta_t"],
+        )
+        self._buffered += len(fps)
+        if self._buffered >= self.merge_threshold:
+            self.merge()
+
+    def merge(self) -> None:
+        """
+        Folds the append buffer into the sorted arrays.
+        """
+        if not self._buffer:
+            return
+        hashes, song_ids, times = zip(*self._buffer)
+        hashes = np.concatenate((self.hashes,) + hashes)
+        order = np.argsort(hashes, kind="stable")
+
+        self.hashes = hashes[order]
+        self.fp_song_ids = np.concatenate((self.fp_song_ids,) + song_ids)[order]
+        self.times = np.concatenate((self.times,) + times)[order]
+        self._buffer = []
+        self._buffered = 0
+
+    def get_match_arrays(
+        self, fingerprints: Fingerprints
+    ) -> Tuple[np.ndarray, np.ndarray]:
+        """
+        Looks up a whole query at once with `searchsorted` and returns parallel
+        (song_ids, offsets) arrays, offset = DB time - query time.
+        """
+        self.merge()
+        fps = to_fingerprint_arrays(fingerprints)
+        query_hashes = fps.hashes
+
+        starts = np.searchsorted(self.hashes, query_hashes, side="left")
+        counts = np.searchsorted(self.hashes, query_hashes, side="right") - starts
+        total = int(counts.sum())
+        if total == 0:
+            return np.empty(0, dtype=np.int32), np.empty(0, dtype=np.int64)
+
+        # Expand each query fingerprint into the index rows of its hash bucket
+        query_idx = np.repeat(np.arange(len(query_hashes)), counts)
+        bucket_starts = np.cumsum(counts) - counts
+        rows = starts[query_idx] + (np.arange(total) - bucket_starts[query_idx])
+
+        offsets = self.times[rows].astype(np.int64) - fps.timestamp[query_idx].astype(
+            np.int64
+        )
+        return self.fp_song_ids[rows], offsets
+
+    def get_matches(self, fingerprints: Fingerprints) -> List[Tuple[int, int]]:
+        song_ids, offsets = self.get_match_arrays(fingerprints)
+        return list(zip(song_ids.tolist(), offsets.tolist()))
+
+    def save(self, path: str) -> None:
+        """
+        Writes the index to `path` in the versioned format above. The file is
+        written next to `path` and renamed, so readers never see a partial
+        index.
+        """
+        self.merge()
+        n = len(self.hashes)
+        titles = json.dumps({str(k): v for k, v in self.song_ids.items()}).encode()
+
+        tmp_path = f"{path}.tmp"
+        with open(tmp_path, "wb") as f:
+            header = INDEX_HEADER.pack(INDEX_MAGIC, INDEX_VERSION, 0, n, len(titles))
+            f.write(header.ljust(INDEX_HEADER_SIZE, b"\0"))
+            f.write(self.hashes.astype("<i8", copy=False).tobytes())
+            f.write(self.fp_song_ids.astype("<i4", copy=False).tobytes())
+            f.write(self.times.astype("<i4", copy=False).tobytes())
+            f.write(titles)
+        os.replace(tmp_path, path)
+
+    @classmethod
+    def load(cls, path: str, mmap: bool = True) -> "InMemoryFingerprintDB":
+        """
+        Opens an index written by `save`. With `mmap`, the arrays are
+        read-only views of the file, so loading is near-instant and processes
+        opening the same file share one copy in the page cache. Songs added
+        afterwards are merged into private in-memory arrays.
+        """
+        with open(path, "rb") as f:
+            magic, version, _, n, titles_len = INDEX_HEADER.unpack(
+                f.read(INDEX_HEADER.size)
             )
-            for song_id, ts in self.db.get(str(hash_tuple), []):
-                matches.append((song_id, ts - fingerprint["timestamp"]))
-        return matches
+            if magic != INDEX_MAGIC:
+                raise ValueError(f"{path} is not a fingerprint index")
+            if version != INDEX_VERSION:
+                raise ValueError(
+                    f"Unsupported fingerprint index version {version} in {path}"
+                )
+            f.seek(INDEX_HEADER_SIZE + 16 * n)
+            titles = json.loads(f.read(titles_len).decode())
+
+        db = cls()
+        db.song_ids = {int(k): v for k, v in titles.items()}
+        if n == 0:
+            return db
+
+        offset = INDEX_HEADER_SIZE
+        arrays = []
+        for dtype in ("<i8", "<i4", "<i4"):
+            if mmap:
+                arrays.append(
+                    np.memmap(path, dtype=dtype, mode="r", offset=offset, shape=(n,))
+                )
+            else:
+                arrays.append(np.fromfile(path, dtype=dtype, count=n, offset=offset))
+            offset += np.dtype(dtype).itemsize * n
+        db.hashes, db.fp_song_ids, db.times = arrays
+        return db
+
+    @staticmethod
+    def load_audio(
+        filename: str, song_id: int = None, sr: int = 22050
+    ) -> Tuple[np.ndarray, int]:
+        return decode_audio(filename, sr=sr), sr
 
     @staticmethod
-    def load_audio(filename: str, sr: int = 22050) -> Tuple[np.ndarray, int]:
-        audio = AudioSegment.from_file(filename)
-        audio = audio.set_channels(1).set_frame_rate(sr)
-        samples = np.array(audio.get_array_of_samples()).astype(np.float32) / 32768.0
-        return samples, sr
+    def stream_audio(filename: str, sr: int = 22050) -> Iterator[np.ndarray]:
+        return iter_decode_audio(filename, sr=sr)
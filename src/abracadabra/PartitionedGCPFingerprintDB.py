@@ -0,0 +1,82 @@
+import os
+import sys
+
+sys.path.insert(
+    0, os.path.abspath(os.path.join(os.path.dirname(__file__), "../../src"))
+)
+from abracadabra.GCPFingerprintDB import GCPFingerprintDB
+from psycopg2 import sql
+
+DEFAULT_PARTITIONS = 16
+
+
+def create_partitioned_schema(
+    cur,
+    n_partitions: int = DEFAULT_PARTITIONS,
+    table: str = "fingerprints_v2",
+    indexed_songs_table: str = "indexed_songs_v2",
+) -> None:
+    """
+    Creates the compact fingerprints schema: integer columns only, hash
+    partitioned on `hash` into `n_partitions` partitions, with a covering
+    (hash) INCLUDE (song_id, t) index so matching is an index-only scan.
+    Also creates its indexed-songs registry, laid out like indexed_songs.
+    """
+    cur.execute(
+        sql.SQL(
+            """
+            CREATE TABLE IF NOT EXISTS {table} (
+                song_id INTEGER NOT NULL REFERENCES tracks(track_id) ON DELETE CASCADE,
+                hash BIGINT NOT NULL,
+                t INTEGER NOT NULL
+            ) PARTITION BY HASH (hash);
+            """
+        ).format(table=sql.Identifier(table))
+    )
+    for remainder in range(n_partitions):
+        cur.execute(
+            sql.SQL(
+                "CREATE TABLE IF NOT EXISTS {partition} PARTITION OF {table} "
+                "FOR VALUES WITH (MODULUS {modulus}, REMAINDER {remainder});"
+            ).format(
+                partition=sql.Identifier(f"{table}_p{remainder}"),
+                table=sql.Identifier(table),
+                modulus=sql.Literal(n_partitions),
+                remainder=sql.Literal(remainder),
+            )
+        )
+    cur.execute(
+        sql.SQL(
+            "CREATE INDEX IF NOT EXISTS {index} ON {table} (hash) INCLUDE (song_id, t);"
+        ).format(index=sql.Identifier(f"idx_{table}_hash"), table=sql.Identifier(table))
+    )
+    cur.execute(
+        sql.SQL("CREATE INDEX IF NOT EXISTS {index} ON {table} (song_id);").format(
+            index=sql.Identifier(f"idx_{table}_song_id"), table=sql.Identifier(table)
+        )
+    )
+    cur.execute(
+        sql.SQL(
+            """
+            CREATE TABLE IF NOT EXISTS {registry} (
+                song_id INTEGER PRIMARY KEY REFERENCES tracks(track_id) ON DELETE CASCADE,
+                fingerprint_count INTEGER NOT NULL,
+                param_version INTEGER NOT NULL,
+                indexed_at TIMESTAMP WITH TIME ZONE DEFAULT CURRENT_TIMESTAMP
+            );
+            """
+        ).format(registry=sql.Identifier(indexed_songs_table))
+    )
+
+
+class PartitionedGCPFingerprintDB(GCPFingerprintDB):
+    """
+    GCPFingerprintDB on the hash-partitioned fingerprints_v2 table created by
+    `create_partitioned_schema` (see utils/migrate_fingerprints_partitioned.py).
+    The table has no unique constraint; writes go through `add_songs`, which
+    replaces a song's fingerprints.
+    """
+
+    fingerprints_table = "fingerprints_v2"
+    time_column = "t"
+    indexed_songs_table = "indexed_songs_v2"
@@ -0,0 +1,171 @@
+import os
+import shutil
+import subprocess
+import tempfile
+import threading
+import numpy as np
+from io import BytesIO
+from typing import Dict, Iterable, Iterator, Union
+
+FFMPEG_BINARY = os.getenv("FFMPEG_BINARY", "ffmpeg")
+
+# Initial buffer size when the decoded length is unknown; doubled as needed
+_INITIAL_SECONDS = 60
+
+AudioSource = Union[str, bytes, BytesIO]
+# A path or URL, a binary file-like object or an iterable of byte chunks
+StreamSource = Union[str, BytesIO, Iterable[bytes]]
+
+
+def decode_audio(
+    source: AudioSource, sr: int = 22050, max_duration: float = None
+) -> np.ndarray:
+    """
+    Decodes `source` (a path, raw bytes or a file-like upload) to mono float32
+    samples at `sr` Hz, full scale being 1.0.
+
+    ffmpeg does the decoding, downmixing and resampling and writes raw f32le
+    straight into a preallocated NumPy buffer, so no intermediate copies are
+    made. Decoding stops after `max_duration` seconds when given.
+    """
+    if isinstance(source, (bytes, bytearray)):
+        source = BytesIO(source)
+
+    if hasattr(source, "read"):
+        # MP4/M4A uploads often keep their index at the end of the file, which
+        # ffmpeg cannot seek to on a pipe, so spill them to a temporary file.
+        with tempfile.NamedTemporaryFile() as tmp:
+            tmp.write(source.read())
+            tmp.flush()
+            return _decode_file(tmp.name, sr, max_duration)
+
+    return _decode_file(source, sr, max_duration)
+
+
+def _decode_file(path: str, sr: int, max_duration: float = None) -> np.ndarray:
+    cmd = [FFMPEG_BINARY, "-nostdin", "-v", "error", "-i", path]
+    if max_duration is not None:
+        cmd += ["-t", str(max_duration)]
+    cmd += ["-f", "f32le", "-ac", "1", "-ar", str(sr), "pipe:1"]
+
+    if max_duration is not None:
+        capacity = int(np.ceil(max_duration * sr)) + 1
+    else:
+        capacity = _INITIAL_SECONDS * sr
+    buffer = np.empty(capacity, dtype=np.float32)
+    filled = 0  # bytes
+
+    proc = subprocess.Popen(cmd, stdout=subprocess.PIPE, stderr=subprocess.PIPE)
+    try:
+        view = memoryview(buffer).cast("B")
+        while True:
+            if filled == len(view):
+                buffer = np.concatenate((buffer, np.empty_like(buffer)))
+                view = memoryview(buffer).cast("B")
+            n_read = proc.stdout.readinto(view[filled:])
+            if not n_read:
+                break
+            filled += n_read
+        stderr = proc.stderr.read()
+    finally:
+        proc.stdout.close()
+        proc.stderr.close()
+        proc.wait()
+
+    if proc.returncode != 0:
+        raise RuntimeError(
+            f"ffmpeg failed to decode {path}: {stderr.decode(errors='replace').strip()}"
+        )
+    n_samples = filled // buffer.itemsize
+    return buffer[:n_samples]
+
+
+def _feed_stdin(stdin, source) -> None:
+    try:
+        if hasattr(source, "read"):
+            shutil.copyfileobj(source, stdin)
+        else:
+            for chunk in source:
+                stdin.write(chunk)
+    except (BrokenPipeError, ValueError):
+        pass  # ffmpeg exited early or the decode was abandoned
+    finally:
+        try:
+            stdin.close()
+        except BrokenPipeError:
+            pass
+
+
+def iter_decode_audio(
+    source: StreamSource,
+    sr: int = 22050,
+    chunk_seconds: float = 5.0,
+    http_headers: Dict[str, str] = None,
+) -> Iterator[np.ndarray]:
+    """
+    Streaming `decode_audio`: yields mono float32 chunks of `chunk_seconds`
+    at `sr` Hz while ffmpeg is still reading `source`, without temporary files.
+
+    A path or http(s) URL is opened by ffmpeg itself, which lets it use range
+    requests on MP4s whose index is at the end; `http_headers` are sent with
+    the request. File-like objects and iterables of bytes (e.g. an HTTP
+    response body) are piped to ffmpeg's stdin, which needs a streamable
+    container (fragmented MP4/M4A, WebM, MP3, ...).
+    """
+    cmd = [FFMPEG_BINARY, "-nostdin", "-v", "error"]
+    if isinstance(source, str):
+        if http_headers and source.startswith(("http://", "https://")):
+            headers = "".join(
+                f"{key}: {value}\r\n" for key, value in http_headers.items()
+            )
+            cmd += ["-headers", headers]
+        cmd += ["-i", source]
+        stdin = subprocess.DEVNULL
+    else:
+        cmd += ["-i", "pipe:0"]
+        stdin = subprocess.PIPE
+    cmd += ["-f", "f32le", "-ac", "1", "-ar", str(sr), "pipe:1"]
+
+    chunk_bytes = max(1, int(chunk_seconds * sr)) * 4
+    proc = subprocess.Popen(
+        cmd, stdin=stdin, stdout=subprocess.PIPE, stderr=subprocess.PIPE
+    )
+    feeder = None
+    if stdin is subprocess.PIPE:
+        feeder = threading.Thread(
+            target=_feed_stdin, args=(proc.stdin, source), daemon=True
+        )
+        feeder.start()
+    # stderr is drained concurrently so ffmpeg never blocks on a full pipe
+    errors = []
+    drain = threading.Thread(
+        target=lambda: errors.append(proc.stderr.read()), daemon=True
+    )
+    drain.start()
+
+    finished = False
+    try:
+        pending = b""
+        while True:
+            data = proc.stdout.read(chunk_bytes)
+            if not data:
+                break
+            data = pending + data
+            usable = len(data) - len(data) % 4
+            pending = data[usable:]
+            if usable:
+                yield np.frombuffer(data[:usable], dtype="<f4").astype(np.float32)
+        finished = True
+    finally:
+        if not finished:
+            proc.kill()  # the consumer stopped early
+        proc.stdout.close()
+        proc.wait()
+        drain.join()
+        proc.stderr.close()
+        if feeder is not None:
+            feeder.join()
+
+    if proc.returncode != 0:
+        message = errors[0].decode(errors="replace").strip() if errors else ""
+        raise RuntimeError(f"ffmpeg failed to decode the stream: {message}")
@@ -0,0 +1,233 @@
+import hashlib
+import json
+import os
+import re
+import tempfile
+import threading
+import time
+import logging
+from typing import Optional, Tuple
+
+import numpy as np
+import soundfile as sf
+
+from abracadabra.fingerprint import FingerprintArrays
+
+logger = logging.getLogger(__name__)
+
+_YOUTUBE_ID = re.compile(r"(?:[?&]v=|youtu\.be/|/shorts/)([\w-]{11})")
+
+
+def source_key(source: str) -> str:
+    """
+    Cache key of an audio source: the video id of a YouTube URL, otherwise
+    a hash of the URL or path.
+    """
+    match = _YOUTUBE_ID.search(source)
+    if match:
+        return f"yt-{match.group(1)}"
+    return "src-" + hashlib.sha1(source.encode()).hexdigest()
+
+
+def audio_hash(audio: np.ndarray) -> str:
+    return hashlib.sha256(np.ascontiguousarray(audio, dtype=np.float32)).hexdigest()
+
+
+class AudioCache:
+    """
+    Size-capped LRU disk cache for re-indexing, in three content-addressed
+    parts under `root`:
+
+        sources/<source key>.json                 audio hash and sample rate
+        audio/<audio hash>.flac                   decoded audio
+        fingerprints/<audio hash>-v<version>.npz  peaks and fingerprints
+
+    so a source is downloaded and decoded once, and only fingerprinted again
+    when the fingerprint parameter version changes. Audio is stored as 24-bit
+    FLAC, scaled to its peak so decoder overshoot beyond +-1 is not clipped.
+
+    Files are written atomically (temporary file and rename) and touched on
+    every hit; once the cache exceeds `max_bytes`, the least recently used
+    files are deleted until it is back under `low_water` of it. Writes only
+    update a running size estimate; the directories are scanned when it
+    crosses the limit, or every `rescan_interval` seconds to count files
+    written by other processes. Instances only hold paths and counters (and
+    the lock guarding them, recreated on unpickling), so they can be shared
+    between threads and passed to worker processes, which share the cache
+    through the filesystem.
+    """
+
+    low_water = 0.9
+    rescan_interval = 300.0
+
+    def __init__(self, root: str, max_bytes: int = 10 * 1024**3):
+        self.root = root
+        self.max_bytes = max_bytes
+        for part in ("sources", "audio", "fingerprints"):
+            os.makedirs(os.path.join(root, part), exist_ok=True)
+        self._lock = threading.Lock()
+        self._size = self.size()
+        self._scanned = time.monotonic()
+
+    def __getstate__(self) -> dict:
+        state = self.__dict__.copy()
+        del state["_lock"]
+        return state
+
+    def __setstate__(self, state: dict) -> None:
+        self.__dict__.update(state)
+        self._lock = threading.Lock()
+
+    def _path(self, part: str, name: str) -> str:
+        return os.path.join(self.root, part, name)
+
+    @staticmethod
+    def _touch(path: str) -> bool:
+        try:
+            os.utime(path)
+            return True
+        except FileNotFoundError:
+            return False
+
+    def _write(self, path: str, write) -> None:
+        try:
+            replaced = os.path.getsize(path)
+        except FileNotFoundError:
+            replaced = 0
+        # A temporary file of its own per write, as threads and processes may
+        # write the same key at once
+        f = tempfile.NamedTemporaryFile(
+            dir=os.path.dirname(path),
+            prefix=f"{os.path.basename(path)}.",
+            suffix=".tmp",
+            delete=False,
+        )
+        tmp_path = f.name
+        try:
+            with f:
+                write(f)
+            written = os.path.getsize(tmp_path)
+            os.replace(tmp_path, path)
+        finally:
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+
+        with self._lock:
+            self._size += written - replaced
+            stale = time.monotonic() - self._scanned > self.rescan_interval
+            over = self._size > self.max_bytes
+        if over or stale:
+            self.evict()
+
+    # --- Audio ---
+
+    def get_audio(self, source: str, sr: int = 22050) -> Optional[np.ndarray]:
+        try:
+            with open(self._path("sources", f"{source_key(source)}.json")) as f:
+                entry = json.load(f)
+            if entry["sr"] != sr:
+                return None
+            path = self._path("audio", f"{entry['audio_hash']}.flac")
+            samples, _ = sf.read(path, dtype="float32")
+        except (FileNotFoundError, KeyError, ValueError, RuntimeError):
+            return None
+        self._touch(path)
+        self._touch(self._path("sources", f"{source_key(source)}.json"))
+        return samples * np.float32(entry["gain"])
+
+    def put_audio(self, source: str, audio: np.ndarray, sr: int = 22050) -> str:
+        """
+        Stores decoded `audio` of `source`, returning its audio hash.
+        """
+        digest = audio_hash(audio)
+        gain = float(np.abs(audio).max()) if len(audio) else 0.0
+        path = self._path("audio", f"{digest}.flac")
+        if not self._touch(path):
+            scaled = audio / np.float32(gain) if gain > 0 else audio
+            self._write(
+                path,
+                lambda f: sf.write(f, scaled, sr, format="FLAC", subtype="PCM_24"),
+            )
+        entry = {"audio_hash": digest, "sr": sr, "gain": gain}
+        self._write(
+            self._path("sources", f"{source_key(source)}.json"),
+            lambda f: f.write(json.dumps(entry).encode()),
+        )
+        return digest
+
+    def get_audio_hash(self, source: str, sr: int = 22050) -> Optional[str]:
+        try:
+            with open(self._path("sources", f"{source_key(source)}.json")) as f:
+                entry = json.load(f)
+        except (FileNotFoundError, ValueError):
+            return None
+        return entry.get("audio_hash") if entry.get("sr") == sr else None
+
+    # --- Peaks and fingerprints ---
+
+    def get_fingerprints(
+        self, digest: str, version: int
+    ) -> Optional[Tuple[np.ndarray, FingerprintArrays]]:
+        path = self._path("fingerprints", f"{digest}-v{version}.npz")
+        try:
+            with np.load(path) as data:
+                peaks = data["peaks"]
+                fps = FingerprintArrays(
+                    *(data[name] for name in FingerprintArrays._fields)
+                )
+        except (FileNotFoundError, KeyError, ValueError):
+            return None
+        self._touch(path)
+        return peaks, fps
+
+    def put_fingerprints(
+        self, digest: str, version: int, peaks: np.ndarray, fps: FingerprintArrays
+    ) -> None:
+        self._write(
+            self._path("fingerprints", f"{digest}-v{version}.npz"),
+            lambda f: np.savez_compressed(f, peaks=peaks, **fps._asdict()),
+        )
+
+    # --- Size limit ---
+
+    def size(self) -> int:
+        return sum(size for _, _, size in self._files())
+
+    def _files(self):
+        for part in ("sources", "audio", "fingerprints"):
+            with os.scandir(os.path.join(self.root, part)) as entries:
+                for entry in entries:
+                    if entry.name.endswith(".tmp"):
+                        continue
+                    try:
+                        stat = entry.stat()
+                    except FileNotFoundError:
+                        continue  # Evicted by another process
+                    yield stat.st_mtime, entry.path, stat.st_size
+
+    def evict(self) -> int:
+        """
+        Rescans the cache and, if it exceeds `max_bytes`, deletes least
+        recently used files until it fits in `low_water` of it. Returns the
+        number of bytes freed.
+        """
+        files = sorted(self._files())
+        total = sum(size for _, _, size in files)
+        excess = (
+            total - self.max_bytes * self.low_water if total > self.max_bytes else 0
+        )
+        freed = 0
+        for _, path, size in files:
+            if freed >= excess:
+                break
+            try:
+                os.remove(path)
+                freed += size
+            except FileNotFoundError:
+                pass
+        with self._lock:
+            self._size = total - freed
+            self._scanned = time.monotonic()
+        if freed:
+            logger.info(f"Evicted {freed / 1e6:.1f} MB from the audio cache")
+        return freed
@@ -0,0 +1,138 @@
+import math
+import os
+import struct
+
+import numpy as np
+
+# On-disk layout (little endian):
+#   header  magic[8] | version u32 | n_hashes u32 | n_bits u64 | n_added u64
+#           padded to BLOOM_HEADER_SIZE bytes, followed by the bit array (uint64 words)
+BLOOM_MAGIC = b"ABRABLM\0"
+BLOOM_VERSION = 1
+BLOOM_HEADER = struct.Struct("<8sIIQQ")
+BLOOM_HEADER_SIZE = 64
+
+_GOLDEN = np.uint64(0x9E3779B97F4A7C15)
+# Number of set bits of every byte value
+_POPCOUNT8 = np.array([bin(i).count("1") for i in range(256)], dtype=np.uint8)
+
+
+def mix64(x: np.ndarray) -> np.ndarray:
+    """
+    splitmix64 finalizer: spreads packed fingerprint hashes, which have long
+    runs of zero bits, over all 64 bits.
+    """
+    x = x ^ (x >> np.uint64(30))
+    x = x * np.uint64(0xBF58476D1CE4E5B9)
+    x = x ^ (x >> np.uint64(27))
+    x = x * np.uint64(0x94D049BB133111EB)
+    return x ^ (x >> np.uint64(31))
+
+
+class BloomFilter:
+    """
+    Bloom filter over int64 keys, vectorized with NumPy. `might_contain` has
+    no false negatives; false positives occur at about the rate the filter
+    was sized for until more than its capacity has been added; since adding
+    a key twice sets no new bits, `false_positive_rate` measures it from the
+    bits that are set rather than from `n_added`, which counts repeats.
+
+    The bit array has a power-of-two size and bit positions come from double
+    hashing, h1 + i * h2, of two splitmix64 mixes of the key.
+    """
+
+    def __init__(self, n_bits: int, n_hashes: int):
+        if n_bits < 64 or n_bits & (n_bits - 1):
+            raise ValueError(f"n_bits must be a power of two >= 64, got {n_bits}")
+        self.n_bits = n_bits
+        self.n_hashes = n_hashes
+        self.n_added = 0
+        self.words = np.zeros(n_bits // 64, dtype=np.uint64)
+
+    @classmethod
+    def for_capacity(cls, capacity: int, error_rate: float = 0.01) -> "BloomFilter":
+        """
+        Sizes a filter for `capacity` keys at a false-positive rate of at most
+        `error_rate`.
+        """
+        capacity = max(int(capacity), 1)
+        n_bits = -capacity * math.log(error_rate) / math.log(2) ** 2
+        n_bits = max(64, 1 << math.ceil(math.log2(n_bits)))
+        n_hashes = max(1, round(n_bits / capacity * math.log(2)))
+        return cls(n_bits, min(n_hashes, 16))
+
+    def __len__(self) -> int:
+        return self.n_added
+
+    @property
+    def nbytes(self) -> int:
+        return self.words.nbytes
+
+    def count_set_bits(self, chunk_bytes: int = 1 << 24) -> int:
+        view = self.words.view(np.uint8)
+        n_set = 0
+        for start in range(0, len(view), chunk_bytes):
+            stop = start + chunk_bytes
+            n_set += int(_POPCOUNT8[view[start:stop]].sum(dtype=np.int64))
+        return n_set
+
+    def false_positive_rate(self) -> float:
+        """
+        Probability that a key never added passes `might_contain`.
+        """
+        return (self.count_set_bits() / self.n_bits) ** self.n_hashes
+
+    def _positions(self, keys) -> np.ndarray:
+        keys = np.asarray(keys, dtype=np.int64).astype(np.uint64).reshape(-1)
+        h1 = mix64(keys)
+        h2 = mix64(keys ^ _GOLDEN) | np.uint64(1)
+        i = np.arange(self.n_hashes, dtype=np.uint64)[:, None]
+        return (h1[None, :] + i * h2[None, :]) & np.uint64(self.n_bits - 1)
+
+    def add(self, keys) -> None:
+        positions = self._positions(keys).reshape(-1)
+        bits = np.left_shift(np.uint64(1), positions & np.uint64(63))
+        # ufunc.at, as plain fancy-index assignment drops repeated words
+        np.bitwise_or.at(self.words, positions >> np.uint64(6), bits)
+        self.n_added += len(np.atleast_1d(keys))
+
+    def might_contain(self, keys) -> np.ndarray:
+        """
+        Boolean array: False where the key was certainly never added.
+        """
+        positions = self._positions(keys)
+        bits = np.left_shift(np.uint64(1), positions & np.uint64(63))
+        hit = (self.words[positions >> np.uint64(6)] & bits) != 0
+        return hit.all(axis=0)
+
+    def save(self, path: str) -> None:
+        """
+        Writes the filter to `path` via a temporary file and a rename, so
+        readers never see a partial file.
+        """
+        tmp_path = f"{path}.tmp"
+        with open(tmp_path, "wb") as f:
+            header = BLOOM_HEADER.pack(
+                BLOOM_MAGIC, BLOOM_VERSION, self.n_hashes, self.n_bits, self.n_added
+            )
+            f.write(header.ljust(BLOOM_HEADER_SIZE, b"\0"))
+            f.write(self.words.astype("<u8", copy=False).tobytes())
+        os.replace(tmp_path, path)
+
+    @classmethod
+    def load(cls, path: str) -> "BloomFilter":
+        with open(path, "rb") as f:
+            magic, version, n_hashes, n_bits, n_added = BLOOM_HEADER.unpack(
+                f.read(BLOOM_HEADER.size)
+            )
+        if magic != BLOOM_MAGIC:
+            raise ValueError(f"{path} is not a Bloom filter")
+        if version != BLOOM_VERSION:
+            raise ValueError(f"Unsupported Bloom filter version {version} in {path}")
+
+        bloom = cls(n_bits, n_hashes)
+        bloom.words = np.fromfile(
+            path, dtype="<u8", count=n_bits // 64, offset=BLOOM_HEADER_SIZE
+        ).astype(np.uint64, copy=False)
+        bloom.n_added = n_added
+        return bloom
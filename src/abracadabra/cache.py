@@ -0,0 +1,203 @@
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Hashable, List, Optional
+
+import numpy as np
+
+from abracadabra.bloom import mix64
+
+# Per-permutation seeds of the MinHash signature
+_MINHASH_SEEDS = (
+    np.random.default_rng(0x4D494E48)
+    .integers(0, 2**63, size=256, dtype=np.int64)
+    .astype(np.uint64)
+)
+
+
+class _BoundedCache:
+    """
+    Shared state of the caches below: LRU-ordered entries, a lock and the
+    hit/miss counters.
+    """
+
+    def __init__(self, maxsize: int, ttl: float):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self.hits = 0
+        self.misses = 0
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def stats(self) -> dict:
+        lookups = self.hits + self.misses
+        return {
+            "size": len(self._entries),
+            "maxsize": self.maxsize,
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": self.hits / lookups if lookups else 0.0,
+        }
+
+
+class TTLCache(_BoundedCache):
+    """
+    Thread-safe LRU cache of at most `maxsize` entries, each expiring `ttl`
+    seconds after it was stored, with hit/miss counters.
+    """
+
+    def __init__(self, maxsize: int = 1024, ttl: float = 600.0):
+        super().__init__(maxsize, ttl)  # entries: key -> (value, expires_at)
+
+    def get(self, key: Hashable, default: Any = None) -> Any:
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and entry[1] > time.monotonic():
+                self._entries.move_to_end(key)
+                self.hits += 1
+                return entry[0]
+            if entry is not None:
+                del self._entries[key]
+            self.misses += 1
+            return default
+
+    def put(self, key: Hashable, value: Any) -> None:
+        with self._lock:
+            self._entries[key] = (value, time.monotonic() + self.ttl)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.maxsize:
+                self._entries.popitem(last=False)
+
+    def discard(self, key: Hashable) -> None:
+        with self._lock:
+            self._entries.pop(key, None)
+
+    def clear(self) -> None:
+        with self._lock:
+            self._entries.clear()
+
+
+def minhash_signature(hashes, num_perm: int = 64) -> Optional[np.ndarray]:
+    """
+    MinHash of the set of packed fingerprint hashes: the fraction of equal
+    positions in two signatures estimates the Jaccard similarity of the sets.
+    Returns None for an empty set.
+    """
+    keys = np.unique(np.asarray(hashes, dtype=np.int64)).astype(np.uint64)
+    if len(keys) == 0:
+        return None
+    seeds = _MINHASH_SEEDS[:num_perm]
+    return mix64(keys[None, :] ^ seeds[:, None]).min(axis=1)
+
+
+class RecognitionCache(_BoundedCache):
+    """
+    Cache of ranked recognition results for near-duplicate queries.
+
+    Entries are keyed by the MinHash signature of a query's fingerprint
+    hashes and found through LSH: the signature is split into `bands` bands,
+    any entry sharing a band with the query is a candidate, and the best
+    candidate whose estimated Jaccard similarity reaches `min_similarity`
+    is a hit.
+
+    Results are only valid for the index they were ranked against: entries
+    store the `generation` (the database's `index_generation`) passed with
+    them and are skipped by lookups of another generation, so a song written
+    through the same database object invalidates them at once. Songs indexed
+    by other processes only do so once the database notices them (the hash
+    filter sync of GCPFingerprintDB does), otherwise when the entries expire,
+    so a cached result may be up to `ttl` seconds stale.
+    """
+
+    def __init__(
+        self,
+        maxsize: int = 1024,
+        ttl: float = 3600.0,
+        num_perm: int = 64,
+        bands: int = 32,
+        min_similarity: float = 0.4,
+    ):
+        if num_perm % bands:
+            raise ValueError("num_perm must be a multiple of bands")
+        super().__init__(
+            maxsize, ttl
+        )  # entries: key -> (signature, result, expires_at, generation)
+        self.num_perm = num_perm
+        self.bands = bands
+        self.min_similarity = min_similarity
+        self._buckets = {}  # (band, band bytes) -> set of entry keys
+
+    def signature(self, hashes) -> Optional[np.ndarray]:
+        return minhash_signature(hashes, self.num_perm)
+
+    def _band_keys(self, signature: np.ndarray) -> List[tuple]:
+        return [
+            (band, rows.tobytes())
+            for band, rows in enumerate(np.split(signature, self.bands))
+        ]
+
+    def lookup(self, signature: Optional[np.ndarray], generation: int = 0) -> Any:
+        """
+        Returns the cached result of the most similar query stored with
+        `generation`, or None.
+        """
+        if signature is None:
+            return None
+        with self._lock:
+            now = time.monotonic()
+            candidates = set()
+            for band_key in self._band_keys(signature):
+                candidates |= self._buckets.get(band_key, set())
+
+            best_key, best_similarity = None, self.min_similarity
+            for key in candidates:
+                stored, _, expires_at, stored_generation = self._entries[key]
+                if expires_at <= now or stored_generation != generation:
+                    continue
+                similarity = float(np.mean(stored == signature))
+                if similarity >= best_similarity:
+                    best_key, best_similarity = key, similarity
+
+            if best_key is None:
+                self.misses += 1
+                return None
+            self._entries.move_to_end(best_key)
+            self.hits += 1
+            return self._entries[best_key][1]
+
+    def store(
+        self, signature: Optional[np.ndarray], result: Any, generation: int = 0
+    ) -> None:
+        if signature is None:
+            return
+        key = signature.tobytes()
+        with self._lock:
+            if key in self._entries:
+                self._drop(key)
+            self._entries[key] = (
+                signature,
+                result,
+                time.monotonic() + self.ttl,
+                generation,
+            )
+            for band_key in self._band_keys(signature):
+                self._buckets.setdefault(band_key, set()).add(key)
+            while len(self._entries) > self.maxsize:
+                self._drop(next(iter(self._entries)))
+
+    def _drop(self, key: bytes) -> None:
+        signature = self._entries.pop(key)[0]
+        for band_key in self._band_keys(signature):
+            bucket = self._buckets.get(band_key)
+            if bucket is not None:
+                bucket.discard(key)
+                if not bucket:
+                    del self._buckets[band_key]
+
+    def clear(self) -> None:
+        with self._lock:
+            self._entries.clear()
+            self._buckets.clear()
@@ -0,0 +1,94 @@
+import os
+import threading
+import time
+import logging
+from typing import Any, Callable
+
+from google.cloud import secretmanager
+
+logger = logging.getLogger(__name__)
+
+PROJECT_ID = "cloud-computing-project-458205"
+
+# Seconds before a cached secret or client is fetched/built again
+SECRET_TTL = float(os.getenv("SECRET_CACHE_TTL", "3600"))
+CLIENT_TTL = float(os.getenv("CLIENT_CACHE_TTL", "3600"))
+
+_entries = {}  # key -> (value, expires_at)
+_locks = {}  # key -> lock held while (re)creating the value
+_registry_lock = threading.Lock()
+_thread_local = threading.local()
+
+
+def _key_lock(key) -> threading.Lock:
+    with _registry_lock:
+        return _locks.setdefault(key, threading.Lock())
+
+
+def _refresh(entries: dict, key, factory: Callable[[], Any], ttl: float) -> Any:
+    entry = entries.get(key)
+    if entry is not None and entry[1] > time.monotonic():
+        return entry[0]
+    try:
+        value = factory()
+    except Exception as e:
+        if entry is None:
+            raise
+        # Keep serving the expired value rather than failing every request
+        logger.warning(f"Refreshing {key} failed, reusing cached value: {e}")
+        value = entry[0]
+    entries[key] = (value, time.monotonic() + ttl)
+    return value
+
+
+def _get_or_create(key, factory: Callable[[], Any], ttl: float) -> Any:
+    entry = _entries.get(key)
+    if entry is not None and entry[1] > time.monotonic():
+        return entry[0]
+    # One thread (re)creates the value; the others wait and reuse it
+    with _key_lock(key):
+        return _refresh(_entries, key, factory, ttl)
+
+
+def get_client(
+    name: str, factory: Callable[[], Any], ttl: float = None, per_thread: bool = False
+) -> Any:
+    """
+    Returns the process-wide client registered under `name`, creating it with
+    `factory()` on first use and again once it is `ttl` seconds old (default
+    CLIENT_TTL). Clients that are not thread-safe are kept `per_thread`.
+    """
+    ttl = CLIENT_TTL if ttl is None else ttl
+    if per_thread:
+        if not hasattr(_thread_local, "entries"):
+            _thread_local.entries = {}
+        return _refresh(_thread_local.entries, ("client", name), factory, ttl)
+    return _get_or_create(("client", name), factory, ttl)
+
+
+def get_secret(secret_id: str, project_id: str = PROJECT_ID, ttl: float = None) -> str:
+    """
+    Latest version of a Secret Manager secret, cached for `ttl` seconds
+    (default SECRET_TTL) and fetched through one shared client. Surrounding
+    whitespace (e.g. a trailing newline) is stripped here, so every caller
+    sees the same value; connection pools are keyed by it.
+    """
+
+    def fetch():
+        client = get_client("secretmanager", secretmanager.SecretManagerServiceClient)
+        name = f"projects/{project_id}/secrets/{secret_id}/versions/latest"
+        response = client.access_secret_version(request={"name": name})
+        return response.payload.data.decode("utf-8").strip()
+
+    key = ("secret", project_id, secret_id)
+    return _get_or_create(key, fetch, SECRET_TTL if ttl is None else ttl)
+
+
+def invalidate(name: str) -> None:
+    """
+    Drops a cached client (e.g. after its credentials were rejected) so the
+    next `get_client` builds a new one. Per-thread clients are only dropped
+    for the calling thread.
+    """
+    _entries.pop(("client", name), None)
+    getattr(_thread_local, "entries", {}).pop(("client", name), None)
@@ -6,14 +6,62 @@ sys.path.insert(
 )
 
 
-def create_fingerprint_db(db_type: str = "memory"):
+def create_fingerprint_db(
+    db_type: str = "memory",
+    index_path: str = None,
+    hash_filter_path: str = None,
+    streaming_ingest: bool = None,
+    audio_cache_dir: str = None,
+    pool=None,
+    hash_filter: bool = None,
+):
+    db = _create_fingerprint_db(
+        db_type, index_path, hash_filter_path, pool, hash_filter
+    )
+    if streaming_ingest is None:
+        streaming_ingest = os.getenv("STREAMING_INGEST", "0") == "1"
+    db.streaming_ingest = streaming_ingest
+
+    # Keep downloaded audio and fingerprints on disk for re-indexing
+    audio_cache_dir = audio_cache_dir or os.getenv("AUDIO_CACHE_DIR")
+    if audio_cache_dir:
+        from abracadabra.audio_cache import AudioCache
+
+        db.audio_cache = AudioCache(
+            audio_cache_dir,
+            max_bytes=int(os.getenv("AUDIO_CACHE_MAX_BYTES", str(10 * 1024**3))),
+        )
+    return db
+
+
+def _create_fingerprint_db(
+    db_type: str, index_path: str, hash_filter_path: str, pool=None, hash_filter=None
+):
     if db_type == "memory":
         from abracadabra.InMemoryFingerprintDB import InMemoryFingerprintDB
 
+        # Reuse a saved index (memory-mapped) instead of re-fingerprinting
+        index_path = index_path or os.getenv("FINGERPRINT_INDEX_PATH")
+        if index_path and os.path.exists(index_path):
+            return InMemoryFingerprintDB.load(index_path)
         return InMemoryFingerprintDB()
-    elif db_type == "gcp":
-        from abracadabra.GCPFingerprintDB import GCPFingerprintDB
+    elif db_type in ("gcp", "gcp_partitioned"):
+        if db_type == "gcp":
+            from abracadabra.GCPFingerprintDB import GCPFingerprintDB as DB
+        else:
+            from abracadabra.PartitionedGCPFingerprintDB import (
+                PartitionedGCPFingerprintDB as DB,
+            )
+        # An explicit connection pool skips the Secret Manager credentials
+        db = DB(pool=pool)
 
-        return GCPFingerprintDB()
+        # Prefilter query hashes with an in-memory Bloom filter, also
+        # persisted at the path when one is set. Indexing-only processes,
+        # which never match, turn it off.
+        if hash_filter is None:
+            hash_filter = os.getenv("HASH_FILTER", "1") == "1"
+        if hash_filter:
+            db.enable_hash_filter(hash_filter_path or os.getenv("HASH_FILTER_PATH"))
+        return db
     else:
         raise ValueError(f"Unsupported DB type: {db_type}")
@@ -0,0 +1,149 @@
+import os
+import threading
+import time
+import logging
+from contextlib import contextmanager
+
+import psycopg2
+from psycopg2 import extensions
+from psycopg2.pool import PoolError
+
+logger = logging.getLogger(__name__)
+
+
+class ConnectionPool:
+    """
+    Thread-safe psycopg2 connection pool.
+
+    Up to `maxconn` connections are open at once; `getconn` blocks for up to
+    `checkout_timeout` seconds when all of them are checked out. Connections
+    idle for longer than `health_check_interval` seconds are pinged with
+    `SELECT 1` before being handed out, and broken ones are replaced.
+    """
+
+    def __init__(
+        self,
+        minconn: int = 1,
+        maxconn: int = 10,
+        checkout_timeout: float = 30.0,
+        health_check_interval: float = 30.0,
+        **connect_kwargs,
+    ):
+        if minconn < 0 or maxconn < 1 or minconn > maxconn:
+            raise ValueError(f"Invalid pool size: minconn={minconn}, maxconn={maxconn}")
+        self.minconn = minconn
+        self.maxconn = maxconn
+        self.checkout_timeout = checkout_timeout
+        self.health_check_interval = health_check_interval
+        self.connect_kwargs = connect_kwargs
+
+        self._lock = threading.Lock()
+        self._slots = threading.BoundedSemaphore(maxconn)
+        self._idle = []  # (connection, last_used) pairs, most recent last
+        self._closed = False
+
+        for _ in range(minconn):
+            self._idle.append((self._connect(), time.monotonic()))
+
+    def _connect(self):
+        return psycopg2.connect(**self.connect_kwargs)
+
+    def _is_healthy(self, conn, last_used: float) -> bool:
+        if conn.closed:
+            return False
+        if time.monotonic() - last_used < self.health_check_interval:
+            return True
+        try:
+            with conn.cursor() as cur:
+                cur.execute("SELECT 1;")
+            conn.rollback()
+            return True
+        except psycopg2.Error:
+            return False
+
+    def getconn(self, autocommit: bool = False):
+        if self._closed:
+            raise PoolError("connection pool is closed")
+        if not self._slots.acquire(timeout=self.checkout_timeout):
+            raise PoolError(f"no connection available within {self.checkout_timeout}s")
+        try:
+            conn = None
+            while conn is None:
+                with self._lock:
+                    idle = self._idle.pop() if self._idle else None
+                if idle is None:
+                    conn = self._connect()
+                elif self._is_healthy(*idle):
+                    conn = idle[0]
+                else:
+                    logger.warning("Discarding broken database connection")
+                    idle[0].close()
+            conn.autocommit = autocommit
+            return conn
+        except Exception:
+            self._slots.release()
+            raise
+
+    def putconn(self, conn, close: bool = False) -> None:
+        try:
+            if not conn.closed and not close:
+                if conn.info.transaction_status != extensions.TRANSACTION_STATUS_IDLE:
+                    conn.rollback()
+                conn.autocommit = False
+            with self._lock:
+                if conn.closed or close or self._closed:
+                    conn.close()
+                else:
+                    self._idle.append((conn, time.monotonic()))
+        except psycopg2.Error:
+            conn.close()
+        finally:
+            self._slots.release()
+
+    @contextmanager
+    def connection(self, autocommit: bool = False):
+        """
+        Checks out a connection for the duration of the block. Outside
+        autocommit mode the transaction is committed on success and rolled
+        back on error.
+        """
+        conn = self.getconn(autocommit=autocommit)
+        try:
+            yield conn
+            if not autocommit and not conn.closed:
+                conn.commit()
+        except Exception:
+            if not conn.closed:
+                conn.rollback()
+            raise
+        finally:
+            self.putconn(conn)
+
+    def closeall(self) -> None:
+        with self._lock:
+            self._closed = True
+            for conn, _ in self._idle:
+                conn.close()
+            self._idle = []
+
+
+_pools = {}
+_pools_lock = threading.Lock()
+
+
+def get_connection_pool(**connect_kwargs) -> ConnectionPool:
+    """
+    Returns the process-wide pool for these connection parameters, creating
+    it on first use. Size limits come from DB_POOL_MIN_SIZE / DB_POOL_MAX_SIZE.
+    """
+    key = tuple(sorted(connect_kwargs.items()))
+    with _pools_lock:
+        pool = _pools.get(key)
+        if pool is None:
+            pool = ConnectionPool(
+                minconn=int(os.getenv("DB_POOL_MIN_SIZE", "1")),
+                maxconn=int(os.getenv("DB_POOL_MAX_SIZE", "10")),
+                **connect_kwargs,
+            )
+            _pools[key] = pool
+        return pool
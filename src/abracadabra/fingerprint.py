@@ -1,7 +1,16 @@
 import numpy as np
 import librosa
 import scipy.ndimage
-from typing import TypedDict, List, Tuple
+from typing import (
+    Iterable,
+    Iterator,
+    List,
+    NamedTuple,
+    Optional,
+    Tuple,
+    TypedDict,
+    Union,
+)
 
 
 class Fingerprint(TypedDict):
@@ -11,34 +20,343 @@ class Fingerprint(TypedDict):
 
 Peak = Tuple[int, int]  # (time_index, freq_index)
 
+# Canonical fingerprint hash: f1, f2 and delta_t packed into one int64 as
+# f1 << 40 | f2 << 20 | delta_t. Each field gets 20 bits, far more than the
+# 1025 STFT bins or the default max_delta of 200 frames need.
+HASH_FIELD_BITS = 20
+HASH_FIELD_MASK = (1 << HASH_FIELD_BITS) - 1
+
+
+def pack_hash(f1, f2, delta_t):
+    """
+    Packs scalars or arrays of (f1, f2, delta_t) into int64 hashes.
+    """
+    f1 = np.asarray(f1, dtype=np.int64) & HASH_FIELD_MASK
+    f2 = np.asarray(f2, dtype=np.int64) & HASH_FIELD_MASK
+    delta_t = np.asarray(delta_t, dtype=np.int64) & HASH_FIELD_MASK
+    return (f1 << (2 * HASH_FIELD_BITS)) | (f2 << HASH_FIELD_BITS) | delta_t
+
+
+def unpack_hash(packed) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+    packed = np.asarray(packed, dtype=np.int64)
+    return (
+        (packed >> (2 * HASH_FIELD_BITS)) & HASH_FIELD_MASK,
+        (packed >> HASH_FIELD_BITS) & HASH_FIELD_MASK,
+        packed & HASH_FIELD_MASK,
+    )
+
+
+class FingerprintArrays(NamedTuple):
+    """
+    Columnar fingerprints: one entry per (anchor, target) peak pair.
+    """
+
+    f1: np.ndarray  # anchor frequency index
+    f2: np.ndarray  # target frequency index
+    delta_t: np.ndarray  # target time - anchor time (frames)
+    timestamp: np.ndarray  # anchor time (frames)
+
+    def __len__(self) -> int:
+        return len(self.timestamp)
+
+    @property
+    def hashes(self) -> np.ndarray:
+        """
+        Packed int64 hash of every fingerprint, see `pack_hash`.
+        """
+        return pack_hash(self.f1, self.f2, self.delta_t)
+
+
+Fingerprints = Union[List[Fingerprint], FingerprintArrays]
+
+
+# Neighbourhood of the peak-picking max filter, in (freq bins, time frames)
+PEAK_NEIGHBORHOOD = (20, 10)
+
+# Version of the peak picking / hashing parameters. Stored with every indexed
+# song; bump it when a change makes existing fingerprints incompatible, so
+# those songs get re-indexed.
+FINGERPRINT_PARAM_VERSION = 1
+
+
+def get_peak_array(
+    audio: Union[np.ndarray, Iterable[np.ndarray]],
+    n_fft: int = 2048,
+    hop_length: int = 512,
+    threshold: int = -40,
+    block_frames: Optional[int] = None,
+) -> np.ndarray:
+    """
+    Returns an (N, 2) int array of (time_index, freq_index) peaks, ordered by
+    frequency then time.
+
+    With `block_frames` set, peaks are computed by `iter_peaks` in blocks of
+    that many STFT frames, so memory no longer grows with the track length;
+    the result is identical to the in-memory path.
+
+    `audio` may also be an iterable of sample chunks, e.g. from
+    `audio.iter_decode_audio`, which is consumed in a single pass: peaks are
+    picked against the running maximum, a superset of the final ones, and
+    filtered against the global maximum once the stream has ended. The result
+    is again identical to passing the concatenated signal.
+    """
+    if not isinstance(audio, np.ndarray):
+        blocks = list(
+            iter_peaks(
+                audio,
+                n_fft=n_fft,
+                hop_length=hop_length,
+                threshold=threshold,
+                block_frames=block_frames or 2048,
+                return_levels=True,
+            )
+        )
+        if not blocks:
+            return np.empty((0, 2), dtype=np.int64)
+        peaks = np.concatenate([block for block, _ in blocks])
+        levels = np.concatenate([block_levels for _, block_levels in blocks])
+        peaks = peaks[above_threshold(levels, threshold)]
+        return peaks[np.lexsort((peaks[:, 0], peaks[:, 1]))]
+
+    if block_frames is not None:
+        blocks = list(
+            iter_peaks(
+                audio,
+                n_fft=n_fft,
+                hop_length=hop_length,
+                threshold=threshold,
+                block_frames=block_frames,
+            )
+        )
+        peaks = np.concatenate(blocks) if blocks else np.empty((0, 2), dtype=np.int64)
+        return peaks[np.lexsort((peaks[:, 0], peaks[:, 1]))]
 
-def get_peaks(
-    audio: np.ndarray, n_fft: int = 2048, hop_length: int = 512, threshold: int = -40
-) -> List[Peak]:
     S = np.abs(librosa.stft(audio, n_fft=n_fft, hop_length=hop_length))
     S_db = librosa.amplitude_to_db(S, ref=np.max)
-    local_max = scipy.ndimage.maximum_filter(S_db, size=(20, 10)) == S_db
+    local_max = scipy.ndimage.maximum_filter(S_db, size=PEAK_NEIGHBORHOOD) == S_db
     detected_peaks = (S_db > threshold) & local_max
     freqs, times = np.where(detected_peaks)
-    return list(zip(times, freqs))
+    return np.column_stack((times, freqs))
+
+
+def above_threshold(levels: np.ndarray, threshold: int = -40) -> np.ndarray:
+    """
+    Mask of the peak magnitudes `levels` within `threshold` dB of the loudest
+    one. The global maximum of a spectrogram is always one of its peaks, so
+    applied to the peaks picked against a running maximum, this keeps those
+    picked against the global one.
+    """
+    ref = levels.max() if len(levels) else 0.0
+    return librosa.amplitude_to_db(levels, ref=ref, top_db=None) > threshold
+
+
+def get_peaks(
+    audio: np.ndarray,
+    n_fft: int = 2048,
+    hop_length: int = 512,
+    threshold: int = -40,
+    block_frames: Optional[int] = None,
+) -> List[Peak]:
+    peaks = get_peak_array(
+        audio,
+        n_fft=n_fft,
+        hop_length=hop_length,
+        threshold=threshold,
+        block_frames=block_frames,
+    )
+    return list(zip(peaks[:, 0], peaks[:, 1]))
+
+
+def _iter_chunks(audio: np.ndarray, chunk_size: int) -> Iterator[np.ndarray]:
+    for start in range(0, len(audio), chunk_size):
+        stop = start + chunk_size
+        yield audio[start:stop]
+
+
+def iter_stft_blocks(
+    chunks: Iterable[np.ndarray],
+    n_fft: int = 2048,
+    hop_length: int = 512,
+    block_frames: int = 2048,
+) -> Iterator[np.ndarray]:
+    """
+    Yields |STFT| magnitude blocks of up to `block_frames` frames from a stream
+    of sample chunks. Frames line up with `librosa.stft(center=True)` on the
+    concatenated signal (zero padding of n_fft // 2 at both ends).
+    """
+    pad = np.zeros(n_fft // 2, dtype=np.float32)
+    span = (block_frames - 1) * hop_length + n_fft
+    step = block_frames * hop_length
+
+    buffer = pad
+    for chunk in chunks:
+        buffer = np.concatenate((buffer, np.asarray(chunk, dtype=np.float32)))
+        while len(buffer) >= span:
+            yield np.abs(
+                librosa.stft(
+                    buffer[:span], n_fft=n_fft, hop_length=hop_length, center=False
+                )
+            )
+            buffer = buffer[step:]
+
+    buffer = np.concatenate((buffer, pad))
+    if len(buffer) >= n_fft:
+        yield np.abs(
+            librosa.stft(buffer, n_fft=n_fft, hop_length=hop_length, center=False)
+        )
+
+
+def iter_peaks(
+    audio: Union[np.ndarray, Iterable[np.ndarray]],
+    n_fft: int = 2048,
+    hop_length: int = 512,
+    threshold: int = -40,
+    block_frames: int = 2048,
+    ref: Optional[float] = None,
+    return_levels: bool = False,
+) -> Iterator[np.ndarray]:
+    """
+    Streaming peak extraction. Yields an (N, 2) array of (time_index, freq_index)
+    peaks per block of `block_frames` STFT frames, in time order, holding only
+    a couple of blocks in memory at once.
+
+    `audio` is either a full signal or an iterable of sample chunks (e.g. from
+    a decoder). dB values are relative to `ref`; when it is None, a signal
+    array gets an extra STFT pass to find the global maximum (matching
+    `get_peak_array` exactly), while a chunk stream uses the running maximum
+    seen so far. With `return_levels`, (peaks, magnitudes) pairs are yielded.
+    """
+    if isinstance(audio, np.ndarray):
+        chunk_size = block_frames * hop_length
+        if ref is None:
+            ref = max(
+                (
+                    S.max()
+                    for S in iter_stft_blocks(
+                        _iter_chunks(audio, chunk_size), n_fft, hop_length, block_frames
+                    )
+                ),
+                default=0.0,
+            )
+        audio = _iter_chunks(audio, chunk_size)
+
+    # Frames of context kept on each side of a block so the max filter sees
+    # the same neighbourhood as it would on the full spectrogram.
+    halo = PEAK_NEIGHBORHOOD[1]
+    running_ref = 0.0
+
+    def detect(S_ext: np.ndarray, start: int, stop: int, first_frame: int):
+        S_db = librosa.amplitude_to_db(
+            S_ext, ref=ref if ref is not None else running_ref, top_db=None
+        )
+        local_max = scipy.ndimage.maximum_filter(S_db, size=PEAK_NEIGHBORHOOD) == S_db
+        detected_peaks = ((S_db > threshold) & local_max)[:, start:stop]
+        freqs, times = np.where(detected_peaks)
+        peaks = np.column_stack((times + first_frame, freqs))
+        order = np.argsort(peaks[:, 0], kind="stable")
+        if return_levels:
+            return peaks[order], S_ext[:, start:stop][freqs, times][order]
+        return peaks[order]
+
+    left = None  # trailing context of the previous block
+    current = None  # block waiting for its right-hand context
+    frame_offset = 0
+    for S in iter_stft_blocks(audio, n_fft, hop_length, block_frames):
+        running_ref = max(running_ref, float(S.max()))
+        if current is not None:
+            parts = [p for p in (left, current, S[:, :halo]) if p is not None]
+            start = 0 if left is None else left.shape[1]
+            yield detect(
+                np.hstack(parts), start, start + current.shape[1], frame_offset
+            )
+            frame_offset += current.shape[1]
+            left = np.hstack([p for p in (left, current) if p is not None])[:, -halo:]
+        current = S
+
+    if current is not None:
+        parts = [p for p in (left, current) if p is not None]
+        start = 0 if left is None else left.shape[1]
+        yield detect(np.hstack(parts), start, start + current.shape[1], frame_offset)
+
+
+def generate_fingerprint_arrays(
+    peaks: Union[List[Peak], np.ndarray],
+    fan_value: int = 5,
+    min_delta: float = 0,
+    max_delta: float = 200,
+    new: Optional[np.ndarray] = None,
+) -> FingerprintArrays:
+    """
+    Vectorized equivalent of `generate_fingerprints`: pairs every peak with the
+    next `fan_value` peaks via broadcasting and keeps pairs whose time delta
+    lies in [min_delta, max_delta]. Output order matches the loop version.
+
+    With a boolean mask `new` over the peaks, only the pairs involving at
+    least one new peak are generated, so peaks arriving incrementally are only
+    paired with their `fan_value` neighbours on either side.
+    """
+    peaks = np.asarray(peaks, dtype=np.int64).reshape(-1, 2)
+    times, freqs = peaks[:, 0], peaks[:, 1]
+    n_peaks = len(peaks)
+
+    anchors = np.arange(n_peaks)
+    if new is not None:
+        new = np.asarray(new, dtype=bool)
+        near_new = new.copy()
+        for k in range(1, fan_value + 1):
+            near_new[:-k] |= new[k:]
+        anchors = anchors[near_new]
+    anchors = anchors[:, None]
+    targets = anchors + np.arange(1, fan_value + 1)[None, :]
+    in_range = targets < n_peaks
+    targets = np.where(in_range, targets, 0)
+
+    delta_t = times[targets] - times[anchors]
+    valid = in_range & (delta_t >= min_delta) & (delta_t <= max_delta)
+    if new is not None:
+        valid &= new[anchors] | new[targets]
+    anchor_idx = np.broadcast_to(anchors, targets.shape)[valid]
+
+    return FingerprintArrays(
+        f1=freqs[anchor_idx],
+        f2=freqs[targets[valid]],
+        delta_t=delta_t[valid],
+        timestamp=times[anchor_idx],
+    )
+
+
+def to_fingerprint_arrays(fingerprints: Fingerprints) -> FingerprintArrays:
+    """
+    Adapter used by the DB backends: passes `FingerprintArrays` through and
+    converts a legacy list of fingerprint dicts into columns.
+    """
+    if isinstance(fingerprints, FingerprintArrays):
+        return fingerprints
+    return FingerprintArrays(
+        f1=np.array([fp["hash"]["f1"] for fp in fingerprints], dtype=np.int64),
+        f2=np.array([fp["hash"]["f2"] for fp in fingerprints], dtype=np.int64),
+        delta_t=np.array(
+            [fp["hash"]["delta_t"] for fp in fingerprints], dtype=np.int64
+        ),
+        timestamp=np.array([fp["timestamp"] for fp in fingerprints], dtype=np.float64),
+    )
 
 
 def generate_fingerprints(
     peaks: List[Peak], fan_value: int = 5, min_delta: float = 0, max_delta: float = 200
 ) -> List[Fingerprint]:
-    fingerprints: List[Fingerprint] = []
-    for i in range(len(peaks)):
-        t1, f1 = peaks[i]
-        for j in range(1, fan_value + 1):
-            if i + j >= len(peaks):
-                break
-            t2, f2 = peaks[i + j]
-            delta_t = t2 - t1
-            if min_delta <= delta_t <= max_delta:
-                fingerprints.append(
-                    {
-                        "hash": {"f1": int(f1), "f2": int(f2), "delta_t": int(delta_t)},
-                        "timestamp": float(t1),
-                    }
-                )
-    return fingerprints
+    fps = generate_fingerprint_arrays(
+        peaks, fan_value=fan_value, min_delta=min_delta, max_delta=max_delta
+    )
+    return [
+        {
+            "hash": {"f1": f1, "f2": f2, "delta_t": delta_t},
+            "timestamp": float(t1),
+        }
+        for f1, f2, delta_t, t1 in zip(
+            fps.f1.tolist(),
+            fps.f2.tolist(),
+            fps.delta_t.tolist(),
+            fps.timestamp.tolist(),
+        )
+    ]
@@ -1,30 +1,133 @@
 import os
-from collections import Counter
 import sys
 
 sys.path.insert(
     0, os.path.abspath(os.path.join(os.path.dirname(__file__), "../../src"))
 )
 
-from abracadabra.fingerprint import get_peaks, generate_fingerprints
+from abracadabra.fingerprint import (
+    FINGERPRINT_PARAM_VERSION,
+    FingerprintArrays,
+    above_threshold,
+    get_peak_array,
+    generate_fingerprint_arrays,
+    iter_peaks,
+)
 from abracadabra.database import create_fingerprint_db
 from abracadabra.AbstractFingerprintDB import AbstractFingerprintDB
-from pydub import AudioSegment
+from abracadabra.scoring import (
+    Candidate,
+    match_confidence,
+    merge_histograms,
+    rank_histogram,
+)
+from abracadabra.cache import RecognitionCache
+from abracadabra.audio_cache import AudioCache
+from abracadabra.audio import decode_audio
 import numpy as np
 
-from concurrent.futures import ThreadPoolExecutor, as_completed
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor, as_completed
 from tqdm import tqdm
-from typing import Union
+from typing import Callable, Iterable, List, Tuple, Union
 from io import BytesIO
+import threading
+import time
+
+
+def fingerprint_audio(
+    audio: Union[np.ndarray, Iterable[np.ndarray]]
+) -> FingerprintArrays:
+    """
+    `audio` is a signal or a stream of sample chunks; both give the same
+    fingerprints.
+    """
+    peaks = get_peak_array(audio)
+    return generate_fingerprint_arrays(peaks)
+
+
+def cached_fingerprint(
+    cache: AudioCache,
+    path: str,
+    load: Callable[[], Union[np.ndarray, Iterable[np.ndarray]]],
+) -> FingerprintArrays:
+    """
+    Fingerprints the audio of `path`, redoing only the stages `cache` cannot
+    answer: fingerprints of the current FINGERPRINT_PARAM_VERSION are reused
+    as they are, cached audio is only fingerprinted again, and otherwise
+    `load()` provides the audio (a signal or a stream of chunks) and both are
+    stored.
+    """
+    digest = cache.get_audio_hash(path)
+    if digest is not None:
+        cached = cache.get_fingerprints(digest, FINGERPRINT_PARAM_VERSION)
+        if cached is not None:
+            return cached[1]
+
+    audio = cache.get_audio(path)
+    audio_cached = audio is not None
+    if not audio_cached:
+        audio = load()
+    streamed = not isinstance(audio, np.ndarray)
+    if streamed:
+        # Keep the chunks to store the audio once the stream has ended
+        chunks, stream = [], audio
+        audio = (chunks.append(chunk) or chunk for chunk in stream)
+
+    peaks = get_peak_array(audio)
+    if streamed:
+        audio = np.concatenate(chunks) if chunks else np.empty(0, dtype=np.float32)
+    if not audio_cached:
+        digest = cache.put_audio(path, audio)
+    fps = generate_fingerprint_arrays(peaks)
+    cache.put_fingerprints(digest, FINGERPRINT_PARAM_VERSION, peaks, fps)
+    return fps
+
+
+def load_and_fingerprint(
+    load_audio: Callable, song_id: int, path: str, cache: AudioCache = None
+) -> FingerprintArrays:
+    """
+    Downloads/decodes one song and fingerprints it. Module-level so it can run
+    in a worker process; `load_audio` is the backend's static `load_audio`.
+    """
+
+    def load():
+        loaded = load_audio(path, song_id)
+        if loaded is None:
+            raise ValueError(f"Could not load audio from {path}")
+        audio, sr = loaded
+        return audio
+
+    if cache is not None:
+        return cached_fingerprint(cache, path, load)
+    return fingerprint_audio(load())
+
+
+def stream_and_fingerprint(
+    stream_audio: Callable, path: str, cache: AudioCache = None
+) -> FingerprintArrays:
+    """
+    Fingerprints a song while it is downloaded and decoded, without writing
+    it to disk. Module-level so it can run in a worker process; `stream_audio`
+    is the backend's static `stream_audio`.
+    """
+    if cache is not None:
+        return cached_fingerprint(cache, path, lambda: stream_audio(path))
+    return fingerprint_audio(stream_audio(path))
+
+
+def fingerprint_song(
+    db: AbstractFingerprintDB, song_id: int, path: str
+) -> FingerprintArrays:
+    if db.streaming_ingest:
+        return stream_and_fingerprint(db.stream_audio, path, db.audio_cache)
+    return load_and_fingerprint(db.load_audio, song_id, path, db.audio_cache)
 
 
 def process_single_song(
     db: AbstractFingerprintDB, song_id: int, path: str, title: str
 ) -> None:
-    audio, sr = db.load_audio(path, song_id)
-    peaks = get_peaks(audio)
-    fingerprints = generate_fingerprints(peaks)
-    db.add_song(song_id, title, fingerprints)
+    db.add_song(song_id, title, fingerprint_song(db, song_id, path))
 
 
 def index_single_song_memory(
@@ -55,71 +158,456 @@ def index_single_song_gcp(
         print(f"Error indexing {song_name} (ID {song_id}): {e}")
 
 
+def format_throughput(n_songs: int, n_fingerprints: int, elapsed: float) -> str:
+    elapsed = max(elapsed, 1e-9)
+    return (
+        f"{n_songs} songs, {n_fingerprints} fingerprints in {elapsed:.1f}s "
+        f"({n_songs / elapsed:.2f} songs/s, {n_fingerprints / elapsed:.0f} fingerprints/s)"
+    )
+
+
+class SongWriter:
+    """
+    Writes (song_id, title, fingerprints) to `db` in batches of `batch_size`
+    songs, each in one `add_songs` transaction, on `writers` threads that each
+    check out their own pooled connection, so write concurrency is tuned
+    independently of the download/fingerprint workers feeding `add`.
+
+    At most two batches per writer wait to be written; `add` blocks beyond
+    that. A failed batch is retried song by song so only the failing songs are
+    lost. Backends without `concurrent_writes` get a single writer.
+    """
+
+    def __init__(
+        self, db: AbstractFingerprintDB, batch_size: int = 16, writers: int = 1
+    ):
+        if not db.concurrent_writes:
+            writers = 1
+        pool = getattr(db, "pool", None)
+        if pool is not None and writers > pool.maxconn:
+            print(f"Limiting writers to the {pool.maxconn} pooled connections")
+            writers = pool.maxconn
+        self.db = db
+        self.batch_size = batch_size
+        self.writers = writers
+        self.n_songs = self.n_fingerprints = 0
+        self.failed = []
+
+        self._lock = threading.Lock()
+        self._batch = []
+        self._slots = threading.BoundedSemaphore(2 * writers)
+        self._executor = ThreadPoolExecutor(
+            max_workers=writers, thread_name_prefix="song-writer"
+        )
+
+    def add(self, song_id: int, title: str, fingerprints) -> None:
+        with self._lock:
+            self._batch.append((song_id, title, fingerprints))
+            if len(self._batch) < self.batch_size:
+                return
+            batch, self._batch = self._batch, []
+        self._submit(batch)
+
+    def flush(self) -> None:
+        with self._lock:
+            batch, self._batch = self._batch, []
+        if batch:
+            self._submit(batch)
+
+    def close(self) -> None:
+        self.flush()
+        self._executor.shutdown()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+    def _submit(self, batch) -> None:
+        self._slots.acquire()
+        self._executor.submit(self._write, batch)
+
+    def _write(self, batch) -> None:
+        try:
+            self._write_batch(batch)
+        finally:
+            self._slots.release()
+
+    def _write_batch(self, batch) -> None:
+        try:
+            self.db.add_songs(batch)
+        except Exception as e:
+            song_ids = [song_id for song_id, _, _ in batch]
+            print(f"Error writing songs {song_ids}: {e}")
+            if len(batch) == 1:
+                with self._lock:
+                    self.failed.extend(song_ids)
+                return
+            for song in batch:
+                self._write_batch([song])
+            return
+        with self._lock:
+            self.n_songs += len(batch)
+            self.n_fingerprints += sum(
+                len(fingerprints) for _, _, fingerprints in batch
+            )
+
+
+def index_songs_in_processes(
+    db: AbstractFingerprintDB,
+    jobs: List[Tuple[int, str, str]],
+    max_workers: int = None,
+    io_workers: int = None,
+    batch_size: int = 16,
+    pool: ProcessPoolExecutor = None,
+    quiet: bool = False,
+    writers: int = 1,
+) -> dict:
+    """
+    Indexes (song_id, path, title) jobs with fingerprinting on a process pool.
+
+    Workers only load and fingerprint audio; results come back to the parent,
+    which writes them to `db` in batches of `batch_size` songs on `writers`
+    threads (see SongWriter). With `io_workers` set, loading (e.g. YouTube
+    downloads) runs on a thread pool of that size and only the CPU-bound part
+    is shipped to the processes.
+    With `db.streaming_ingest`, each process streams and fingerprints its
+    song in one pass; then, and with a `db.audio_cache` (whose hits skip
+    loading altogether), `io_workers` is not used.
+
+    An existing process `pool` can be passed to reuse it across calls; it is
+    left running. Returns the number of songs and fingerprints written and
+    the IDs of the songs that failed.
+    """
+    load_audio = type(db).load_audio
+    if db.streaming_ingest or db.audio_cache is not None:
+        io_workers = None
+    start = time.perf_counter()
+    failed = []
+    writer = SongWriter(db, batch_size=batch_size, writers=writers)
+
+    def load_then_fingerprint(pool, song_id, path):
+        loaded = load_audio(path, song_id)
+        if loaded is None:
+            raise ValueError(f"Could not load audio from {path}")
+        audio, sr = loaded
+        return pool.submit(fingerprint_audio, audio).result()
+
+    own_pool = pool is None
+    if own_pool:
+        pool = ProcessPoolExecutor(max_workers=max_workers)
+    io_pool = ThreadPoolExecutor(max_workers=io_workers) if io_workers else None
+    try:
+        if io_pool is not None:
+            futures = {
+                io_pool.submit(load_then_fingerprint, pool, song_id, path): (
+                    song_id,
+                    title,
+                )
+                for song_id, path, title in jobs
+            }
+        else:
+            futures = {
+                (
+                    pool.submit(
+                        stream_and_fingerprint,
+                        type(db).stream_audio,
+                        path,
+                        db.audio_cache,
+                    )
+                    if db.streaming_ingest
+                    else pool.submit(
+                        load_and_fingerprint,
+                        load_audio,
+                        song_id,
+                        path,
+                        db.audio_cache,
+                    )
+                ): (song_id, title)
+                for song_id, path, title in jobs
+            }
+
+        progress = tqdm(as_completed(futures), total=len(futures), disable=quiet)
+        for future in progress:
+            song_id, title = futures[future]
+            try:
+                writer.add(song_id, title, future.result())
+            except Exception as e:
+                print(f"Error indexing {title} (ID {song_id}): {e}")
+                failed.append(song_id)
+                continue
+            elapsed = max(time.perf_counter() - start, 1e-9)
+            progress.set_postfix(
+                songs_per_s=f"{writer.n_songs / elapsed:.2f}",
+                fps_per_s=f"{writer.n_fingerprints / elapsed:.0f}",
+            )
+    finally:
+        writer.close()
+        # Pending songs are dropped when indexing is interrupted
+        if io_pool is not None:
+            io_pool.shutdown(cancel_futures=True)
+        if own_pool:
+            pool.shutdown(cancel_futures=True)
+
+    elapsed = time.perf_counter() - start
+    if not quiet:
+        print(
+            f"Indexed {format_throughput(writer.n_songs, writer.n_fingerprints, elapsed)}"
+        )
+    return {
+        "songs": writer.n_songs,
+        "fingerprints": writer.n_fingerprints,
+        "failed": failed + writer.failed,
+    }
+
+
 def index_all_songs(
-    db_type: str = "memory", song_dir: str = None, skip_duplicates: bool = False
+    db_type: str = "memory",
+    song_dir: str = None,
+    skip_duplicates: bool = False,
+    executor: str = "thread",
+    max_workers: int = None,
+    io_workers: int = None,
+    batch_size: int = 16,
+    writers: int = None,
 ) -> AbstractFingerprintDB:
+    """
+    `executor` selects how songs are processed:
+      - "thread": load + fingerprint on a pool of `max_workers` threads
+      - "process": load + fingerprint on a pool of `max_workers` processes
+      - "hybrid": load on `io_workers` threads, fingerprint on `max_workers`
+        processes
+    Except for the in-memory "thread" mode, DB writes happen in batches of
+    `batch_size` songs on `writers` threads (default INDEX_WRITERS or 1), each
+    with its own pooled connection.
+    """
+    if executor not in ("thread", "process", "hybrid"):
+        raise ValueError(f"Unsupported executor: {executor}")
+
     db = create_fingerprint_db(db_type)
     existing_ids = set()
+    if writers is None:
+        writers = int(os.getenv("INDEX_WRITERS", "1"))
 
     if skip_duplicates and db_type != "memory":
-        existing_ids = set(db.get_indexed_song_ids())
+        # Songs indexed with older fingerprint parameters are not skipped
+        existing_ids = set(
+            db.get_indexed_song_ids(param_version=FINGERPRINT_PARAM_VERSION)
+        )
 
-    if db_type == "memory":
+    if executor != "thread":
+        if db_type == "memory":
+            jobs = [
+                (idx, os.path.join(song_dir, f), f)
+                for idx, f in enumerate(os.listdir(song_dir))
+                if f.lower().endswith(".m4a")
+            ]
+        else:
+            jobs = [
+                (song_id, youtube_url, song_name)
+                for song_id, song_name, youtube_url in db.load_tracks_from_db()
+                if not (skip_duplicates and song_id in existing_ids)
+            ]
+        index_songs_in_processes(
+            db,
+            jobs,
+            max_workers=max_workers,
+            io_workers=(io_workers or 8) if executor == "hybrid" else None,
+            batch_size=batch_size,
+            writers=writers,
+        )
+    elif db_type == "memory":
         files = [
-            (idx, f, db)
+            (idx, f, db, song_dir)
             for idx, f in enumerate(os.listdir(song_dir))
             if f.lower().endswith(".m4a")
         ]
-        with ThreadPoolExecutor() as executor:
+        with ThreadPoolExecutor(max_workers=max_workers) as thread_pool:
             list(
                 tqdm(
-                    executor.map(lambda args: index_single_song_memory(*args), files),
+                    thread_pool.map(
+                        lambda args: index_single_song_memory(*args), files
+                    ),
                     total=len(files),
                 )
             )
     else:
-        tracks = db.load_tracks_from_db()
-        n_tracks = len(tracks)
+        tracks = [
+            (song_id, song_name, youtube_url)
+            for song_id, song_name, youtube_url in db.load_tracks_from_db()
+            if not (skip_duplicates and song_id in existing_ids)
+        ]
 
-        with ThreadPoolExecutor() as executor:
-            futures = {
-                executor.submit(
-                    index_single_song_gcp,
-                    song_id,
-                    song_name,
-                    youtube_url,
-                    db,
-                    existing_ids,
-                    skip_duplicates,
-                ): (song_id, song_name)
-                for song_id, song_name, youtube_url in tracks
-            }
-            for _ in tqdm(as_completed(futures), total=n_tracks):
-                pass  # Progress shown by tqdm; errors are printed inside `index_single_song_gcp`
+        with SongWriter(db, batch_size=batch_size, writers=writers) as writer:
+            with ThreadPoolExecutor(max_workers=max_workers) as thread_pool:
+                futures = {
+                    thread_pool.submit(fingerprint_song, db, song_id, youtube_url): (
+                        song_id,
+                        song_name,
+                    )
+                    for song_id, song_name, youtube_url in tracks
+                }
+                for future in tqdm(as_completed(futures), total=len(futures)):
+                    song_id, song_name = futures[future]
+                    try:
+                        writer.add(song_id, song_name, future.result())
+                    except Exception as e:
+                        print(f"Error indexing {song_name} (ID {song_id}): {e}")
 
     return db
 
 
+def resolve_match(
+    db: AbstractFingerprintDB,
+    candidates: List[Candidate],
+    db_type: str,
+    min_confidence: float = 0.0,
+) -> tuple[int, int] | dict | None:
+    if not candidates or match_confidence(candidates) < min_confidence:
+        return None
+
+    song_id, offset, score = candidates[0]
+
+    return db.check_song_info(song_id) if db_type != "memory" else (song_id, score)
+
+
 def recognize_song(
     query: Union[str, BytesIO],
     db: AbstractFingerprintDB = None,
     sr: int = 22050,
     db_type: str = "gcp",
+    min_confidence: float = 0.0,
+    offset_tolerance: int = 0,
+    max_duration: float = None,
+    cache: RecognitionCache = None,
 ) -> tuple[int, int] | dict | None:
+    """
+    Returns the metadata (gcp) or (song_id, score) of the best match, or None
+    when nothing matched or the margin over the runner-up, as computed by
+    `scoring.match_confidence`, is below `min_confidence`. Only the first
+    `max_duration` seconds of the query are used when given.
+
+    With a `cache`, the ranked candidates of a query whose fingerprint set is
+    close enough to an earlier one are reused instead of querying `db`, as
+    long as `db` has not been written to since (see RecognitionCache).
+    """
     if db is None:
         db = create_fingerprint_db(db_type)
 
-    audio = AudioSegment.from_file(query)
-    audio = audio.set_channels(1).set_frame_rate(sr)
-    samples = np.array(audio.get_array_of_samples()).astype(np.float32) / 32768.0
-    peaks = get_peaks(samples)
-    query_fp = generate_fingerprints(peaks)
-    matches = db.get_matches(query_fp)
+    samples = decode_audio(query, sr=sr, max_duration=max_duration)
+    peaks = get_peak_array(samples)
+    query_fp = generate_fingerprint_arrays(peaks)
 
-    if not matches:
-        return None
+    # Read before querying, so a write racing the query leaves a stale entry
+    generation = db.index_generation
+    signature = cache.signature(query_fp.hashes) if cache is not None else None
+    candidates = cache.lookup(signature, generation) if cache is not None else None
+    if candidates is None:
+        candidates = db.get_top_matches(
+            query_fp, top_k=2, offset_tolerance=offset_tolerance
+        )
+        if cache is not None and candidates:
+            cache.store(signature, candidates, generation)
+
+    return resolve_match(db, candidates, db_type, min_confidence)
+
+
+def recognize_song_incremental(
+    query: Union[str, BytesIO],
+    db: AbstractFingerprintDB = None,
+    sr: int = 22050,
+    db_type: str = "gcp",
+    window_seconds: float = 2.5,
+    stop_confidence: float = 0.5,
+    stop_min_score: int = 10,
+    min_confidence: float = 0.0,
+    offset_tolerance: int = 0,
+    max_duration: float = None,
+    hop_length: int = 512,
+    cache: RecognitionCache = None,
+    window_bins: int = 1000,
+    threshold: int = -40,
+) -> tuple[int, int] | dict | None:
+    """
+    Like `recognize_song`, but walks the clip in windows of `window_seconds`.
+    After each window only the fingerprints pairing its new peaks are looked
+    up, the `window_bins` fullest (song, offset) bins of their matches are
+    added to the running offset histogram, and recognition stops early once
+    the leader scores at least `stop_min_score` with a confidence of at least
+    `stop_confidence`.
+
+    Peaks are picked against the loudest frame heard so far rather than the
+    whole clip, so no window waits for a pass over the entire clip. Each
+    window drops the earlier peaks that the new maximum puts more than
+    `threshold` dB down, so the final peaks are those of `get_peak_array`;
+    when that drops peaks already looked up (after a quiet opening), the
+    histogram is rebuilt from the remaining ones.
+
+    With a `cache`, the query is identified by the fingerprints of the whole
+    clip, as in `recognize_song` (so both share entries), and a repeated
+    clip is resolved before anything is sent to `db`. A short or quiet
+    opening alone would make different clips collide.
+    """
+    if db is None:
+        db = create_fingerprint_db(db_type)
+
+    samples = decode_audio(query, sr=sr, max_duration=max_duration)
+    block_frames = max(1, int(window_seconds * sr / hop_length))
+
+    peaks = np.empty((0, 2), dtype=np.int64)
+    levels = np.empty(0, dtype=np.float32)
+    sent = np.empty(0, dtype=bool)  # peaks whose pairs were looked up
+    histogram = None
+    candidates = []
+    signature = None
+    generation = db.index_generation
+    if cache is not None:
+        query_fp = generate_fingerprint_arrays(get_peak_array(samples))
+        signature = cache.signature(query_fp.hashes)
+        cached = cache.lookup(signature, generation)
+        if cached is not None:
+            return resolve_match(db, cached, db_type, min_confidence)
+
+    # A one-chunk stream: dB levels relative to the running maximum
+    for block, block_levels in iter_peaks(
+        iter((samples,)),
+        hop_length=hop_length,
+        threshold=threshold,
+        block_frames=block_frames,
+        return_levels=True,
+    ):
+        peaks = np.concatenate((peaks, block))
+        levels = np.concatenate((levels, block_levels))
+        sent = np.concatenate((sent, np.zeros(len(block), dtype=bool)))
+        # Nothing but digital silence so far: every bin would be a peak
+        if not levels.any():
+            continue
+        keep = above_threshold(levels, threshold)
+        if not keep[sent].all():
+            # Pairs of dropped peaks were counted already: start over
+            histogram, candidates = None, []
+            sent[:] = False
+        order = np.lexsort((peaks[keep, 0], peaks[keep, 1]))
+        peaks, levels, sent = peaks[keep][order], levels[keep][order], sent[keep][order]
+        if sent.all():
+            continue
+        fps = generate_fingerprint_arrays(peaks, new=~sent)
+        sent[:] = True
+        if len(fps) == 0:
+            continue
 
-    offset_counts = Counter(matches)
-    (song_id, offset), score = offset_counts.most_common(1)[0]
+        window = db.get_offset_histogram(
+            fps, offset_tolerance=offset_tolerance, max_bins=window_bins
+        )
+        histogram = window if histogram is None else merge_histograms(histogram, window)
+        candidates = rank_histogram(
+            histogram, top_k=2, offset_tolerance=offset_tolerance
+        )
+        confident = match_confidence(candidates) >= stop_confidence
+        if confident and candidates[0][2] >= stop_min_score:
+            break
 
-    return db.check_song_info(song_id) if db_type == "gcp" else (song_id, score)
+    if cache is not None and candidates:
+        cache.store(signature, candidates, generation)
+    return resolve_match(db, candidates, db_type, min_confidence)
@@ -0,0 +1,116 @@
+import numpy as np
+from typing import List, Tuple
+
+Candidate = Tuple[int, int, int]  # (song_id, time_offset, score)
+
+
+# (song_ids, bins, counts): matches per (song, offset bin), see offset_histogram
+Histogram = Tuple[np.ndarray, np.ndarray, np.ndarray]
+
+
+def _sum_bins(song_ids: np.ndarray, bins: np.ndarray, counts: np.ndarray) -> Histogram:
+    """
+    Sums the counts of equal (song, bin) pairs; the result is sorted by song,
+    then bin.
+    """
+    song_ids = np.asarray(song_ids, dtype=np.int64)
+    bins = np.asarray(bins, dtype=np.int64)
+    if len(song_ids) == 0:
+        empty = np.empty(0, dtype=np.int64)
+        return empty, empty, empty
+    min_bin = bins.min()
+
+    # One int64 key per (song, bin); bins are shifted to be non-negative
+    keys = (song_ids << 32) | (bins - min_bin)
+    keys, inverse = np.unique(keys, return_inverse=True)
+    counts = np.bincount(inverse.ravel(), weights=counts, minlength=len(keys))
+    return keys >> 32, (keys & 0xFFFFFFFF) + min_bin, counts.astype(np.int64)
+
+
+def offset_histogram(
+    song_ids: np.ndarray, offsets: np.ndarray, offset_tolerance: int = 0
+) -> Histogram:
+    """
+    Groups (song_id, offset) matches into bins of width 2 * offset_tolerance
+    + 1 (frames); bin b is centred on offset b * width.
+    """
+    width = 2 * offset_tolerance + 1
+    bins = np.floor((np.asarray(offsets) + offset_tolerance) / width)
+    return _sum_bins(song_ids, bins, np.ones(len(bins)))
+
+
+def merge_histograms(*histograms: Histogram) -> Histogram:
+    """
+    Adds up histograms, e.g. of successive query windows.
+    """
+    return _sum_bins(*(np.concatenate(columns) for columns in zip(*histograms)))
+
+
+def rank_histogram(
+    histogram: Histogram, top_k: int = 5, offset_tolerance: int = 0
+) -> List[Candidate]:
+    """
+    Scores each song by its fullest bin and returns the `top_k` songs best
+    first, with the bin centre as their offset. With a tolerance, a bin is
+    scored together with the next one (fixed bins would otherwise split
+    offsets within the tolerance of each other) and reports the centre of the
+    fuller of the two.
+    """
+    key_songs, key_bins, counts = _sum_bins(*histogram)
+    if len(counts) == 0:
+        return []
+
+    if offset_tolerance > 0:
+        # Sorted by song, then bin: pair each bin with its successor
+        adjacent = np.zeros(len(counts), dtype=bool)
+        adjacent[:-1] = (key_songs[1:] == key_songs[:-1]) & (
+            key_bins[1:] == key_bins[:-1] + 1
+        )
+        next_counts = np.zeros_like(counts)
+        next_counts[:-1] = np.where(adjacent[:-1], counts[1:], 0)
+        key_bins = np.where(next_counts > counts, key_bins + 1, key_bins)
+        counts = counts + next_counts
+
+    # Best bin per song: sort by song, then count descending, keep the first
+    order = np.lexsort((-counts, key_songs))
+    first = np.ones(len(order), dtype=bool)
+    first[1:] = key_songs[order][1:] != key_songs[order][:-1]
+    best = order[first]
+
+    width = 2 * offset_tolerance + 1
+    ranked = best[np.argsort(-counts[best], kind="stable")][:top_k]
+    return [
+        (int(song_id), int(bin_) * width, int(score))
+        for song_id, bin_, score in zip(
+            key_songs[ranked], key_bins[ranked], counts[ranked]
+        )
+    ]
+
+
+def rank_matches(
+    song_ids: np.ndarray,
+    offsets: np.ndarray,
+    top_k: int = 5,
+    offset_tolerance: int = 0,
+) -> List[Candidate]:
+    """
+    Vectorized offset-histogram scoring of (song_id, offset) matches: the
+    `offset_histogram` of the matches ranked by `rank_histogram`.
+    """
+    return rank_histogram(
+        offset_histogram(song_ids, offsets, offset_tolerance),
+        top_k=top_k,
+        offset_tolerance=offset_tolerance,
+    )
+
+
+def match_confidence(candidates: List[Candidate]) -> float:
+    """
+    Margin of the best candidate over the runner-up, relative to the best
+    score: 1.0 when nothing else matched, 0.0 for a tie or no match.
+    """
+    if not candidates:
+        return 0.0
+    best = candidates[0][2]
+    runner_up = candidates[1][2] if len(candidates) > 1 else 0
+    return (best - runner_up) / best if best > 0 else 0.0
@@ -14,8 +14,12 @@ from app_engine.utils_misc import format_duration_ms, get_release_year
 from app_engine.utils_db import list_tracks_helper, check_if_song_exists
 
 from io import BytesIO
-from abracadabra.recognize import recognize_song
+from abracadabra.recognize import recognize_song_incremental
+from abracadabra.database import create_fingerprint_db
+from abracadabra.cache import RecognitionCache
 import ast
+import threading
+import time
 
 app = Flask(__name__)
 
@@ -41,6 +45,30 @@ publisher = pubsub_v1.PublisherClient()
 topic_path = publisher.topic_path("cloud-computing-project-458205", "songs-to-process")
 
 
+_fingerprint_db = None
+_fingerprint_db_lock = threading.Lock()
+
+# Ranked matches of recent queries; near-duplicate clips skip the database.
+# Entries are dropped once the fingerprint DB's index_generation moves on,
+# which its background hash filter sync does when the workers index songs,
+# so they are at most a sync interval stale (or the TTL without the filter).
+recognition_cache = RecognitionCache(
+    maxsize=int(os.getenv("RECOGNITION_CACHE_SIZE", "1024")),
+    ttl=float(os.getenv("RECOGNITION_CACHE_TTL", "3600")),
+)
+CACHE_STATS_LOG_INTERVAL = float(os.getenv("CACHE_STATS_LOG_INTERVAL", "300"))
+_cache_stats_logged_at = time.monotonic()
+
+
+def get_fingerprint_db():
+    """Lazily creates the GCPFingerprintDB shared by all /identify requests."""
+    global _fingerprint_db
+    with _fingerprint_db_lock:
+        if _fingerprint_db is None:
+            _fingerprint_db = create_fingerprint_db("gcp")
+        return _fingerprint_db
+
+
 @app.route("/")
 def index():
     return render_template("index.html")
@@ -82,7 +110,11 @@ def identify():
 
     audio_buffer = BytesIO(audio_file.read())
 
-    result = recognize_song(audio_buffer, db_type="gcp")
+    db = get_fingerprint_db()
+    result = recognize_song_incremental(
+        audio_buffer, db=db, db_type="gcp", cache=recognition_cache
+    )
+    log_cache_stats(db)
 
     if result is None:
         return redirect(url_for("result", match="No match found"))
@@ -91,6 +123,20 @@ def identify():
     return redirect(url_for("result", match=match_str))
 
 
+def log_cache_stats(db):
+    """Logs the cache counters at most every CACHE_STATS_LOG_INTERVAL seconds."""
+    global _cache_stats_logged_at
+    now = time.monotonic()
+    if now - _cache_stats_logged_at < CACHE_STATS_LOG_INTERVAL:
+        return
+    _cache_stats_logged_at = now
+    stats = {
+        "recognition": recognition_cache.stats(),
+        "song_info": db.song_info_cache.stats(),
+    }
+    app.logger.info(f"Cache stats: {json.dumps(stats)}")
+
+
 @app.route("/result")
 def result():
     # Expecting match info passed as query parameters or via session/POST
@@ -1,46 +1,62 @@
 import os
+import base64
+import json
+import threading
+import time
+from collections import OrderedDict
 import psycopg2
+import psycopg2.pool
 from psycopg2.extras import DictCursor
 from psycopg2 import sql
 from flask import render_template, request, url_for
 import math
-from google.cloud import secretmanager
 
 
-from app_engine.utils_misc import format_duration_ms, get_release_year, get_secret
+from app_engine.utils_misc import format_duration_ms, get_release_year
+from app_engine.utils_search import TRACK_EXISTS_QUERY, search_clause
+from abracadabra.clients import get_secret
+from abracadabra.db_pool import get_connection_pool
 
 
 # --- Database Connection Parameters ---
-client = secretmanager.SecretManagerServiceClient()
+# Same secrets, normalized the same way, as GCPFingerprintDB, so both end up
+# on one shared connection pool
 DB_NAME = os.getenv("DB_NAME", "database-instance")
-DB_USER = get_secret("DB_USER", "cloud-computing-project-458205", client).strip()
-DB_PASSWORD = get_secret(
-    "DB_PASSWORD", "cloud-computing-project-458205", client
-).strip()
-DB_HOST = get_secret("DB_HOST", "cloud-computing-project-458205", client).strip()
+DB_USER = get_secret("DB_USER", "cloud-computing-project-458205")
+DB_PASSWORD = get_secret("DB_PASSWORD", "cloud-computing-project-458205")
+DB_HOST = get_secret("DB_HOST", "cloud-computing-project-458205")
 DB_PORT = os.getenv("DB_PORT", "5432")
 
 
+def get_db_pool():
+    """Returns the process-wide connection pool shared with GCPFingerprintDB."""
+    return get_connection_pool(
+        dbname=DB_NAME,
+        user=DB_USER,
+        password=DB_PASSWORD,
+        host=DB_HOST,
+        port=DB_PORT,
+    )
+
+
 def get_db_connection(app):
-    """Establishes and returns a database connection."""
+    """Checks out a pooled database connection; hand it back with release_db_connection."""
     try:
-        conn = psycopg2.connect(
-            dbname=DB_NAME,
-            user=DB_USER,
-            password=DB_PASSWORD,
-            host=DB_HOST,
-            port=DB_PORT,
-            cursor_factory=DictCursor,  # Use DictCursor to access columns by name
-        )
-        app.logger.info(
-            f"Successfully connected to database '{DB_NAME}' on {DB_HOST}:{DB_PORT}."
-        )
+        conn = get_db_pool().getconn()
+        # Use DictCursor to access columns by name
+        conn.cursor_factory = DictCursor
         return conn
-    except psycopg2.OperationalError as e:
+    except (psycopg2.OperationalError, psycopg2.pool.PoolError) as e:
         app.logger.error(f"Database connection failed: {e}")
         raise
 
 
+def release_db_connection(conn):
+    """Returns a connection to the pool, rolling back any open transaction."""
+    conn.cursor_factory = None
+    get_db_pool().putconn(conn)
+
+
 def get_all_genres(app, cursor):
     """Fetches all unique genre names from the database."""
     try:
@@ -52,8 +68,166 @@ def get_all_genres(app, cursor):
         return []
 
 
+# Orderings offered by /list_songs/ as (expression, direction, SQL type) keys.
+# Each ends with track_id so rows are totally ordered, which keyset pagination
+# needs, and NULLs are coalesced so the keys can be compared. create_db.sql
+# has an index matching each ordering (track_name_desc scans track_name_asc
+# backwards).
+_POPULARITY = ("coalesce(t.popularity, 0)", "integer")
+_TRACK_NAME = ("coalesce(t.track_name, '')", "text")
+_RELEASE_DATE = ("coalesce(t.album_release_date, '-infinity'::date)", "date")
+_TRACK_ID = ("t.track_id", "integer")
+
+
+def _keys(*keys):
+    return tuple((expr, direction, pg_type) for (expr, pg_type), direction in keys)
+
+
+SORT_ORDERS = {
+    "popularity_desc": _keys(
+        (_POPULARITY, "DESC"), (_TRACK_NAME, "ASC"), (_TRACK_ID, "ASC")
+    ),
+    "popularity_asc": _keys(
+        (_POPULARITY, "ASC"), (_TRACK_NAME, "ASC"), (_TRACK_ID, "ASC")
+    ),
+    "track_name_asc": _keys((_TRACK_NAME, "ASC"), (_TRACK_ID, "ASC")),
+    "track_name_desc": _keys((_TRACK_NAME, "DESC"), (_TRACK_ID, "DESC")),
+    "album_release_date_desc": _keys(
+        (_RELEASE_DATE, "DESC"), (_TRACK_NAME, "ASC"), (_TRACK_ID, "ASC")
+    ),
+    "album_release_date_asc": _keys(
+        (_RELEASE_DATE, "ASC"), (_TRACK_NAME, "ASC"), (_TRACK_ID, "ASC")
+    ),
+}
+DEFAULT_SORT = "popularity_desc"
+
+# Total counts are cached per (query, genres) for this many seconds
+COUNT_CACHE_TTL = float(os.getenv("TRACK_COUNT_CACHE_TTL", "60"))
+COUNT_CACHE_SIZE = 1024
+# Unfiltered listings use the planner's row estimate above this many tracks
+COUNT_ESTIMATE_MIN_ROWS = int(os.getenv("TRACK_COUNT_ESTIMATE_MIN_ROWS", "100000"))
+
+_count_cache = OrderedDict()  # key -> (total, is_estimate, expires_at)
+_count_cache_lock = threading.Lock()
+
+
+def encode_cursor(keys, backward=False, skip=0, limit=None):
+    """
+    Encodes a page position for the `cursor` query parameter: the sort key
+    values of the row to continue from (None to start from either end), the
+    direction, how many rows to skip past it and an optional page size.
+    """
+    state = {"keys": keys, "backward": backward, "skip": skip}
+    if limit is not None:
+        state["limit"] = limit
+    return base64.urlsafe_b64encode(json.dumps(state).encode()).decode()
+
+
+def _is_int(value):
+    return isinstance(value, int) and not isinstance(value, bool)
+
+
+def decode_cursor(cursor):
+    """
+    Inverse of encode_cursor; returns None for a missing or malformed cursor.
+    Cursors come from clients, so every field is type checked here.
+    """
+    if not cursor:
+        return None
+    try:
+        state = json.loads(base64.urlsafe_b64decode(cursor.encode()))
+    except (ValueError, TypeError):
+        return None
+    if not isinstance(state, dict):
+        return None
+    keys = state.get("keys")
+    backward = state.get("backward", False)
+    skip = state.get("skip", 0)
+    limit = state.get("limit")
+    if keys is not None and not (
+        isinstance(keys, list) and all(isinstance(k, str) for k in keys)
+    ):
+        return None
+    if not isinstance(backward, bool) or not _is_int(skip) or skip < 0:
+        return None
+    if limit is not None and not (_is_int(limit) and limit >= 1):
+        return None
+    return {"keys": keys, "backward": backward, "skip": skip, "limit": limit}
+
+
+def keyset_predicate(sort_keys, values, backward=False):
+    """
+    Builds the WHERE condition selecting rows strictly after `values` in the
+    `sort_keys` ordering (before them if `backward`), with its parameters.
+    The leading key gets a separate range bound so an index can be used.
+    """
+    ops = [
+        ">" if (direction == "ASC") != backward else "<"
+        for _, direction, _ in sort_keys
+    ]
+    params = []
+    alternatives = []
+    for i, (expr, _, pg_type) in enumerate(sort_keys):
+        terms = [f"{e} = %s::{t}" for e, _, t in sort_keys[:i]]
+        terms.append(f"{expr} {ops[i]} %s::{pg_type}")
+        alternatives.append("(" + " AND ".join(terms) + ")")
+        params.extend(values[: i + 1])
+
+    first_expr, _, first_type = sort_keys[0]
+    predicate = (
+        f"{first_expr} {ops[0]}= %s::{first_type} AND ({' OR '.join(alternatives)})"
+    )
+    return predicate, [values[0]] + params
+
+
+def count_tracks(cursor, where_sql, query_params, search_query, selected_genres):
+    """
+    Returns (total, is_estimate) for a listing, cached for COUNT_CACHE_TTL
+    seconds per (query, genres). Unfiltered listings of large catalogues use
+    pg_class.reltuples instead of counting.
+    """
+    key = (search_query.lower(), tuple(sorted(set(selected_genres))))
+    now = time.monotonic()
+    with _count_cache_lock:
+        cached = _count_cache.get(key)
+        if cached and cached[2] > now:
+            _count_cache.move_to_end(key)
+            return cached[0], cached[1]
+
+    total, is_estimate = None, False
+    if not search_query and not selected_genres:
+        cursor.execute(
+            "SELECT reltuples::bigint FROM pg_class WHERE oid = 'tracks'::regclass;"
+        )
+        estimate = cursor.fetchone()[0]
+        if estimate >= COUNT_ESTIMATE_MIN_ROWS:
+            total, is_estimate = estimate, True
+    if total is None:
+        cursor.execute(
+            sql.SQL("SELECT COUNT(*) FROM tracks t") + where_sql + sql.SQL(";"),
+            tuple(query_params),
+        )
+        total = cursor.fetchone()[0]
+
+    with _count_cache_lock:
+        _count_cache[key] = (total, is_estimate, now + COUNT_CACHE_TTL)
+        _count_cache.move_to_end(key)
+        while len(_count_cache) > COUNT_CACHE_SIZE:
+            _count_cache.popitem(last=False)
+    return total, is_estimate
+
+
 def list_tracks_helper(app, items_per_page_default=10):
-    """Displays a paginated, searchable, sortable, and filterable list of tracks."""
+    """
+    Displays a paginated, searchable, sortable, and filterable list of tracks.
+
+    Pages linked from the pagination bar carry a keyset cursor (see
+    encode_cursor), so fetching them costs the same however deep they are;
+    a bare `page` parameter falls back to LIMIT/OFFSET.
+    """
+    if request.args.get("cursor") and decode_cursor(request.args["cursor"]) is None:
+        return "<h1>400 - Bad Request</h1><p>Invalid page cursor.</p>", 400
+
     conn = None
     try:
         conn = get_db_connection(app)
@@ -65,17 +239,24 @@ def list_tracks_helper(app, items_per_page_default=10):
         # Get query parameters
         page = request.args.get("page", 1, type=int)
         search_query = request.args.get("query", "").strip()
-        sort_by = request.args.get("sort_by", "popularity_desc")
+        sort_by = request.args.get("sort_by", DEFAULT_SORT)
         # Use request.args.getlist for multiple selected values
         selected_genres = request.args.getlist("tags")
         items_per_page = request.args.get(
             "items_per_page", items_per_page_default, type=int
         )
+        position = decode_cursor(request.args.get("cursor"))
 
         if page < 1:
             page = 1
         if items_per_page not in [10, 20, 50, 100]:
             items_per_page = items_per_page_default
+        if sort_by not in SORT_ORDERS:
+            sort_by = DEFAULT_SORT
+        sort_keys = SORT_ORDERS[sort_by]
+        if position and position["keys"] is not None:
+            if len(position["keys"]) != len(sort_keys):
+                position = None
 
         app.logger.info(
             f"Request for page: {page}, query: '{search_query}', sort_by: '{sort_by}', "
@@ -86,26 +267,20 @@ def list_tracks_helper(app, items_per_page_default=10):
         where_clauses = []
         query_params = []
 
-        # Base query to fetch tracks
-        from_clause = sql.SQL("FROM tracks t")
-
-        # Determine if DISTINCT ON is needed
-        needs_distinct_on = False
         if selected_genres:
-            from_clause = sql.SQL(
-                """
-                FROM tracks t
-                JOIN track_genres tg ON t.track_id = tg.track_id
-                JOIN genres g ON tg.genre_id = g.genre_id
-                """
+            # Semi-join, so a track matching several genres is listed once
+            # without DISTINCT and the sort order can still use an index
+            where_clauses.append(
+                "EXISTS (SELECT 1 FROM track_genres tg "
+                "JOIN genres g ON tg.genre_id = g.genre_id "
+                "WHERE tg.track_id = t.track_id AND g.genre_name = ANY(%s))"
             )
-            where_clauses.append("g.genre_name = ANY(%s)")
             query_params.append(selected_genres)
-            needs_distinct_on = True  # Set to True if genre filtering is active
 
         if search_query:
-            where_clauses.append("(t.track_name ILIKE %s OR t.artist_names ILIKE %s)")
-            query_params.extend([f"%{search_query}%", f"%{search_query}%"])
+            clause, params = search_clause(search_query)
+            where_clauses.append(clause)
+            query_params.extend(params)
 
         # Build WHERE clause
         where_sql = sql.SQL("")
@@ -114,72 +289,65 @@ def list_tracks_helper(app, items_per_page_default=10):
                 map(sql.SQL, where_clauses)
             )
 
-        # Build ORDER BY clause
-        order_by_parts = []
-        if needs_distinct_on:
-            # When DISTINCT ON is used, track_id must be the first in ORDER BY
-            order_by_parts.append(
-                sql.SQL("t.track_id ASC")
-            )  # Arbitrarily pick an order for track_id itself
-
-        if sort_by == "popularity_desc":
-            order_by_parts.append(sql.SQL("t.popularity DESC"))
-            order_by_parts.append(sql.SQL("t.track_name ASC"))
-        elif sort_by == "popularity_asc":
-            order_by_parts.append(sql.SQL("t.popularity ASC"))
-            order_by_parts.append(sql.SQL("t.track_name ASC"))
-        elif sort_by == "track_name_asc":
-            order_by_parts.append(sql.SQL("t.track_name ASC"))
-        elif sort_by == "track_name_desc":
-            order_by_parts.append(sql.SQL("t.track_name DESC"))
-        elif sort_by == "album_release_date_desc":
-            order_by_parts.append(sql.SQL("t.album_release_date DESC"))
-            order_by_parts.append(sql.SQL("t.track_name ASC"))
-        elif sort_by == "album_release_date_asc":
-            order_by_parts.append(sql.SQL("t.album_release_date ASC"))
-            order_by_parts.append(sql.SQL("t.track_name ASC"))
-        else:  # Default sort
-            order_by_parts.append(sql.SQL("t.popularity DESC"))
-            order_by_parts.append(sql.SQL("t.track_name ASC"))
-
-        order_by_sql = sql.SQL(" ORDER BY ") + sql.SQL(", ").join(order_by_parts)
-
-        # Count total tracks matching the criteria
-        count_query_select = (
-            sql.SQL("SELECT COUNT(DISTINCT t.track_id)")
-            if needs_distinct_on
-            else sql.SQL("SELECT COUNT(*)")
+        total_tracks, total_is_estimate = count_tracks(
+            cursor, where_sql, query_params, search_query, selected_genres
         )
-        count_query = count_query_select + from_clause + where_sql + sql.SQL(";")
-
-        cursor.execute(count_query, tuple(query_params))
-        total_tracks_result = cursor.fetchone()
-        total_tracks = total_tracks_result[0] if total_tracks_result else 0
         app.logger.info(f"Total tracks found for criteria: {total_tracks}")
 
         total_pages = (
             math.ceil(total_tracks / items_per_page) if total_tracks > 0 else 1
         )
 
-        if page > total_pages and total_tracks > 0:
+        if page > total_pages and total_tracks > 0 and not total_is_estimate:
             app.logger.info(
                 f"Requested page {page} is out of bounds, {total_pages} total. Setting to last page"
             )
             page = total_pages
+            position = None
+
+        # Page position: keyset cursor, or plain offset
+        backward = False
+        page_clauses = list(where_clauses)
+        page_params = list(query_params)
+        limit = items_per_page
+        if position:
+            backward = position["backward"]
+            offset = position["skip"]
+            if position["limit"]:
+                limit = min(position["limit"], items_per_page)
+            if position["keys"] is not None:
+                predicate, params = keyset_predicate(
+                    sort_keys, position["keys"], backward
+                )
+                page_clauses.append(predicate)
+                page_params.extend(params)
+        else:
+            offset = (page - 1) * items_per_page
+
+        page_where_sql = sql.SQL("")
+        if page_clauses:
+            page_where_sql = sql.SQL(" WHERE ") + sql.SQL(" AND ").join(
+                map(sql.SQL, page_clauses)
+            )
 
-        offset = (page - 1) * items_per_page
-        if offset < 0:  # Ensure offset is not negative
-            offset = 0
+        # Build ORDER BY clause, reversed when paging backwards
+        order_by_parts = []
+        for expr, direction, _ in sort_keys:
+            if backward:
+                direction = "DESC" if direction == "ASC" else "ASC"
+            order_by_parts.append(sql.SQL(f"{expr} {direction}"))
+        order_by_sql = sql.SQL(" ORDER BY ") + sql.SQL(", ").join(order_by_parts)
 
-        # Main query for fetching tracks
-        select_distinct_clause = (
-            sql.SQL("SELECT DISTINCT ON (t.track_id)")
-            if needs_distinct_on
-            else sql.SQL("SELECT")
+        # Sort keys are returned as text so they round-trip through cursors
+        key_columns = sql.SQL(", ").join(
+            sql.SQL(f"({expr})::text AS sort_key_{i}")
+            for i, (expr, _, _) in enumerate(sort_keys)
         )
+
+        # Main query for fetching tracks
         query = sql.SQL(
             """
-            {select_distinct_clause}
+            SELECT
                 t.track_id,
                 t.track_name,
                 t.artist_names,
@@ -188,23 +356,53 @@ def list_tracks_helper(app, items_per_page_default=10):
                 t.album_image_url,
                 t.track_duration_ms,
                 t.explicit,
-                t.popularity
-            {from_clause}
+                t.popularity,
+                {key_columns}
+            FROM tracks t
             {where_clause}
             {order_by_clause}
             LIMIT %s OFFSET %s;
         """
         ).format(
-            select_distinct_clause=select_distinct_clause,
-            from_clause=from_clause,
-            where_clause=where_sql,
+            key_columns=key_columns,
+            where_clause=page_where_sql,
             order_by_clause=order_by_sql,
         )
 
-        cursor.execute(query, tuple(query_params + [items_per_page, offset]))
+        cursor.execute(query, tuple(page_params + [limit, offset]))
         tracks_data = cursor.fetchall()
+        if backward:
+            tracks_data.reverse()
         app.logger.info(f"Fetched {len(tracks_data)} tracks for page {page}.")
 
+        # Cursors for the pages linked from the pagination bar
+        page_cursors = {}
+        if tracks_data:
+            first_keys = [
+                tracks_data[0][f"sort_key_{i}"] for i in range(len(sort_keys))
+            ]
+            last_keys = [
+                tracks_data[-1][f"sort_key_{i}"] for i in range(len(sort_keys))
+            ]
+            for p in range(max(page - 3, 2), min(page + 3, total_pages) + 1):
+                if p > page:
+                    page_cursors[p] = encode_cursor(
+                        last_keys, skip=(p - page - 1) * items_per_page
+                    )
+                elif p < page:
+                    page_cursors[p] = encode_cursor(
+                        first_keys, backward=True, skip=(page - p - 1) * items_per_page
+                    )
+        if total_pages > 1:
+            # The last page holds the remainder of an exact count; with an
+            # estimate it is just the last full page
+            remainder = None
+            if not total_is_estimate:
+                remainder = total_tracks - (total_pages - 1) * items_per_page
+            page_cursors.setdefault(
+                total_pages, encode_cursor(None, backward=True, limit=remainder)
+            )
+
         display_tracks = []
         for track in tracks_data:
             display_tracks.append(
@@ -231,6 +429,8 @@ def list_tracks_helper(app, items_per_page_default=10):
             current_page=page,
             total_pages=total_pages,
             total_tracks=total_tracks,
+            total_is_estimate=total_is_estimate,
+            page_cursors=page_cursors,
             query=search_query,
             sort_by=sort_by,
             selected_genres=selected_genres,
@@ -256,8 +456,7 @@ def list_tracks_helper(app, items_per_page_default=10):
         )
     finally:
         if conn:
-            conn.close()
-            app.logger.info("Database connection closed.")
+            release_db_connection(conn)
 
 
 def check_if_song_exists(app, title, artist):
@@ -265,17 +464,10 @@ def check_if_song_exists(app, title, artist):
     try:
         conn = get_db_connection(app)
         cur = conn.cursor()
-        cur.execute(
-            """
-            SELECT 1 FROM tracks
-            WHERE track_name ILIKE %s AND artist_names ILIKE %s
-        """,
-            (title, artist),
-        )
+        cur.execute(TRACK_EXISTS_QUERY, (title, artist))
 
         result = cur.fetchone()
         cur.close()
-        conn.close()
 
         if result:
             return {
@@ -291,3 +483,6 @@ def check_if_song_exists(app, title, artist):
     except Exception as e:
         app.logger.error(f"Error in push_to_pub_sub: {e}")
         return {"status": "error", "message": "Failed to process request."}
+    finally:
+        if conn:
+            release_db_connection(conn)
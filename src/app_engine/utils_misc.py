@@ -25,9 +25,3 @@ def get_release_year(release_date):
             return "N/A"
     except Exception:
         return "N/A"
-
-
-def get_secret(secret_id, project_id, client):
-    name = f"projects/{project_id}/secrets/{secret_id}/versions/latest"
-    response = client.access_secret_version(request={"name": name})
-    return response.payload.data.decode("utf-8")
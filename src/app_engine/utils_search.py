@@ -0,0 +1,40 @@
+import re
+
+# Track search is backed by two indexed SQL functions defined in
+# utils/create_db.sql (utils/add_track_search_indexes.sql for existing
+# databases):
+#   track_search_document(track_name, artist_names)  'simple' tsvector, GIN index
+#   search_key(text)  lowercased, whitespace-collapsed text, B-tree index on
+#                     (search_key(track_name), search_key(artist_names))
+
+_WORD = re.compile(r"[^\W_]")
+
+
+def escape_like(value):
+    """Escapes LIKE/ILIKE wildcards so `value` matches literally."""
+    return value.replace("\\", "\\\\").replace("%", "\\%").replace("_", "\\_")
+
+
+def search_clause(search_query):
+    """
+    Returns a (WHERE condition, params) pair matching tracks whose title or
+    artists contain every word of `search_query` as a word prefix, e.g.
+    "da clu" matches "In Da Club". Queries without any word characters fall
+    back to an (unindexed) substring match.
+    """
+    if _WORD.search(search_query):
+        return (
+            "track_search_document(t.track_name, t.artist_names) @@ search_tsquery(%s)",
+            [search_query],
+        )
+    pattern = f"%{escape_like(search_query)}%"
+    return "(t.track_name ILIKE %s OR t.artist_names ILIKE %s)", [pattern, pattern]
+
+
+# Case- and whitespace-insensitive exact match on title and artists
+TRACK_EXISTS_QUERY = """
+    SELECT 1 FROM tracks
+    WHERE search_key(track_name) = search_key(%s)
+      AND search_key(artist_names) = search_key(%s)
+    LIMIT 1;
+"""
@@ -0,0 +1,469 @@
+"""
+Pull-based batch worker for the songs-to-process subscription.
+
+Usage: python -m cloud_run.batch_worker [--subscription NAME] [--max-in-flight N]
+       [--lookup-workers N] [--download-workers N] [--fingerprint-workers N]
+       [--batch-size SONGS]  (run from src/)
+
+Instead of one song per push request, messages are pulled many at a time and
+run through a pipeline of stages connected by bounded queues:
+
+    lookup       Spotify metadata and YouTube search, on I/O threads
+    download     audio download and decode, with bounded concurrency
+    fingerprint  peaks and fingerprints on a process pool
+    write        tracks and fingerprints of many songs per transaction
+
+With STREAMING_INGEST=1 the fingerprint processes stream each song straight
+from YouTube through the decoder instead, and the download stage is skipped.
+
+A message is acknowledged only after its song has been committed. Messages
+that can never be indexed (bad JSON, unknown song, no audio) are logged and
+acknowledged, like the push endpoint does; any other failure, including a
+failed DB write, nacks the message so Pub/Sub redelivers it. Ack deadlines of
+in-flight messages are extended until then, and per-stage queue depths are
+logged every `metrics_interval` seconds.
+"""
+
+import argparse
+import json
+import logging
+import os
+import queue
+import signal
+import threading
+import time
+from concurrent.futures import ProcessPoolExecutor
+from typing import Callable, Dict, List
+
+from google.api_core import exceptions as api_exceptions
+from google.cloud import pubsub_v1
+
+from abracadabra.recognize import fingerprint_audio, stream_and_fingerprint
+from cloud_run.main import fetch_youtube_video, get_fingerprint_db, get_track_metadata
+
+logger = logging.getLogger(__name__)
+
+PROJECT_ID = "cloud-computing-project-458205"
+SUBSCRIPTION_ID = "sub-songs-to-process"
+
+STAGES = ("lookup", "download", "fingerprint", "write")
+
+
+class SkipMessage(Exception):
+    """The message can never be indexed; it is acknowledged and dropped."""
+
+
+class Job:
+    """One Pub/Sub message on its way through the pipeline."""
+
+    def __init__(self, ack_id: str, message_id: str, data: bytes):
+        self.ack_id = ack_id
+        self.message_id = message_id
+        self.data = data
+        self.title = None
+        self.metadata = None
+        self.audio = None
+        self.fingerprints = None
+
+    def __repr__(self) -> str:
+        return f"<message {self.message_id}: {self.title!r}>"
+
+
+def lookup_song(job: Job) -> Dict:
+    """
+    Parses the message and resolves it to track metadata with a YouTube URL,
+    as the push endpoint does.
+    """
+    try:
+        song_info = json.loads(job.data.decode("utf-8"))
+    except (UnicodeDecodeError, json.JSONDecodeError) as e:
+        raise SkipMessage(f"invalid JSON: {e}")
+    title, artist = song_info.get("title"), song_info.get("artist")
+    if not (title and artist):
+        raise SkipMessage("title or artist is missing")
+    job.title = title
+
+    track_metadata = get_track_metadata(title, artist)
+    if not track_metadata:
+        raise SkipMessage(f"no metadata found for '{title}' by '{artist}'")
+    video_info = fetch_youtube_video(title, artist)
+    if not video_info:
+        raise SkipMessage(f"no YouTube video found for '{title}' by '{artist}'")
+    track_metadata["youtube_url"] = video_info["url"]
+    track_metadata["youtube_title"] = video_info["title"]
+    return track_metadata
+
+
+class BatchWorker:
+    """
+    Pulls messages from `subscription_path` and indexes them with `db`.
+    `lookup(job)` returns track metadata and `load_audio(url, key)` returns
+    (audio, sr) or None; both default to the production implementations.
+    """
+
+    def __init__(
+        self,
+        subscriber,
+        subscription_path: str,
+        db,
+        lookup: Callable = lookup_song,
+        load_audio: Callable = None,
+        lookup_workers: int = 8,
+        download_workers: int = 4,
+        fingerprint_workers: int = None,
+        batch_size: int = 16,
+        batch_linger: float = 2.0,
+        max_in_flight: int = 64,
+        lease_seconds: int = 120,
+        metrics_interval: float = 30.0,
+    ):
+        self.subscriber = subscriber
+        self.subscription_path = subscription_path
+        self.db = db
+        self.lookup = lookup
+        self.load_audio = load_audio or type(db).load_audio
+        self.streaming = getattr(db, "streaming_ingest", False)
+        self.fingerprint_workers = fingerprint_workers or os.cpu_count() or 1
+        self.batch_size = batch_size
+        self.batch_linger = batch_linger
+        self.max_in_flight = max_in_flight
+        self.lease_seconds = lease_seconds
+        self.metrics_interval = metrics_interval
+
+        self.workers = {
+            "lookup": lookup_workers,
+            "download": download_workers,
+            "fingerprint": self.fingerprint_workers,
+            "write": 1,
+        }
+        # Bounded queues give backpressure: at most a few decoded songs wait
+        # for a fingerprint process, and at most two batches for the writer
+        self.queues = {
+            "lookup": queue.Queue(),
+            "download": queue.Queue(maxsize=2 * download_workers),
+            "fingerprint": queue.Queue(maxsize=2 * self.fingerprint_workers),
+            "write": queue.Queue(maxsize=2 * batch_size),
+        }
+        self.counters = {
+            stage: {"active": 0, "done": 0, "failed": 0} for stage in STAGES
+        }
+        self.acked = self.nacked = 0
+        self.in_flight = {}  # ack_id -> Job
+        self._lock = threading.Lock()
+        self._stopping = threading.Event()
+        self._process_pool = None
+
+    # --- Pub/Sub ---
+
+    def _claim(self, jobs: List[Job], outcome: str) -> List[str]:
+        """
+        Removes `jobs` from the in-flight set, returning the ack IDs of those
+        not acked or nacked yet.
+        """
+        with self._lock:
+            ack_ids = [
+                job.ack_id
+                for job in jobs
+                if self.in_flight.pop(job.ack_id, None) is not None
+            ]
+            setattr(self, outcome, getattr(self, outcome) + len(ack_ids))
+        return ack_ids
+
+    def _acknowledge(self, jobs: List[Job]) -> None:
+        ack_ids = self._claim(jobs, "acked")
+        if ack_ids:
+            self.subscriber.acknowledge(
+                request={"subscription": self.subscription_path, "ack_ids": ack_ids}
+            )
+
+    def _nack(self, jobs: List[Job]) -> None:
+        ack_ids = self._claim(jobs, "nacked")
+        if ack_ids:
+            self.subscriber.modify_ack_deadline(
+                request={
+                    "subscription": self.subscription_path,
+                    "ack_ids": ack_ids,
+                    "ack_deadline_seconds": 0,
+                }
+            )
+
+    def _extend_leases(self, ack_ids: List[str] = None) -> None:
+        if ack_ids is None:
+            with self._lock:
+                ack_ids = list(self.in_flight)
+        if ack_ids:
+            self.subscriber.modify_ack_deadline(
+                request={
+                    "subscription": self.subscription_path,
+                    "ack_ids": ack_ids,
+                    "ack_deadline_seconds": self.lease_seconds,
+                }
+            )
+
+    def _pull(self, max_messages: int) -> List[Job]:
+        try:
+            response = self.subscriber.pull(
+                request={
+                    "subscription": self.subscription_path,
+                    "max_messages": max_messages,
+                },
+                timeout=10,
+            )
+        except api_exceptions.DeadlineExceeded:
+            return []
+        jobs = [
+            Job(received.ack_id, received.message.message_id, received.message.data)
+            for received in response.received_messages
+        ]
+        with self._lock:
+            for job in jobs:
+                self.in_flight[job.ack_id] = job
+        # Songs take longer than the subscription's default ack deadline
+        self._extend_leases([job.ack_id for job in jobs])
+        return jobs
+
+    # --- Stages ---
+
+    def _lookup(self, job: Job) -> None:
+        job.metadata = self.lookup(job)
+        job.title = job.title or job.metadata.get("Track Name")
+
+    def _download(self, job: Job) -> None:
+        if self.streaming:
+            return  # Downloaded while it is fingerprinted
+        # The key only names the temporary download file
+        loaded = self.load_audio(job.metadata["youtube_url"], f"msg-{job.message_id}")
+        if loaded is None:
+            raise SkipMessage(
+                f"could not load audio from {job.metadata['youtube_url']}"
+            )
+        job.audio, _ = loaded
+
+    def _fingerprint(self, job: Job) -> None:
+        if self.streaming:
+            job.fingerprints = self._process_pool.submit(
+                stream_and_fingerprint,
+                type(self.db).stream_audio,
+                job.metadata["youtube_url"],
+            ).result()
+            return
+        audio, job.audio = job.audio, None
+        job.fingerprints = self._process_pool.submit(fingerprint_audio, audio).result()
+
+    def _run_stage(self, stage: str, fn: Callable, next_stage: str) -> None:
+        counters = self.counters[stage]
+        while True:
+            job = self.queues[stage].get()
+            if job is None:
+                return
+            if job.ack_id not in self.in_flight:
+                continue  # Nacked at shutdown
+            with self._lock:
+                counters["active"] += 1
+            try:
+                fn(job)
+                ok = True
+            except SkipMessage as e:
+                logger.warning(f"[{stage}] Dropping {job}: {e}")
+                self._acknowledge([job])
+                ok = False
+            except Exception as e:
+                logger.error(f"[{stage}] {job} failed, nacking: {e}")
+                self._nack([job])
+                ok = False
+            with self._lock:
+                counters["active"] -= 1
+                counters["done" if ok else "failed"] += 1
+            if ok:
+                self.queues[next_stage].put(job)
+
+    def _write_batch(self, batch: List[Job]) -> None:
+        batch = [job for job in batch if job.ack_id in self.in_flight]
+        if not batch:
+            return
+        counters = self.counters["write"]
+        with self._lock:
+            counters["active"] += len(batch)
+        try:
+            track_ids = self.db.load_songs_to_tracks([job.metadata for job in batch])
+            songs, written, skipped = {}, [], []
+            for job in batch:
+                track_id = track_ids.get(job.metadata.get("Track URI"))
+                if track_id is None:
+                    skipped.append(job)
+                    continue
+                # The same song requested twice is written once
+                songs[track_id] = (track_id, job.title, job.fingerprints)
+                written.append(job)
+            self.db.add_songs(list(songs.values()))
+        except Exception as e:
+            with self._lock:
+                counters["active"] -= len(batch)
+            if len(batch) > 1:
+                # Find the failing song instead of nacking the whole batch
+                logger.warning(f"[write] Batch of {len(batch)} failed ({e}), splitting")
+                for job in batch:
+                    self._write_batch([job])
+                return
+            logger.error(f"[write] Failed to write {batch[0]}, nacking: {e}")
+            self._nack(batch)
+            with self._lock:
+                counters["failed"] += 1
+            return
+        with self._lock:
+            counters["active"] -= len(batch)
+
+        self._acknowledge(written + skipped)
+        with self._lock:
+            counters["done"] += len(written)
+            counters["failed"] += len(skipped)
+        logger.info(
+            f"[write] Indexed {len(songs)} songs "
+            f"({sum(len(fps) for _, _, fps in songs.values())} fingerprints)"
+        )
+
+    def _run_writer(self) -> None:
+        """
+        Collects fingerprinted songs into batches of `batch_size`, writing a
+        partial batch once its first song has waited `batch_linger` seconds.
+        """
+        batch, deadline = [], None
+        while True:
+            timeout = max(deadline - time.monotonic(), 0) if batch else None
+            try:
+                job = self.queues["write"].get(timeout=timeout)
+            except queue.Empty:
+                self._write_batch(batch)
+                batch = []
+                continue
+            if job is None:
+                self._write_batch(batch)
+                return
+            if not batch:
+                deadline = time.monotonic() + self.batch_linger
+            batch.append(job)
+            if len(batch) >= self.batch_size:
+                self._write_batch(batch)
+                batch = []
+
+    # --- Control ---
+
+    def stats(self) -> Dict:
+        with self._lock:
+            stages = {
+                stage: dict(self.counters[stage], queued=self.queues[stage].qsize())
+                for stage in STAGES
+            }
+            in_flight = len(self.in_flight)
+        return {
+            "stages": stages,
+            "in_flight": in_flight,
+            "acked": self.acked,
+            "nacked": self.nacked,
+        }
+
+    def _log_stats(self) -> None:
+        stats = self.stats()
+        depths = ", ".join(
+            f"{stage} {s['queued']} queued/{s['active']} active"
+            for stage, s in stats["stages"].items()
+        )
+        logger.info(
+            f"[Batch Worker] {stats['in_flight']} in flight, {stats['acked']} acked, "
+            f"{stats['nacked']} nacked | {depths}"
+        )
+
+    def stop(self) -> None:
+        self._stopping.set()
+
+    def run(self, drain_timeout: float = 60.0, idle_exit: bool = False) -> None:
+        """
+        Pulls and processes messages until `stop` is called (or, with
+        `idle_exit`, until the subscription is empty). Pulled messages are
+        then given `drain_timeout` seconds to finish; the rest are nacked.
+        """
+        steps = {
+            "lookup": (self._lookup, "download"),
+            "download": (self._download, "fingerprint"),
+            "fingerprint": (self._fingerprint, "write"),
+        }
+        threads = [threading.Thread(target=self._run_writer, daemon=True)]
+        for stage, (fn, next_stage) in steps.items():
+            threads += [
+                threading.Thread(
+                    target=self._run_stage, args=(stage, fn, next_stage), daemon=True
+                )
+                for _ in range(self.workers[stage])
+            ]
+
+        self._process_pool = ProcessPoolExecutor(max_workers=self.fingerprint_workers)
+        for thread in threads:
+            thread.start()
+        last_lease = last_metrics = time.monotonic()
+        try:
+            while not self._stopping.is_set():
+                now = time.monotonic()
+                if now - last_lease >= self.lease_seconds / 3:
+                    self._extend_leases()
+                    last_lease = now
+                if now - last_metrics >= self.metrics_interval:
+                    self._log_stats()
+                    last_metrics = now
+
+                room = self.max_in_flight - len(self.in_flight)
+                if room <= 0:
+                    self._stopping.wait(0.5)
+                    continue
+                jobs = self._pull(room)
+                if not jobs and idle_exit and not self.in_flight:
+                    break
+                if not jobs:
+                    self._stopping.wait(1.0)
+                for job in jobs:
+                    self.queues["lookup"].put(job)
+
+            deadline = time.monotonic() + drain_timeout
+            while self.in_flight and time.monotonic() < deadline:
+                time.sleep(0.2)
+            with self._lock:
+                remaining = list(self.in_flight.values())
+            if remaining:
+                logger.warning(f"[Batch Worker] Nacking {len(remaining)} unfinished")
+                self._nack(remaining)
+            for stage in STAGES:
+                for _ in range(self.workers[stage]):
+                    self.queues[stage].put(None)
+        finally:
+            self._process_pool.shutdown(cancel_futures=True)
+            self._log_stats()
+
+
+if __name__ == "__main__":
+    logging.basicConfig(
+        level=logging.INFO, format="%(asctime)s - %(levelname)s - %(message)s"
+    )
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument(
+        "--subscription", default=os.getenv("SUBSCRIPTION_ID", SUBSCRIPTION_ID)
+    )
+    parser.add_argument("--max-in-flight", type=int, default=64)
+    parser.add_argument("--lookup-workers", type=int, default=8)
+    parser.add_argument("--download-workers", type=int, default=4)
+    parser.add_argument("--fingerprint-workers", type=int, default=None)
+    parser.add_argument("--batch-size", type=int, default=16)
+    args = parser.parse_args()
+
+    subscriber = pubsub_v1.SubscriberClient()
+    worker = BatchWorker(
+        subscriber,
+        subscriber.subscription_path(PROJECT_ID, args.subscription),
+        get_fingerprint_db(),
+        lookup_workers=args.lookup_workers,
+        download_workers=args.download_workers,
+        fingerprint_workers=args.fingerprint_workers,
+        batch_size=args.batch_size,
+        max_in_flight=args.max_in_flight,
+    )
+    for signum in (signal.SIGTERM, signal.SIGINT):
+        signal.signal(signum, lambda *_: worker.stop())
+    worker.run()
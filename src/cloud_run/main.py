@@ -5,8 +5,8 @@ import logging
 from cloud_run.spotify_handler import get_track_metadata
 from googleapiclient.discovery import build
 from googleapiclient.errors import HttpError
-from google.cloud import secretmanager
 
+from abracadabra import clients
 from abracadabra.database import create_fingerprint_db
 from abracadabra.recognize import index_single_song_gcp
 
@@ -19,23 +19,37 @@ logger = logging.getLogger(__name__)
 
 
 def get_secret(secret_id):
-    """Retrieve a secret from Google Secret Manager."""
+    """Retrieve a secret from Google Secret Manager (cached per process)."""
     try:
-        client = secretmanager.SecretManagerServiceClient()
-        project_id = "cloud-computing-project-458205"
-        name = f"projects/{project_id}/secrets/{secret_id}/versions/latest"
-        response = client.access_secret_version(request={"name": name})
-        return response.payload.data.decode("UTF-8")
+        return clients.get_secret(secret_id, "cloud-computing-project-458205")
     except Exception as e:
         logger.error(f"Error retrieving {secret_id} secret: {str(e)}")
         raise
 
 
+def create_youtube_client():
+    return build(
+        "youtube",
+        "v3",
+        developerKey=get_secret("YOUTUBE_API_KEY"),
+        cache_discovery=False,
+    )
+
+
+def get_fingerprint_db():
+    """The GCPFingerprintDB shared by all messages handled by this process."""
+    return clients.get_client(
+        "fingerprint_db",
+        lambda: create_fingerprint_db(db_type="gcp", hash_filter=False),
+        ttl=float("inf"),
+    )
+
+
 def fetch_youtube_video(title, artist):
     """Search for a YouTube video based on song title and artist."""
     try:
-        api_key = get_secret("YOUTUBE_API_KEY")
-        youtube = build("youtube", "v3", developerKey=api_key)
+        # httplib2, used by the API client, is not thread-safe
+        youtube = clients.get_client("youtube", create_youtube_client, per_thread=True)
 
         query = f"{title} {artist} official audio"
         search_response = (
@@ -135,7 +149,7 @@ def process_pubsub_message():
             # 3. Download m4a file from YouTube
             # 4. Create fingerprint of the audio file
             # 5. Upload song data and fingerprint to the database
-            db = create_fingerprint_db(db_type="gcp")
+            db = get_fingerprint_db()
             if not db:
                 logger.error("[Song Processor] Failed to create fingerprint database")
                 return "Internal Server Error: Database connection failed", 500
@@ -1,27 +1,18 @@
 import os
 import logging
 import spotipy
-from spotipy.oauth2 import SpotifyClientCredentials
+from spotipy.oauth2 import SpotifyClientCredentials, SpotifyOauthError
 from typing import Dict, Any, Optional
-from google.cloud import secretmanager
+
+from abracadabra import clients
 
 logger = logging.getLogger(__name__)
 
 
 def get_secret(secret_id: str) -> str:
-    """Retrieve secret from Google Cloud Secret Manager"""
+    """Retrieve secret from Google Cloud Secret Manager (cached per process)"""
     try:
-        # Create the Secret Manager client
-        client = secretmanager.SecretManagerServiceClient()
-
-        # Build the resource name of the secret version
-        name = f"projects/100420581963/secrets/{secret_id}/versions/latest"
-
-        # Access the secret version
-        response = client.access_secret_version(request={"name": name})
-
-        # Return the secret value
-        return response.payload.data.decode("UTF-8")
+        return clients.get_secret(secret_id, "100420581963")
 
     except Exception as e:
         logger.error(f"Error retrieving secret {secret_id}: {str(e)}")
@@ -30,7 +21,11 @@ def get_secret(secret_id: str) -> str:
 
 
 def create_spotify_client() -> spotipy.Spotify:
-    """Create and return a configured Spotify client"""
+    """
+    Create and return a configured Spotify client. Its credentials manager
+    keeps the access token and only requests a new one once it has expired,
+    so callers should reuse it through `get_spotify_client`.
+    """
     client_id = get_secret("SPOTIFY_CLIENT_ID")
     client_secret = get_secret("SPOTIFY_API")
 
@@ -48,6 +43,10 @@ def create_spotify_client() -> spotipy.Spotify:
     return spotipy.Spotify(client_credentials_manager=client_credentials_manager)
 
 
+def get_spotify_client() -> spotipy.Spotify:
+    return clients.get_client("spotify", create_spotify_client)
+
+
 def get_track_metadata(title: str, artist: str) -> Optional[Dict[str, Any]]:
     """
     Get comprehensive track metadata including genres
@@ -55,7 +54,7 @@ def get_track_metadata(title: str, artist: str) -> Optional[Dict[str, Any]]:
     Returns a dictionary with track details or None if not found
     """
     try:
-        sp = create_spotify_client()
+        sp = get_spotify_client()
 
         # Search for the track
         query = f"track:{title} artist:{artist}"
@@ -117,6 +116,11 @@ def get_track_metadata(title: str, artist: str) -> Optional[Dict[str, Any]]:
 
         return metadata
 
+    except SpotifyOauthError as e:
+        # Credentials were rotated or revoked: rebuild the client next time
+        logger.error(f"Spotify authentication failed: {str(e)}")
+        clients.invalidate("spotify")
+        return None
     except Exception as e:
         logger.error(f"Error getting track metadata: {str(e)}")
         return None
@@ -0,0 +1,8 @@
+-- Adds the unlogged staging table used by GCPFingerprintDB.add_songs (binary COPY
+-- bulk ingest) to an existing database. Rows only live for the transaction that
+-- copies them in, so the table needs no backfill.
+CREATE UNLOGGED TABLE IF NOT EXISTS fingerprints_staging (
+    song_id INTEGER NOT NULL,
+    hash BIGINT NOT NULL,
+    timestamp FLOAT NOT NULL
+);
@@ -0,0 +1,21 @@
+-- Adds the indexed_songs registry to an existing database and backfills it from
+-- fingerprints. Existing songs are recorded with param_version 1, the version of
+-- the fingerprints written before the registry existed.
+BEGIN;
+
+CREATE TABLE IF NOT EXISTS indexed_songs (
+    song_id INTEGER PRIMARY KEY REFERENCES tracks(track_id) ON DELETE CASCADE,
+    fingerprint_count INTEGER NOT NULL,
+    param_version INTEGER NOT NULL,
+    indexed_at TIMESTAMP WITH TIME ZONE DEFAULT CURRENT_TIMESTAMP
+);
+
+INSERT INTO indexed_songs (song_id, fingerprint_count, param_version, indexed_at)
+SELECT song_id, count(*), 1, max(created_at)
+FROM fingerprints
+GROUP BY song_id
+ON CONFLICT (song_id) DO NOTHING;
+
+COMMIT;
+
+ANALYZE indexed_songs;
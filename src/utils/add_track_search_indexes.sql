@@ -0,0 +1,26 @@
+-- Adds the track search functions and indexes (app_engine/utils_search.py) to an
+-- existing database. CONCURRENTLY keeps the tracks table writable meanwhile, so run
+-- this file outside a transaction (e.g. psql -f, not inside BEGIN/COMMIT).
+CREATE OR REPLACE FUNCTION search_key(value TEXT) RETURNS TEXT
+    LANGUAGE sql IMMUTABLE PARALLEL SAFE
+    AS $$ SELECT lower(regexp_replace(btrim(value), '\s+', ' ', 'g')) $$;
+
+CREATE OR REPLACE FUNCTION track_search_document(track_name TEXT, artist_names TEXT)
+    RETURNS tsvector
+    LANGUAGE sql IMMUTABLE PARALLEL SAFE
+    AS $$ SELECT to_tsvector('simple', coalesce(track_name, '') || ' ' || coalesce(artist_names, '')) $$;
+
+-- Every word of the query as a prefix, e.g. 'in da clu' -> 'in':* & 'da':* & 'clu':*
+CREATE OR REPLACE FUNCTION search_tsquery(query TEXT) RETURNS tsquery
+    LANGUAGE sql IMMUTABLE PARALLEL SAFE
+    AS $$
+        SELECT coalesce(string_agg(quote_literal(lexeme) || ':*', ' & '), '')::tsquery
+        FROM unnest(to_tsvector('simple', query))
+    $$;
+
+CREATE INDEX CONCURRENTLY IF NOT EXISTS idx_tracks_search_document
+    ON tracks USING gin (track_search_document(track_name, artist_names));
+CREATE INDEX CONCURRENTLY IF NOT EXISTS idx_tracks_search_key
+    ON tracks (search_key(track_name), search_key(artist_names));
+
+ANALYZE tracks;
@@ -0,0 +1,15 @@
+-- Adds the /list_songs/ keyset pagination indexes to an existing database.
+-- CONCURRENTLY keeps the tracks table writable meanwhile, so run this file
+-- outside a transaction (e.g. psql -f, not inside BEGIN/COMMIT).
+CREATE INDEX CONCURRENTLY IF NOT EXISTS idx_tracks_popularity_desc
+    ON tracks ((coalesce(popularity, 0)) DESC, (coalesce(track_name, '')), track_id);
+CREATE INDEX CONCURRENTLY IF NOT EXISTS idx_tracks_popularity_asc
+    ON tracks ((coalesce(popularity, 0)), (coalesce(track_name, '')), track_id);
+CREATE INDEX CONCURRENTLY IF NOT EXISTS idx_tracks_track_name
+    ON tracks ((coalesce(track_name, '')), track_id);
+CREATE INDEX CONCURRENTLY IF NOT EXISTS idx_tracks_release_date_desc
+    ON tracks ((coalesce(album_release_date, '-infinity'::date)) DESC, (coalesce(track_name, '')), track_id);
+CREATE INDEX CONCURRENTLY IF NOT EXISTS idx_tracks_release_date_asc
+    ON tracks ((coalesce(album_release_date, '-infinity'::date)), (coalesce(track_name, '')), track_id);
+
+ANALYZE tracks;
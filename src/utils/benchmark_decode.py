@@ -0,0 +1,59 @@
+"""
+Compares the pydub decode path previously used by the fingerprint backends with
+abracadabra.audio.decode_audio.
+
+Usage: python utils/benchmark_decode.py [audio files...]   (run from src/)
+Defaults to every .m4a file in ../songs.
+"""
+
+import os
+import sys
+import time
+import tracemalloc
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), "..")))
+
+import numpy as np
+from pydub import AudioSegment
+from abracadabra.audio import decode_audio
+
+
+def decode_with_pydub(path, sr=22050):
+    audio = AudioSegment.from_file(path)
+    audio = audio.set_channels(1).set_frame_rate(sr)
+    return np.array(audio.get_array_of_samples()).astype(np.float32) / 32768.0
+
+
+def measure(decode, path, repeats=3):
+    """Returns (best wall time in s, peak Python heap in MB, n_samples)."""
+    best = float("inf")
+    for _ in range(repeats):
+        start = time.perf_counter()
+        samples = decode(path)
+        best = min(best, time.perf_counter() - start)
+
+    tracemalloc.start()
+    samples = decode(path)
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return best, peak / 2**20, len(samples)
+
+
+if __name__ == "__main__":
+    song_dir = os.path.join(os.path.dirname(__file__), "../../songs")
+    paths = sys.argv[1:] or [
+        os.path.join(song_dir, f)
+        for f in sorted(os.listdir(song_dir))
+        if f.lower().endswith(".m4a")
+    ]
+
+    print(
+        f"{'file':40} {'decoder':8} {'time [s]':>9} {'peak [MB]':>10} {'samples':>10}"
+    )
+    for path in paths:
+        for name, decode in (("pydub", decode_with_pydub), ("ffmpeg", decode_audio)):
+            elapsed, peak_mb, n_samples = measure(decode, path)
+            print(
+                f"{os.path.basename(path)[:40]:40} {name:8} "
+                f"{elapsed:9.3f} {peak_mb:10.1f} {n_samples:10d}"
+            )
@@ -0,0 +1,79 @@
+"""
+Compares per-song execute_values inserts (GCPFingerprintDB.add_song) with the
+binary COPY bulk path (GCPFingerprintDB.add_songs) on synthetic fingerprints.
+
+Usage: python utils/benchmark_fingerprint_ingest.py <dsn> [n_songs] [fps_per_song]  (run from src/)
+
+Point it at a scratch PostgreSQL database (e.g. a local stand-in): the schema is
+recreated from create_db.sql, dropping any existing data.
+"""
+
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), "..")))
+
+import numpy as np
+from abracadabra.db_pool import ConnectionPool
+from abracadabra.fingerprint import FingerprintArrays
+from abracadabra.GCPFingerprintDB import GCPFingerprintDB
+
+
+def make_songs(n_songs, fps_per_song, seed=0):
+    rng = np.random.default_rng(seed)
+    songs = []
+    for song_id in range(1, n_songs + 1):
+        fps = FingerprintArrays(
+            f1=rng.integers(0, 1025, fps_per_song),
+            f2=rng.integers(0, 1025, fps_per_song),
+            delta_t=rng.integers(0, 201, fps_per_song),
+            timestamp=np.sort(rng.integers(0, 10_000, fps_per_song)),
+        )
+        songs.append((song_id, f"song {song_id}", fps))
+    return songs
+
+
+def reset_schema(db, n_songs):
+    schema_path = os.path.join(os.path.dirname(__file__), "create_db.sql")
+    with db.pool.connection() as conn, conn.cursor() as cur:
+        cur.execute(open(schema_path).read())
+        cur.execute(
+            "INSERT INTO tracks (track_id, track_name) "
+            "SELECT i, 'song ' || i FROM generate_series(1, %s) AS i;",
+            (n_songs,),
+        )
+
+
+def run(label, db, songs, ingest):
+    start = time.perf_counter()
+    ingest(db, songs)
+    elapsed = time.perf_counter() - start
+    n_rows = sum(len(fps) for _, _, fps in songs)
+    print(f"{label:28} {elapsed:8.2f}s {n_rows / elapsed:12.0f} rows/s")
+
+
+def ingest_per_song(db, songs):
+    for song_id, title, fps in songs:
+        db.add_song(song_id, title, fps)
+
+
+def ingest_copy(db, songs, batch_size=16):
+    for start in range(0, len(songs), batch_size):
+        stop = start + batch_size
+        db.add_songs(songs[start:stop])
+
+
+if __name__ == "__main__":
+    dsn = sys.argv[1]
+    n_songs = int(sys.argv[2]) if len(sys.argv) > 2 else 50
+    fps_per_song = int(sys.argv[3]) if len(sys.argv) > 3 else 20_000
+
+    db = GCPFingerprintDB(pool=ConnectionPool(minconn=1, maxconn=2, dsn=dsn))
+    songs = make_songs(n_songs, fps_per_song)
+    print(f"{n_songs} songs x {fps_per_song} fingerprints")
+
+    reset_schema(db, n_songs)
+    run("execute_values + ON CONFLICT", db, songs, ingest_per_song)
+    reset_schema(db, n_songs)
+    run("binary COPY + merge", db, songs, ingest_copy)
@@ -0,0 +1,108 @@
+"""
+Times the /list_songs/ search and the /push_to_pub_sub existence check on a
+synthetic tracks table, with the old leading-wildcard ILIKE queries and with
+the indexed ones from app_engine/utils_search.py.
+
+Usage: python utils/benchmark_track_search.py <dsn> [n_tracks]  (run from src/)
+
+Point it at a scratch PostgreSQL database: the schema is recreated from
+create_db.sql, dropping any existing data. n_tracks defaults to 1,000,000.
+"""
+
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), "..")))
+
+import psycopg2
+from app_engine.utils_search import TRACK_EXISTS_QUERY, search_clause
+
+# Titles and artists are drawn from this vocabulary, so the sample queries
+# below match a realistic fraction of the table
+WORDS = (
+    "love night heart fire dream baby girl time life world summer rain city "
+    "dance light blue black gold wild young star moon river road home club "
+    "crazy money street king queen ghost angel devil paradise broken"
+).split()
+
+SEARCHES = ["club", "in da club", "lov", "broken heart", "paradise city"]
+ROUNDS = 5
+
+
+def make_tracks(cur, n_tracks):
+    schema_path = os.path.join(os.path.dirname(__file__), "create_db.sql")
+    cur.execute(open(schema_path).read())
+    cur.execute(
+        """
+        INSERT INTO tracks (original_track_uri, track_name, artist_names, popularity)
+        SELECT
+            'synthetic:' || i,
+            initcap(w[1 + i %% n] || ' ' || w[1 + (i / n) %% n] || ' ' || w[1 + (i / n / n) %% n]),
+            initcap(w[1 + (i / 7) %% n] || ' ' || w[1 + (i / 11) %% n]),
+            i %% 100
+        FROM generate_series(1, %s) AS i,
+             (SELECT w, array_length(w, 1) AS n FROM (SELECT %s::text[] AS w) AS v) AS vocabulary;
+        """,
+        (n_tracks, WORDS + ["in", "da", "the", "of", "my", "your", "on"]),
+    )
+    cur.execute("ANALYZE tracks;")
+
+
+def timed(cur, query, params):
+    start = time.perf_counter()
+    for _ in range(ROUNDS):
+        cur.execute(query, params)
+        cur.fetchall()
+    return (time.perf_counter() - start) / ROUNDS * 1000
+
+
+def list_query(where):
+    return (
+        f"SELECT track_id, track_name FROM tracks t WHERE {where} "
+        "ORDER BY coalesce(t.popularity, 0) DESC, coalesce(t.track_name, ''), t.track_id "
+        "LIMIT 20;"
+    )
+
+
+def count_query(where):
+    return f"SELECT count(*) FROM tracks t WHERE {where};"
+
+
+def run(cur):
+    ilike = "(t.track_name ILIKE %s OR t.artist_names ILIKE %s)"
+    print(f"{'query':34} {'ILIKE ms':>10} {'indexed ms':>11} {'rows':>9}")
+    for q in SEARCHES:
+        where, params = search_clause(q)
+        for label, build in (("page", list_query), ("count", count_query)):
+            old = timed(cur, build(ilike), (f"%{q}%", f"%{q}%"))
+            new = timed(cur, build(where), params)
+            cur.execute(count_query(where), params)
+            (n_rows,) = cur.fetchone()
+            print(f"{label + ' ' + repr(q):34} {old:10.1f} {new:11.1f} {n_rows:9}")
+
+    cur.execute(
+        "SELECT track_name, artist_names FROM tracks ORDER BY track_id DESC LIMIT 1;"
+    )
+    title, artist = cur.fetchone()
+    old = timed(
+        cur,
+        "SELECT 1 FROM tracks WHERE track_name ILIKE %s AND artist_names ILIKE %s",
+        (title.upper(), artist),
+    )
+    new = timed(cur, TRACK_EXISTS_QUERY, (title.upper(), artist))
+    print(f"{'exists ' + repr(title):34} {old:10.1f} {new:11.1f}")
+
+
+if __name__ == "__main__":
+    dsn = sys.argv[1]
+    n_tracks = int(sys.argv[2]) if len(sys.argv) > 2 else 1_000_000
+
+    conn = psycopg2.connect(dsn)
+    conn.autocommit = True
+    with conn.cursor() as cur:
+        start = time.perf_counter()
+        make_tracks(cur, n_tracks)
+        print(f"{n_tracks} tracks created in {time.perf_counter() - start:.1f}s")
+        run(cur)
+    conn.close()
@@ -1,4 +1,10 @@
 -- Drop tables if they exist to ensure a clean setup (optional)
+DROP TABLE IF EXISTS fingerprints_v2_migration;
+DROP TABLE IF EXISTS fingerprints_v2;
+DROP TABLE IF EXISTS indexed_songs_v2;
+DROP TABLE IF EXISTS indexed_songs;
+DROP TABLE IF EXISTS fingerprints_staging;
+DROP TABLE IF EXISTS fingerprints;
 DROP TABLE IF EXISTS track_genres;
 DROP TABLE IF EXISTS genres;
 DROP TABLE IF EXISTS tracks;
@@ -34,6 +40,52 @@ CREATE TABLE track_genres (
     PRIMARY KEY (track_id, genre_id) -- Composite primary key to ensure unique track-genre pairings
 );
 
+-- Table to store audio fingerprints of indexed tracks
+CREATE TABLE fingerprints (
+    fingerprint_id SERIAL PRIMARY KEY,
+    song_id INTEGER NOT NULL REFERENCES tracks(track_id) ON DELETE CASCADE,
+    hash BIGINT NOT NULL, -- f1 << 40 | f2 << 20 | delta_t, see abracadabra.fingerprint.pack_hash
+    timestamp FLOAT NOT NULL, -- Anchor time in STFT frames
+    created_at TIMESTAMP WITH TIME ZONE DEFAULT CURRENT_TIMESTAMP,
+    UNIQUE (song_id, hash, timestamp)
+);
+
+-- Registry of indexed songs, maintained by GCPFingerprintDB.add_song(s) in the same
+-- transaction as their fingerprints
+CREATE TABLE indexed_songs (
+    song_id INTEGER PRIMARY KEY REFERENCES tracks(track_id) ON DELETE CASCADE,
+    fingerprint_count INTEGER NOT NULL,
+    param_version INTEGER NOT NULL, -- abracadabra.fingerprint.FINGERPRINT_PARAM_VERSION
+    indexed_at TIMESTAMP WITH TIME ZONE DEFAULT CURRENT_TIMESTAMP
+);
+
+-- Unlogged staging table for COPY-based bulk fingerprint ingest (GCPFingerprintDB.add_songs);
+-- utils/add_fingerprints_staging.sql adds it to an existing database
+CREATE UNLOGGED TABLE fingerprints_staging (
+    song_id INTEGER NOT NULL,
+    hash BIGINT NOT NULL,
+    timestamp FLOAT NOT NULL
+);
+
+-- Track search (see app_engine/utils_search.py): a 'simple' full-text document over
+-- title and artists for /list_songs/, and a normalized key for exact lookups
+CREATE OR REPLACE FUNCTION search_key(value TEXT) RETURNS TEXT
+    LANGUAGE sql IMMUTABLE PARALLEL SAFE
+    AS $$ SELECT lower(regexp_replace(btrim(value), '\s+', ' ', 'g')) $$;
+
+CREATE OR REPLACE FUNCTION track_search_document(track_name TEXT, artist_names TEXT)
+    RETURNS tsvector
+    LANGUAGE sql IMMUTABLE PARALLEL SAFE
+    AS $$ SELECT to_tsvector('simple', coalesce(track_name, '') || ' ' || coalesce(artist_names, '')) $$;
+
+-- Every word of the query as a prefix, e.g. 'in da clu' -> 'in':* & 'da':* & 'clu':*
+CREATE OR REPLACE FUNCTION search_tsquery(query TEXT) RETURNS tsquery
+    LANGUAGE sql IMMUTABLE PARALLEL SAFE
+    AS $$
+        SELECT coalesce(string_agg(quote_literal(lexeme) || ':*', ' & '), '')::tsquery
+        FROM unnest(to_tsvector('simple', query))
+    $$;
+
 -- Optional: Create a trigger to automatically update the updated_at timestamp on tracks table
 CREATE OR REPLACE FUNCTION update_modified_column()
 RETURNS TRIGGER AS $$
@@ -52,3 +104,19 @@ EXECUTE FUNCTION update_modified_column();
 CREATE INDEX IF NOT EXISTS idx_tracks_artist_names ON tracks(artist_names);
 CREATE INDEX IF NOT EXISTS idx_tracks_album_name ON tracks(album_name);
 CREATE INDEX IF NOT EXISTS idx_genres_genre_name ON genres(genre_name);
+CREATE INDEX IF NOT EXISTS idx_tracks_search_document
+    ON tracks USING gin (track_search_document(track_name, artist_names));
+CREATE INDEX IF NOT EXISTS idx_tracks_search_key
+    ON tracks (search_key(track_name), search_key(artist_names));
+-- Keyset pagination indexes for /list_songs/, one per sort_by ordering (see app_engine.utils_db.SORT_ORDERS)
+CREATE INDEX IF NOT EXISTS idx_tracks_popularity_desc
+    ON tracks ((coalesce(popularity, 0)) DESC, (coalesce(track_name, '')), track_id);
+CREATE INDEX IF NOT EXISTS idx_tracks_popularity_asc
+    ON tracks ((coalesce(popularity, 0)), (coalesce(track_name, '')), track_id);
+CREATE INDEX IF NOT EXISTS idx_tracks_track_name
+    ON tracks ((coalesce(track_name, '')), track_id);
+CREATE INDEX IF NOT EXISTS idx_tracks_release_date_desc
+    ON tracks ((coalesce(album_release_date, '-infinity'::date)) DESC, (coalesce(track_name, '')), track_id);
+CREATE INDEX IF NOT EXISTS idx_tracks_release_date_asc
+    ON tracks ((coalesce(album_release_date, '-infinity'::date)), (coalesce(track_name, '')), track_id);
+CREATE INDEX IF NOT EXISTS idx_fingerprints_hash ON fingerprints(hash);
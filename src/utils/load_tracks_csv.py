@@ -0,0 +1,43 @@
+"""
+Loads a tracks CSV (e.g. data/top_songs_curated.csv) into the tracks, genres
+and track_genres tables in one transaction via
+GCPFingerprintDB.load_songs_to_tracks.
+
+Usage: python utils/load_tracks_csv.py [csv_path] [--dsn DSN]  (run from src/)
+"""
+
+import argparse
+import csv
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), "..")))
+
+from abracadabra.db_pool import ConnectionPool
+from abracadabra.GCPFingerprintDB import GCPFingerprintDB
+
+DEFAULT_CSV = os.path.join(
+    os.path.dirname(__file__), "..", "..", "data", "top_songs_curated.csv"
+)
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("csv_path", nargs="?", default=DEFAULT_CSV)
+    parser.add_argument(
+        "--dsn", help="PostgreSQL DSN (default: credentials from Secret Manager)"
+    )
+    args = parser.parse_args()
+
+    if args.dsn:
+        db = GCPFingerprintDB(pool=ConnectionPool(minconn=1, maxconn=1, dsn=args.dsn))
+    else:
+        db = GCPFingerprintDB()
+
+    with open(args.csv_path, newline="", encoding="utf-8") as f:
+        rows = list(csv.DictReader(f))
+
+    start = time.perf_counter()
+    track_ids = db.load_songs_to_tracks(rows)
+    elapsed = time.perf_counter() - start
+    print(f"Loaded {len(track_ids)} of {len(rows)} rows in {elapsed:.2f}s")
@@ -0,0 +1,19 @@
+-- Migrates fingerprints.hash from the legacy "(f1, f2, delta_t)" text key to the
+-- packed BIGINT hash (f1 << 40 | f2 << 20 | delta_t) used by abracadabra.fingerprint.pack_hash.
+-- The column is rewritten in place; the unique constraint and idx_fingerprints_hash
+-- are rebuilt automatically by ALTER COLUMN ... TYPE.
+BEGIN;
+
+ALTER TABLE fingerprints
+    ALTER COLUMN hash TYPE BIGINT
+    USING (
+        (split_part(btrim(hash, '()'), ',', 1)::BIGINT << 40)
+        | (split_part(btrim(hash, '()'), ',', 2)::BIGINT << 20)
+        | split_part(btrim(hash, '()'), ',', 3)::BIGINT
+    );
+
+CREATE INDEX IF NOT EXISTS idx_fingerprints_hash ON fingerprints(hash);
+
+COMMIT;
+
+ANALYZE fingerprints;
@@ -0,0 +1,253 @@
+"""
+Copies the legacy `fingerprints` table into the hash-partitioned
+`fingerprints_v2` schema used by PartitionedGCPFingerprintDB.
+
+Usage: python utils/migrate_fingerprints_partitioned.py [--dsn DSN] [--partitions N]
+       [--batch-size ROWS] [--pause SECONDS]  (run from src/)
+
+Rows are copied in fingerprint_id order, one short transaction per batch, so
+the source table stays online and the copy can be stopped and restarted at
+any time: progress is kept in `fingerprints_v2_migration`. Both the legacy
+text hash "(f1, f2, delta_t)" and the packed BIGINT hash are accepted.
+
+The keyset on fingerprint_id misses rows of a transaction that commits
+after the copy has passed its ids, and songs re-indexed during the copy
+would keep their old rows, as fingerprints_v2 has no unique key. So once the
+rows are copied, a catch-up pass takes every song whose
+indexed_songs.indexed_at is not older than the migration (or the previous
+catch-up) and replaces its fingerprints_v2 rows with a fresh copy, which
+repeats while songs keep changing. The migration start is taken as the
+start of the oldest transaction open at the time, since indexed_at is the
+start of the writing transaction. Run the tool once more right before
+switching the application to db_type="gcp_partitioned" to catch up with
+the songs indexed since.
+"""
+
+import argparse
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), "..")))
+
+from abracadabra.db_pool import ConnectionPool
+from abracadabra.GCPFingerprintDB import GCPFingerprintDB
+from abracadabra.PartitionedGCPFingerprintDB import (
+    DEFAULT_PARTITIONS,
+    create_partitioned_schema,
+)
+
+PACKED_TEXT_HASH = """(
+    (split_part(btrim(hash, '()'), ',', 1)::BIGINT << 40)
+    | (split_part(btrim(hash, '()'), ',', 2)::BIGINT << 20)
+    | split_part(btrim(hash, '()'), ',', 3)::BIGINT
+)"""
+
+
+# Start of the oldest open transaction: whatever commits from now on was
+# written by a transaction that started at this time or later
+OLDEST_TRANSACTION_START = """
+    SELECT coalesce(min(xact_start), now()) FROM pg_stat_activity
+    WHERE xact_start IS NOT NULL;
+"""
+
+# Passes of the catch-up before leaving the songs still changing to the next run
+MAX_CATCH_UP_PASSES = 5
+
+
+def prepare(pool, n_partitions):
+    with pool.connection() as conn, conn.cursor() as cur:
+        create_partitioned_schema(cur, n_partitions)
+        cur.execute(OLDEST_TRANSACTION_START)
+        (started_at,) = cur.fetchone()
+        # changed_since: songs indexed from then on are replaced by the
+        # catch-up; a checkpoint from before it was tracked catches up on all
+        cur.execute(
+            """
+            CREATE TABLE IF NOT EXISTS fingerprints_v2_migration (
+                id INTEGER PRIMARY KEY CHECK (id = 1),
+                last_fingerprint_id BIGINT NOT NULL
+            );
+            ALTER TABLE fingerprints_v2_migration ADD COLUMN IF NOT EXISTS
+                changed_since TIMESTAMP WITH TIME ZONE NOT NULL DEFAULT '-infinity';
+            INSERT INTO fingerprints_v2_migration (id, last_fingerprint_id, changed_since)
+            VALUES (1, 0, %s) ON CONFLICT DO NOTHING;
+            """,
+            (started_at,),
+        )
+        cur.execute(
+            "SELECT data_type FROM information_schema.columns "
+            "WHERE table_name = 'fingerprints' AND column_name = 'hash';"
+        )
+        (hash_type,) = cur.fetchone()
+        cur.execute("SELECT last_fingerprint_id FROM fingerprints_v2_migration;")
+        (last_id,) = cur.fetchone()
+        cur.execute("SELECT coalesce(max(fingerprint_id), 0) FROM fingerprints;")
+        (max_id,) = cur.fetchone()
+    hash_expr = "hash" if hash_type == "bigint" else PACKED_TEXT_HASH
+    return hash_expr, last_id, max_id
+
+
+def copy_batch(pool, hash_expr, batch_size):
+    """
+    Copies the next `batch_size` rows and advances the checkpoint in the same
+    transaction. Returns (rows copied, new checkpoint).
+    """
+    with pool.connection() as conn, conn.cursor() as cur:
+        cur.execute(
+            f"""
+            WITH progress AS (
+                SELECT last_fingerprint_id FROM fingerprints_v2_migration FOR UPDATE
+            ), batch AS (
+                SELECT fingerprint_id, song_id, {hash_expr} AS hash, timestamp
+                FROM fingerprints
+                WHERE fingerprint_id > (SELECT last_fingerprint_id FROM progress)
+                ORDER BY fingerprint_id
+                LIMIT %s
+            ), copied AS (
+                INSERT INTO fingerprints_v2 (song_id, hash, t)
+                SELECT song_id, hash, round(timestamp)::INTEGER FROM batch
+            )
+            SELECT count(*), max(fingerprint_id) FROM batch;
+            """,
+            (batch_size,),
+        )
+        n_rows, last_id = cur.fetchone()
+        if n_rows:
+            cur.execute(
+                "UPDATE fingerprints_v2_migration SET last_fingerprint_id = %s;",
+                (last_id,),
+            )
+    return n_rows, last_id
+
+
+def catch_up(pool, hash_expr):
+    """
+    Replaces the fingerprints_v2 rows of the songs indexed since the
+    migration started (or since the previous catch-up) with a fresh copy of
+    their rows up to the checkpoint; later rows are left to copy_batch.
+    Returns the number of songs replaced.
+    """
+    with pool.connection() as conn, conn.cursor() as cur:
+        cur.execute(OLDEST_TRANSACTION_START)
+        (next_since,) = cur.fetchone()
+        cur.execute(
+            "SELECT last_fingerprint_id, changed_since "
+            "FROM fingerprints_v2_migration FOR UPDATE;"
+        )
+        last_id, changed_since = cur.fetchone()
+        cur.execute(
+            "SELECT song_id FROM indexed_songs WHERE indexed_at >= %s;",
+            (changed_since,),
+        )
+        song_ids = [song_id for (song_id,) in cur.fetchall()]
+        if song_ids:
+            cur.execute(
+                f"""
+                DELETE FROM fingerprints_v2 WHERE song_id = ANY(%(song_ids)s);
+                INSERT INTO fingerprints_v2 (song_id, hash, t)
+                SELECT song_id, {hash_expr}, round(timestamp)::INTEGER
+                FROM fingerprints
+                WHERE song_id = ANY(%(song_ids)s) AND fingerprint_id <= %(last_id)s;
+                """,
+                {"song_ids": song_ids, "last_id": last_id},
+            )
+        cur.execute(
+            "UPDATE fingerprints_v2_migration SET changed_since = %s;", (next_since,)
+        )
+    return len(song_ids)
+
+
+def copy_rows(pool, hash_expr, batch_size, pause):
+    """
+    Runs copy_batch until no rows are left. Returns the number of rows copied.
+    """
+    copied = 0
+    start = time.perf_counter()
+    while True:
+        n_rows, batch_last_id = copy_batch(pool, hash_expr, batch_size)
+        if not n_rows:
+            break
+        copied += n_rows
+        elapsed = time.perf_counter() - start
+        print(
+            f"  up to fingerprint_id {batch_last_id}: {copied} rows, "
+            f"{copied / elapsed:.0f} rows/s"
+        )
+        if pause:
+            time.sleep(pause)
+    return copied
+
+
+def migrate(pool, n_partitions, batch_size, pause):
+    hash_expr, last_id, max_id = prepare(pool, n_partitions)
+    print(f"Copying fingerprints {last_id + 1}..{max_id} into fingerprints_v2")
+    copied = copy_rows(pool, hash_expr, batch_size, pause)
+
+    if has_registry(pool):
+        for _ in range(MAX_CATCH_UP_PASSES):
+            n_songs = catch_up(pool, hash_expr)
+            print(f"Caught up with {n_songs} songs indexed during the copy")
+            if not n_songs:
+                break
+            copied += copy_rows(pool, hash_expr, batch_size, pause)
+        else:
+            print("Songs are still being indexed; run again to catch up with them")
+    else:
+        print(
+            "No indexed_songs registry: songs re-indexed during the copy are not caught up"
+        )
+
+    register_songs(pool)
+    with pool.connection(autocommit=True) as conn, conn.cursor() as cur:
+        cur.execute("ANALYZE fingerprints_v2;")
+        cur.execute("ANALYZE indexed_songs_v2;")
+    print(f"Done: {copied} rows copied")
+
+
+def has_registry(pool):
+    with pool.connection(autocommit=True) as conn, conn.cursor() as cur:
+        cur.execute("SELECT to_regclass('indexed_songs') IS NOT NULL;")
+        (registry,) = cur.fetchone()
+    return registry
+
+
+def register_songs(pool):
+    """
+    Fills indexed_songs_v2 for the copied songs, keeping the parameter version
+    recorded in indexed_songs (1 for songs indexed before the registry).
+    """
+    registry = has_registry(pool)
+    with pool.connection() as conn, conn.cursor() as cur:
+        version = "s.param_version" if registry else "NULL"
+        source = "LEFT JOIN indexed_songs s USING (song_id)" if registry else ""
+        cur.execute(
+            f"""
+            INSERT INTO indexed_songs_v2 (song_id, fingerprint_count, param_version)
+            SELECT f.song_id, f.n, coalesce({version}, 1)
+            FROM (SELECT song_id, count(*) AS n FROM fingerprints_v2 GROUP BY song_id) f
+            {source}
+            ON CONFLICT (song_id) DO UPDATE SET
+                fingerprint_count = EXCLUDED.fingerprint_count,
+                param_version = EXCLUDED.param_version;
+            """
+        )
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument(
+        "--dsn", help="PostgreSQL DSN (default: credentials from Secret Manager)"
+    )
+    parser.add_argument("--partitions", type=int, default=DEFAULT_PARTITIONS)
+    parser.add_argument("--batch-size", type=int, default=50_000)
+    parser.add_argument(
+        "--pause", type=float, default=0.0, help="seconds to sleep between batches"
+    )
+    args = parser.parse_args()
+
+    if args.dsn:
+        pool = ConnectionPool(minconn=1, maxconn=1, dsn=args.dsn)
+    else:
+        pool = GCPFingerprintDB().pool
+    migrate(pool, args.partitions, args.batch_size, args.pause)
@@ -0,0 +1,254 @@
+"""
+Indexes every track of the `tracks` table in resumable, checkpointed batches.
+
+Usage: python utils/reindex_songs.py [--name NAME] [--batch-size TRACKS]
+       [--workers N] [--writers N] [--write-batch-size SONGS] [--restart]
+       [--force] [--db-type gcp|gcp_partitioned] [--audio-cache-dir DIR]
+       [--streaming] [--dsn DSN]  (run from src/)
+
+Tracks are walked in track_id order, `--batch-size` at a time, with the
+keyset watermark of GCPFingerprintDB.load_tracks_from_db(min_id=...), so no
+batch needs more than its own rows in memory. Each batch is downloaded and
+fingerprinted on a process pool of --workers, and written by --writers
+threads, one pooled connection and add_songs transaction per
+--write-batch-size songs. Once it is committed its last track_id is stored
+in `reindex_checkpoints` under `--name`, and a restarted run continues from
+there.
+
+Songs already indexed with the current FINGERPRINT_PARAM_VERSION are skipped
+(unless --force), which is checked per batch against the indexed_songs
+registry, so a batch interrupted halfway only redoes its missing songs.
+Songs that fail to download or fingerprint are reported and left behind;
+run again with --restart to retry them.
+
+SIGINT/SIGTERM finish the current batch, store its checkpoint and exit;
+a second signal aborts the batch.
+"""
+
+import argparse
+import os
+import signal
+import sys
+import threading
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), "..")))
+
+from abracadabra.database import create_fingerprint_db
+from abracadabra.db_pool import ConnectionPool
+from abracadabra.fingerprint import FINGERPRINT_PARAM_VERSION
+from abracadabra.recognize import format_throughput, index_songs_in_processes
+
+
+def prepare(pool, name, restart):
+    """
+    Creates the checkpoint of run `name` if needed (or resets it with
+    `restart`) and returns its track_id watermark.
+    """
+    with pool.connection() as conn, conn.cursor() as cur:
+        cur.execute(
+            """
+            CREATE TABLE IF NOT EXISTS reindex_checkpoints (
+                name TEXT PRIMARY KEY,
+                last_track_id INTEGER NOT NULL DEFAULT 0,
+                songs_indexed INTEGER NOT NULL DEFAULT 0,
+                songs_failed INTEGER NOT NULL DEFAULT 0,
+                updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+            );
+            """
+        )
+        if restart:
+            cur.execute("DELETE FROM reindex_checkpoints WHERE name = %s;", (name,))
+        cur.execute(
+            "INSERT INTO reindex_checkpoints (name) VALUES (%s) ON CONFLICT DO NOTHING;",
+            (name,),
+        )
+        cur.execute(
+            "SELECT last_track_id FROM reindex_checkpoints WHERE name = %s;", (name,)
+        )
+        (last_track_id,) = cur.fetchone()
+    return last_track_id
+
+
+def save_checkpoint(pool, name, last_track_id, n_indexed, n_failed):
+    with pool.connection() as conn, conn.cursor() as cur:
+        cur.execute(
+            """
+            UPDATE reindex_checkpoints SET
+                last_track_id = %s,
+                songs_indexed = songs_indexed + %s,
+                songs_failed = songs_failed + %s,
+                updated_at = CURRENT_TIMESTAMP
+            WHERE name = %s;
+            """,
+            (last_track_id, n_indexed, n_failed, name),
+        )
+
+
+def count_tracks(pool, min_id):
+    with pool.connection(autocommit=True) as conn, conn.cursor() as cur:
+        cur.execute(
+            "SELECT count(*) FROM tracks WHERE youtube_url != '' AND track_id > %s;",
+            (min_id,),
+        )
+        (n_tracks,) = cur.fetchone()
+    return n_tracks
+
+
+def format_duration(seconds):
+    minutes, seconds = divmod(int(seconds), 60)
+    hours, minutes = divmod(minutes, 60)
+    return f"{hours}h{minutes:02d}m" if hours else f"{minutes}m{seconds:02d}s"
+
+
+def reindex(
+    db,
+    name="default",
+    batch_size=200,
+    write_batch_size=16,
+    writers=1,
+    pool=None,
+    force=False,
+    restart=False,
+    stop=None,
+):
+    """
+    Indexes the tracks after the checkpoint of run `name` until they are all
+    done or `stop` (a threading.Event) is set, checkpointing after each batch.
+    """
+    stop = stop or threading.Event()
+    last_track_id = prepare(db.pool, name, restart)
+    n_total = count_tracks(db.pool, last_track_id)
+    print(f"Indexing {n_total} tracks after track_id {last_track_id} (run {name!r})")
+
+    n_walked = n_indexed = n_fingerprints = n_failed = 0
+    start = time.perf_counter()
+    while not stop.is_set():
+        tracks = db.load_tracks_from_db(min_id=last_track_id, limit=batch_size)
+        if not tracks:
+            break
+        skip = set()
+        if not force:
+            skip = set(
+                db.get_indexed_song_ids(
+                    param_version=FINGERPRINT_PARAM_VERSION,
+                    song_ids=[track_id for track_id, _, _ in tracks],
+                )
+            )
+        jobs = [
+            (track_id, youtube_url, track_name)
+            for track_id, track_name, youtube_url in tracks
+            if track_id not in skip
+        ]
+        result = index_songs_in_processes(
+            db,
+            jobs,
+            batch_size=write_batch_size,
+            pool=pool,
+            quiet=True,
+            writers=writers,
+        )
+
+        last_track_id = tracks[-1][0]
+        save_checkpoint(
+            db.pool, name, last_track_id, result["songs"], len(result["failed"])
+        )
+        n_walked += len(tracks)
+        n_indexed += result["songs"]
+        n_fingerprints += result["fingerprints"]
+        n_failed += len(result["failed"])
+
+        elapsed = time.perf_counter() - start
+        n_left = max(n_total - n_walked, 0)
+        eta = n_left * elapsed / n_walked
+        print(
+            f"  up to track_id {last_track_id}: {result['songs']} indexed, "
+            f"{len(skip)} skipped, {len(result['failed'])} failed | "
+            f"{format_throughput(n_indexed, n_fingerprints, elapsed)} | "
+            f"{n_left} tracks left, ETA {format_duration(eta)}"
+        )
+        if result["failed"]:
+            print(f"    failed track_ids: {sorted(result['failed'])}")
+
+    state = "Stopped" if stop.is_set() else "Done"
+    print(
+        f"{state} at track_id {last_track_id}: {n_walked} tracks, "
+        f"{n_indexed} indexed, {n_failed} failed"
+    )
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument(
+        "--name", default="default", help="checkpoint to resume (default: default)"
+    )
+    parser.add_argument(
+        "--batch-size", type=int, default=200, help="tracks per checkpoint"
+    )
+    parser.add_argument(
+        "--write-batch-size", type=int, default=16, help="songs per DB write"
+    )
+    parser.add_argument(
+        "--workers", type=int, default=None, help="download/fingerprint processes"
+    )
+    parser.add_argument(
+        "--writers", type=int, default=1, help="concurrent DB write transactions"
+    )
+    parser.add_argument(
+        "--restart", action="store_true", help="start again from the first track"
+    )
+    parser.add_argument(
+        "--force",
+        action="store_true",
+        help="also re-index songs already indexed with the current parameters",
+    )
+    parser.add_argument("--db-type", choices=("gcp", "gcp_partitioned"), default="gcp")
+    parser.add_argument("--audio-cache-dir", help="see abracadabra.audio_cache")
+    parser.add_argument(
+        "--streaming", action="store_true", help="fingerprint while downloading"
+    )
+    parser.add_argument(
+        "--dsn", help="PostgreSQL DSN (default: credentials from Secret Manager)"
+    )
+    args = parser.parse_args()
+
+    db_pool = None
+    if args.dsn:
+        db_pool = ConnectionPool(minconn=1, maxconn=args.writers + 1, dsn=args.dsn)
+    db = create_fingerprint_db(
+        args.db_type,
+        streaming_ingest=args.streaming or None,
+        audio_cache_dir=args.audio_cache_dir,
+        pool=db_pool,
+        hash_filter=False,
+    )
+
+    stop = threading.Event()
+
+    def request_stop(signum, frame):
+        if stop.is_set():
+            raise KeyboardInterrupt
+        print("Stopping after the current batch (signal again to abort it)")
+        stop.set()
+
+    signal.signal(signal.SIGINT, request_stop)
+    signal.signal(signal.SIGTERM, request_stop)
+
+    # Workers ignore Ctrl-C, so that a graceful stop lets them finish the batch
+    with ProcessPoolExecutor(
+        max_workers=args.workers,
+        initializer=signal.signal,
+        initargs=(signal.SIGINT, signal.SIG_IGN),
+    ) as pool:
+        reindex(
+            db,
+            name=args.name,
+            batch_size=args.batch_size,
+            write_batch_size=args.write_batch_size,
+            writers=args.writers,
+            pool=pool,
+            force=args.force,
+            restart=args.restart,
+            stop=stop,
+        )
@@ -0,0 +1,50 @@
+import sys
+import os
+import functools
+import shutil
+import subprocess
+import threading
+from http.server import SimpleHTTPRequestHandler, ThreadingHTTPServer
+
+sys.path.insert(
+    0, os.path.abspath(os.path.join(os.path.dirname(__file__), "../../src"))
+)
+
+import numpy as np
+import pytest
+from abracadabra.audio import FFMPEG_BINARY, decode_audio, iter_decode_audio
+
+pytestmark = pytest.mark.skipif(
+    shutil.which(FFMPEG_BINARY) is None, reason="ffmpeg is not installed"
+)
+
+
+class QuietHandler(SimpleHTTPRequestHandler):
+    def log_message(self, *args):
+        pass
+
+
+def test_iter_decode_audio_streams_over_http(tmp_path):
+    path = str(tmp_path / "tone.m4a")
+    subprocess.run(
+        [FFMPEG_BINARY, "-v", "error", "-f", "lavfi", "-i", "sine=f=440:d=4", path],
+        check=True,
+    )
+    server = ThreadingHTTPServer(
+        ("127.0.0.1", 0), functools.partial(QuietHandler, directory=str(tmp_path))
+    )
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    try:
+        url = f"http://127.0.0.1:{server.server_address[1]}/tone.m4a"
+        chunks = list(iter_decode_audio(url, chunk_seconds=0.5))
+        with open(path, "rb") as f:
+            piped = np.concatenate(list(iter_decode_audio(f)))
+
+        expected = decode_audio(path)
+        assert len(chunks) > 1 and all(chunk.dtype == np.float32 for chunk in chunks)
+        assert np.array_equal(np.concatenate(chunks), expected)
+        assert np.array_equal(piped, expected)
+        with pytest.raises(RuntimeError):
+            list(iter_decode_audio(url + ".missing"))
+    finally:
+        server.shutdown()
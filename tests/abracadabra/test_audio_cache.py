@@ -0,0 +1,100 @@
+import sys
+import os
+
+sys.path.insert(
+    0, os.path.abspath(os.path.join(os.path.dirname(__file__), "../../src"))
+)
+
+import pickle
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+from abracadabra.audio_cache import AudioCache, source_key
+from abracadabra.fingerprint import FINGERPRINT_PARAM_VERSION
+from abracadabra.recognize import cached_fingerprint
+
+URL = "https://www.youtube.com/watch?v=dQw4w9WgXcQ"
+
+
+def make_audio(seed=0, seconds=5):
+    rng = np.random.default_rng(seed)
+    return (1.2 * rng.standard_normal(22050 * seconds)).astype(np.float32)
+
+
+def test_audio_round_trip(tmp_path):
+    cache = AudioCache(str(tmp_path))
+    audio = make_audio()
+    assert cache.get_audio(URL) is None
+
+    digest = cache.put_audio(URL, audio)
+    assert source_key(URL) == "yt-dQw4w9WgXcQ"
+    assert cache.get_audio_hash(URL) == digest
+    # Samples beyond +-1 survive the 24-bit FLAC round trip unclipped
+    restored = cache.get_audio(URL)
+    np.testing.assert_allclose(restored, audio, atol=np.abs(audio).max() * 2**-22)
+
+
+def test_cached_fingerprint_loads_once_per_version(tmp_path):
+    cache = AudioCache(str(tmp_path))
+    audio = make_audio()
+    loads = []
+
+    def load():
+        loads.append(URL)
+        return iter(np.array_split(audio, 7))
+
+    first = cached_fingerprint(cache, URL, load)
+    second = cached_fingerprint(cache, URL, load)
+    assert len(loads) == 1
+    assert np.array_equal(first.hashes, second.hashes)
+
+    # A new parameter version refingerprints the cached audio without loading
+    digest = cache.get_audio_hash(URL)
+    os.remove(tmp_path / "fingerprints" / f"{digest}-v{FINGERPRINT_PARAM_VERSION}.npz")
+    third = cached_fingerprint(cache, URL, load)
+    assert len(loads) == 1
+    assert len(third.hashes) > 0
+
+
+def test_evicts_least_recently_used(tmp_path):
+    cache = AudioCache(str(tmp_path), max_bytes=2**40)
+    for i in range(3):
+        cache.put_audio(f"song-{i}.mp3", make_audio(i, seconds=2))
+    os.utime(tmp_path / "sources" / f"{source_key('song-0.mp3')}.json", (0, 0))
+    cache.get_audio("song-0.mp3")  # Touched again: now the most recent
+
+    cache.max_bytes = cache.size() * 3 // 4
+    cache.evict()
+    assert cache.size() <= cache.max_bytes
+    assert cache.get_audio("song-0.mp3") is not None
+    assert cache.get_audio("song-1.mp3") is None
+
+
+def test_writes_only_scan_when_over_the_limit(tmp_path, monkeypatch):
+    cache = AudioCache(str(tmp_path), max_bytes=2**40)
+    scans = []
+    files = cache._files
+    monkeypatch.setattr(cache, "_files", lambda: scans.append(1) or files())
+
+    for i in range(5):
+        cache.put_audio(f"song-{i}.mp3", make_audio(i, seconds=1))
+    assert scans == []
+    assert cache._size == cache.size()
+
+    cache.max_bytes = cache._size // 2
+    cache.put_audio("song-5.mp3", make_audio(5, seconds=1))
+    assert cache.size() <= cache.max_bytes * cache.low_water
+    assert cache._size == cache.size()
+
+
+def test_concurrent_writes_of_one_key(tmp_path):
+    cache = AudioCache(str(tmp_path))
+    signals = [np.full(22050, i / 10, dtype=np.float32) for i in range(1, 9)]
+    with ThreadPoolExecutor(max_workers=8) as pool:
+        list(pool.map(lambda audio: cache.put_audio("song.m4a", audio), signals))
+
+    # Each write renamed its own complete file into place
+    assert not list(tmp_path.glob("*/*.tmp"))
+    audio = cache.get_audio("song.m4a")
+    assert any(np.allclose(audio, signal, atol=1e-4) for signal in signals)
+    assert pickle.loads(pickle.dumps(cache))._size == cache._size
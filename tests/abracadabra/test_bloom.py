@@ -0,0 +1,50 @@
+import sys
+import os
+
+sys.path.insert(
+    0, os.path.abspath(os.path.join(os.path.dirname(__file__), "../../src"))
+)
+
+import numpy as np
+from abracadabra.bloom import BloomFilter
+from abracadabra.fingerprint import pack_hash
+
+
+def test_bloom_filter_has_no_false_negatives_and_few_false_positives(tmp_path):
+    rng = np.random.default_rng(0)
+    keys = pack_hash(
+        rng.integers(0, 1025, 50_000),
+        rng.integers(0, 1025, 50_000),
+        rng.integers(0, 201, 50_000),
+    )
+    others = pack_hash(
+        rng.integers(0, 1025, 50_000),
+        rng.integers(0, 1025, 50_000),
+        rng.integers(201, 400, 50_000),
+    )
+    bloom = BloomFilter.for_capacity(len(keys), error_rate=0.01)
+    bloom.add(keys)
+
+    assert bloom.might_contain(keys).all()
+    assert bloom.might_contain(others).mean() < 0.01
+
+    path = str(tmp_path / "hashes.bloom")
+    bloom.save(path)
+    loaded = BloomFilter.load(path)
+    assert len(loaded) == len(keys)
+    np.testing.assert_array_equal(
+        loaded.might_contain(others), bloom.might_contain(others)
+    )
+
+
+def test_bloom_filter_rate_ignores_repeated_keys():
+    keys = np.arange(10_000, dtype=np.int64)
+    bloom = BloomFilter.for_capacity(len(keys), error_rate=0.01)
+    bloom.add(keys)
+    rate = bloom.false_positive_rate()
+    assert 0 < rate < 0.01
+
+    for _ in range(5):
+        bloom.add(keys)
+    assert len(bloom) == 6 * len(keys)
+    assert bloom.false_positive_rate() == rate
@@ -0,0 +1,50 @@
+import sys
+import os
+
+sys.path.insert(
+    0, os.path.abspath(os.path.join(os.path.dirname(__file__), "../../src"))
+)
+
+import numpy as np
+from abracadabra.cache import RecognitionCache, TTLCache
+from abracadabra.fingerprint import pack_hash
+
+
+def test_recognition_cache_hits_near_duplicate_queries():
+    rng = np.random.default_rng(0)
+    hashes = pack_hash(
+        rng.integers(0, 1025, 2000),
+        rng.integers(0, 1025, 2000),
+        rng.integers(0, 201, 2000),
+    )
+    cache = RecognitionCache(maxsize=2)
+    cache.store(cache.signature(hashes), [(7, 12, 40)])
+
+    # Same clip re-recorded: most hashes survive, some noise is added
+    noisy = np.concatenate([hashes[:1400], rng.integers(0, 2**50, 600)])
+    assert cache.lookup(cache.signature(noisy)) == [(7, 12, 40)]
+    assert cache.lookup(cache.signature(rng.integers(0, 2**50, 2000))) is None
+    assert (cache.hits, cache.misses) == (1, 1)
+
+    # Least recently used entries are evicted together with their buckets
+    cache.store(cache.signature(hashes + 1), [(8, 0, 10)])
+    cache.store(cache.signature(hashes + 2), [(9, 0, 10)])
+    assert len(cache) == 2
+    assert cache.lookup(cache.signature(hashes)) is None
+
+    songs = TTLCache(maxsize=1, ttl=0.0)
+    songs.put(1, {"track_name": "a"})
+    assert songs.get(1) is None
+
+
+def test_recognition_cache_skips_results_of_an_older_index():
+    from abracadabra.InMemoryFingerprintDB import InMemoryFingerprintDB
+
+    db = InMemoryFingerprintDB()
+    hashes = np.arange(500, dtype=np.int64)
+    cache = RecognitionCache()
+    cache.store(cache.signature(hashes), [(7, 12, 40)], db.index_generation)
+    assert cache.lookup(cache.signature(hashes), db.index_generation) == [(7, 12, 40)]
+
+    db.add_song(8, "new song", [])
+    assert cache.lookup(cache.signature(hashes), db.index_generation) is None
@@ -0,0 +1,57 @@
+import sys
+import os
+import threading
+from types import SimpleNamespace
+
+sys.path.insert(
+    0, os.path.abspath(os.path.join(os.path.dirname(__file__), "../../src"))
+)
+
+import pytest
+from abracadabra import clients
+
+
+class FakeSecretManager:
+    calls = 0
+
+    def access_secret_version(self, request):
+        FakeSecretManager.calls += 1
+        return SimpleNamespace(payload=SimpleNamespace(data=b"s3cret\n"))
+
+
+def test_clients_and_secrets_are_reused_until_their_ttl(monkeypatch):
+    monkeypatch.setattr(clients, "_entries", {})
+    monkeypatch.setattr(
+        clients.secretmanager, "SecretManagerServiceClient", FakeSecretManager
+    )
+    # Trailing whitespace is stripped once, for every caller
+    for _ in range(5):
+        assert clients.get_secret("TEST_SECRET", "project") == "s3cret"
+    assert FakeSecretManager.calls == 1
+
+    built = []
+    factory = lambda: built.append(object()) or built[-1]  # noqa: E731
+    assert clients.get_client("api", factory) is clients.get_client("api", factory)
+    assert len(built) == 1
+
+    # Expired: rebuilt, or kept when rebuilding fails
+    first = clients.get_client("short", factory, ttl=0)
+    assert clients.get_client("short", factory, ttl=0) is not first
+
+    def failing():
+        raise RuntimeError("quota exceeded")
+
+    kept = clients.get_client("short", failing, ttl=0)
+    assert kept is built[-1]
+    with pytest.raises(RuntimeError):
+        clients.get_client("missing", failing)
+
+    per_thread = []
+    thread = threading.Thread(
+        target=lambda: per_thread.append(
+            clients.get_client("http", factory, per_thread=True)
+        )
+    )
+    thread.start()
+    thread.join()
+    assert clients.get_client("http", factory, per_thread=True) is not per_thread[0]
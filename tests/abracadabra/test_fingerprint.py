@@ -0,0 +1,127 @@
+import sys
+import os
+
+
+sys.path.insert(
+    0, os.path.abspath(os.path.join(os.path.dirname(__file__), "../../src"))
+)
+
+from abracadabra.fingerprint import (
+    FingerprintArrays,
+    generate_fingerprints,
+    generate_fingerprint_arrays,
+    get_peak_array,
+    pack_hash,
+    to_fingerprint_arrays,
+    unpack_hash,
+)
+import numpy as np
+
+
+def reference_fingerprints(peaks, fan_value=5, min_delta=0, max_delta=200):
+    """
+    The original pairing loop, kept as a reference for the vectorized version.
+    """
+    fingerprints = []
+    for i in range(len(peaks)):
+        t1, f1 = peaks[i]
+        for j in range(1, fan_value + 1):
+            if i + j >= len(peaks):
+                break
+            t2, f2 = peaks[i + j]
+            delta_t = t2 - t1
+            if min_delta <= delta_t <= max_delta:
+                fingerprints.append(
+                    {
+                        "hash": {"f1": int(f1), "f2": int(f2), "delta_t": int(delta_t)},
+                        "timestamp": float(t1),
+                    }
+                )
+    return fingerprints
+
+
+def test_generate_fingerprint_arrays_matches_reference_loop():
+    rng = np.random.default_rng(0)
+    random_peaks = np.column_stack(
+        (rng.integers(0, 400, 300), rng.integers(0, 1025, 300))
+    )
+    random_peaks = random_peaks[np.lexsort((random_peaks[:, 0], random_peaks[:, 1]))]
+    cases = [
+        ([(0, 5), (3, 7), (1, 2), (250, 9), (251, 1), (260, 4), (262, 8)], {}),
+        (random_peaks, {}),
+        (random_peaks, {"fan_value": 1}),
+        (random_peaks, {"fan_value": 10}),
+        # Deltas exactly at the bounds are kept, negative ones only when allowed
+        ([(0, 1), (5, 2), (10, 3), (3, 4), (3, 5)], {"min_delta": 5, "max_delta": 5}),
+        ([(0, 1), (5, 2), (10, 3), (3, 4), (3, 5)], {"min_delta": -10}),
+        ([(0, 1), (0, 2), (0, 3)], {"max_delta": 0}),
+        ([(4, 1)], {}),
+    ]
+    for peaks, params in cases:
+        expected = reference_fingerprints(list(map(tuple, peaks)), **params)
+        fps = generate_fingerprint_arrays(peaks, **params)
+
+        assert len(fps) == len(expected)
+        assert generate_fingerprints(peaks, **params) == expected
+        reference = to_fingerprint_arrays(expected)
+        for column in ("f1", "f2", "delta_t", "timestamp"):
+            assert np.array_equal(getattr(fps, column), getattr(reference, column))
+
+
+def test_generate_fingerprint_arrays_new_peaks_only():
+    rng = np.random.default_rng(2)
+    # Unique times identify the peaks of every pair
+    peaks = np.column_stack((rng.permutation(300)[:120], rng.integers(0, 8, 120)))
+    peaks = peaks[np.lexsort((peaks[:, 0], peaks[:, 1]))]
+    new = peaks[:, 0] >= 200
+
+    full = generate_fingerprint_arrays(peaks)
+    new_times = set(peaks[new, 0].tolist())
+    keep = [
+        anchor in new_times or anchor + delta_t in new_times
+        for anchor, delta_t in zip(full.timestamp.tolist(), full.delta_t.tolist())
+    ]
+    partial = generate_fingerprint_arrays(peaks, new=new)
+    for column in FingerprintArrays._fields:
+        assert np.array_equal(getattr(partial, column), getattr(full, column)[keep])
+
+
+def test_generate_fingerprint_arrays_empty():
+    assert len(generate_fingerprint_arrays([])) == 0
+
+
+def test_pack_hash_roundtrip():
+    f1, f2, delta_t = (
+        np.array([0, 12, 1024]),
+        np.array([3, 1024, 0]),
+        np.array([5, 200, 1]),
+    )
+    packed = pack_hash(f1, f2, delta_t)
+
+    assert packed.dtype == np.int64
+    assert len(set(packed.tolist())) == 3
+    for original, unpacked in zip((f1, f2, delta_t), unpack_hash(packed)):
+        assert np.array_equal(original, unpacked)
+
+
+def test_get_peak_array_blocked_matches_full():
+    rng = np.random.default_rng(0)
+    audio = rng.standard_normal(22050 * 5).astype(np.float32)
+
+    full = get_peak_array(audio)
+    blocked = get_peak_array(audio, block_frames=32)
+
+    assert np.array_equal(full, blocked)
+
+
+def test_get_peak_array_stream_matches_full():
+    rng = np.random.default_rng(1)
+    # Getting 60 dB louder, so early blocks see a much lower running maximum
+    n_samples = 22050 * 6
+    audio = rng.standard_normal(n_samples) * np.geomspace(1e-3, 1, n_samples)
+    audio = audio.astype(np.float32)
+    chunks = iter(np.array_split(audio, 27))
+
+    assert np.array_equal(
+        get_peak_array(audio), get_peak_array(chunks, block_frames=32)
+    )
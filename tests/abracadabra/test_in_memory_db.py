@@ -0,0 +1,46 @@
+import sys
+import os
+
+
+sys.path.insert(
+    0, os.path.abspath(os.path.join(os.path.dirname(__file__), "../../src"))
+)
+
+from abracadabra.fingerprint import FingerprintArrays
+from abracadabra.InMemoryFingerprintDB import InMemoryFingerprintDB
+import numpy as np
+
+
+def make_fingerprints(f1, timestamp):
+    f1 = np.array(f1)
+    return FingerprintArrays(
+        f1=f1, f2=f1 + 1, delta_t=np.ones_like(f1), timestamp=np.array(timestamp)
+    )
+
+
+def test_get_matches_sees_buffered_and_merged_songs():
+    db = InMemoryFingerprintDB(merge_threshold=3)
+    db.add_song(1, "merged", make_fingerprints([10, 11, 12], [0, 1, 2]))
+    db.add_song(2, "buffered", make_fingerprints([11, 13], [5, 6]))
+
+    matches = db.get_matches(make_fingerprints([11, 13, 99], [1, 4, 0]))
+
+    assert sorted(matches) == [(1, 0), (2, 2), (2, 4)]
+    assert len(db) == 5
+
+
+def test_save_and_load_index(tmp_path):
+    db = InMemoryFingerprintDB()
+    db.add_song(1, "first", make_fingerprints([10, 11, 12], [0, 1, 2]))
+    db.add_song(2, "second", make_fingerprints([11, 13], [5, 6]))
+    query = make_fingerprints([11, 13], [1, 4])
+    path = str(tmp_path / "index.bin")
+    db.save(path)
+
+    for mmap in (True, False):
+        loaded = InMemoryFingerprintDB.load(path, mmap=mmap)
+        assert loaded.song_ids == db.song_ids
+        assert sorted(loaded.get_matches(query)) == sorted(db.get_matches(query))
+
+    loaded.add_song(3, "third", make_fingerprints([13], [9]))
+    assert (3, 5) in loaded.get_matches(query)
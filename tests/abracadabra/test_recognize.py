@@ -0,0 +1,85 @@
+import sys
+import os
+import shutil
+
+sys.path.insert(
+    0, os.path.abspath(os.path.join(os.path.dirname(__file__), "../../src"))
+)
+
+import numpy as np
+import pytest
+from scipy.io import wavfile
+from abracadabra.audio import FFMPEG_BINARY, decode_audio
+from abracadabra.fingerprint import generate_fingerprint_arrays, get_peak_array
+from abracadabra.InMemoryFingerprintDB import InMemoryFingerprintDB
+from abracadabra.cache import RecognitionCache
+from abracadabra.recognize import recognize_song_incremental
+
+pytestmark = pytest.mark.skipif(
+    shutil.which(FFMPEG_BINARY) is None, reason="ffmpeg is not installed"
+)
+
+SR = 22050
+
+
+def make_song(seed, seconds=20):
+    """Random chords of 0.25 s over faint noise."""
+    rng = np.random.default_rng(seed)
+    t = np.arange(int(0.25 * SR)) / SR
+    chords = [
+        sum(np.sin(2 * np.pi * f * t) for f in rng.uniform(200, 4000, 3)) / 3
+        for _ in range(int(seconds / 0.25))
+    ]
+    # Some noise, as pure tones give flat peaks that rounding splits up
+    audio = 0.5 * np.concatenate(chords) + 1e-3 * rng.standard_normal(
+        len(t) * len(chords)
+    )
+    return audio.astype(np.float32)
+
+
+def test_incremental_recognition_after_a_quiet_lead_in(tmp_path):
+    db = InMemoryFingerprintDB()
+    songs = {1: make_song(1), 2: make_song(2)}
+    for song_id, audio in songs.items():
+        db.add_song(
+            song_id,
+            f"song {song_id}",
+            generate_fingerprint_arrays(get_peak_array(audio)),
+        )
+
+    # Digital silence, then the clip fading in: early windows are picked
+    # against a running maximum far below the clip's
+    start, stop = 5 * SR, 15 * SR
+    clip = songs[2][start:stop].copy()
+    clip[: 6 * SR] *= 0.02
+    path = str(tmp_path / "query.wav")
+    wavfile.write(path, SR, np.concatenate((np.zeros(6 * SR, np.float32), clip)))
+
+    expected = db.get_top_matches(
+        generate_fingerprint_arrays(get_peak_array(decode_audio(path, sr=SR))), top_k=1
+    )[0]
+    result = recognize_song_incremental(
+        path, db=db, db_type="memory", stop_min_score=np.inf, window_bins=None
+    )
+    assert result == (2, expected[2])
+
+
+def test_cached_clips_sharing_an_opening_do_not_collide(tmp_path):
+    db = InMemoryFingerprintDB()
+    songs = {1: make_song(1), 2: make_song(2)}
+    for song_id, audio in songs.items():
+        db.add_song(
+            song_id,
+            f"song {song_id}",
+            generate_fingerprint_arrays(get_peak_array(audio)),
+        )
+
+    cache = RecognitionCache()
+    opening = make_song(3, seconds=3)
+    start, stop = 5 * SR, 12 * SR
+    for song_id, audio in songs.items():
+        path = str(tmp_path / f"query{song_id}.wav")
+        wavfile.write(path, SR, np.concatenate((opening, audio[start:stop])))
+        result = recognize_song_incremental(path, db=db, db_type="memory", cache=cache)
+        assert result[0] == song_id
+    assert cache.hits == 0
@@ -0,0 +1,29 @@
+import sys
+import os
+
+
+sys.path.insert(
+    0, os.path.abspath(os.path.join(os.path.dirname(__file__), "../../src"))
+)
+
+from abracadabra.scoring import match_confidence, rank_matches
+import numpy as np
+
+
+def test_rank_matches_best_bin_per_song():
+    song_ids = np.array([1, 1, 1, 2, 2, 3])
+    offsets = np.array([10, 10, 11, 5, 5, 0])
+
+    assert rank_matches(song_ids, offsets, top_k=2) == [(1, 10, 2), (2, 5, 2)]
+    # 10 and 11 fall into neighbouring bins but are scored together
+    assert rank_matches(song_ids, offsets, offset_tolerance=1)[0] == (1, 9, 3)
+    assert rank_matches(
+        np.array([1, 1, 1]), np.array([10, 11, 11]), offset_tolerance=1
+    )[0] == (1, 12, 3)
+    assert rank_matches(np.array([]), np.array([])) == []
+
+
+def test_match_confidence():
+    assert match_confidence([]) == 0.0
+    assert match_confidence([(1, 0, 40)]) == 1.0
+    assert match_confidence([(1, 0, 40), (2, 3, 10)]) == 0.75
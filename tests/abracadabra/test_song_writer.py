@@ -0,0 +1,54 @@
+import sys
+import os
+import threading
+import time
+from types import SimpleNamespace
+
+sys.path.insert(
+    0, os.path.abspath(os.path.join(os.path.dirname(__file__), "../../src"))
+)
+
+from abracadabra.recognize import SongWriter
+
+
+class FakeDB:
+    concurrent_writes = True
+
+    def __init__(self, maxconn=3):
+        self.pool = SimpleNamespace(maxconn=maxconn)
+        self.batches = []
+        self.active = self.max_active = 0
+        self.lock = threading.Lock()
+
+    def add_songs(self, songs):
+        with self.lock:
+            self.active += 1
+            self.max_active = max(self.max_active, self.active)
+        time.sleep(0.02)
+        with self.lock:
+            self.active -= 1
+            if any(song_id == 13 for song_id, _, _ in songs):
+                raise RuntimeError("write failed")
+            self.batches.append([song_id for song_id, _, _ in songs])
+
+
+def test_song_writer_batches_writes_on_concurrent_writers():
+    db = FakeDB()
+    with SongWriter(db, batch_size=4, writers=3) as writer:
+        for song_id in range(30):
+            writer.add(song_id, f"song {song_id}", [(1, 2, 3)] * song_id)
+
+    written = sorted(song_id for batch in db.batches for song_id in batch)
+    assert written == [song_id for song_id in range(30) if song_id != 13]
+    assert 1 < db.max_active <= 3
+    # Only the song that cannot be written is lost from its batch
+    assert writer.failed == [13]
+    assert writer.n_songs == 29
+    assert writer.n_fingerprints == sum(range(30)) - 13
+
+
+def test_song_writer_limits_writers():
+    db = FakeDB(maxconn=2)
+    assert SongWriter(db, writers=8).writers == 2
+    db.concurrent_writes = False
+    assert SongWriter(db, writers=8).writers == 1
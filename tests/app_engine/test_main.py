@@ -1,5 +1,7 @@
 import sys
 import os
+import base64
+import json
 
 
 sys.path.insert(
@@ -7,6 +9,7 @@ sys.path.insert(
 )
 
 from app_engine.main import app
+from app_engine.utils_db import decode_cursor, encode_cursor
 import pytest
 
 
@@ -26,3 +29,34 @@ def test_about(client):
     res = client.get("/about")
     assert res.status_code == 200
     assert b"About Us" in res.data
+
+
+def test_list_songs_cursor_roundtrip():
+    cursor = encode_cursor(["86", "In Da Club", "1"], backward=True, skip=20)
+    assert decode_cursor(cursor) == {
+        "keys": ["86", "In Da Club", "1"],
+        "backward": True,
+        "skip": 20,
+        "limit": None,
+    }
+    assert decode_cursor("not a cursor") is None
+
+
+@pytest.mark.parametrize(
+    "state",
+    [
+        [1, 2],
+        {"keys": "86"},
+        {"keys": [86]},
+        {"skip": "20"},
+        {"skip": -1},
+        {"backward": "yes"},
+        {"limit": "x"},
+        {"limit": 0},
+        {"limit": True},
+    ],
+)
+def test_list_songs_rejects_tampered_cursors(client, state):
+    cursor = base64.urlsafe_b64encode(json.dumps(state).encode()).decode()
+    assert decode_cursor(cursor) is None
+    assert client.get(f"/list_songs/?cursor={cursor}").status_code == 400
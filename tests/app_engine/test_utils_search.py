@@ -0,0 +1,22 @@
+import sys
+import os
+
+
+sys.path.insert(
+    0, os.path.abspath(os.path.join(os.path.dirname(__file__), "../../src"))
+)
+
+from app_engine.utils_search import escape_like, search_clause
+
+
+def test_search_clause_uses_full_text_for_words():
+    clause, params = search_clause("in da clu")
+    assert "@@ search_tsquery(%s)" in clause
+    assert params == ["in da clu"]
+
+
+def test_search_clause_falls_back_to_literal_ilike():
+    clause, params = search_clause("%_")
+    assert "ILIKE" in clause
+    assert params == ["%\\%\\_%", "%\\%\\_%"]
+    assert escape_like("a\\b") == "a\\\\b"
@@ -0,0 +1,98 @@
+import sys
+import os
+import json
+import threading
+from types import SimpleNamespace
+
+sys.path.insert(
+    0, os.path.abspath(os.path.join(os.path.dirname(__file__), "../../src"))
+)
+
+import numpy as np
+from cloud_run.batch_worker import BatchWorker, SkipMessage
+
+
+class FakeSubscriber:
+    def __init__(self, payloads):
+        self.pending = [
+            SimpleNamespace(
+                ack_id=f"ack-{i}",
+                message=SimpleNamespace(message_id=str(i), data=payload),
+            )
+            for i, payload in enumerate(payloads)
+        ]
+        self.acked, self.nacked = [], []
+
+    def pull(self, request, timeout=None):
+        received = self.pending[: request["max_messages"]]
+        del self.pending[: len(received)]
+        return SimpleNamespace(received_messages=received)
+
+    def acknowledge(self, request):
+        self.acked += request["ack_ids"]
+
+    def modify_ack_deadline(self, request):
+        if request["ack_deadline_seconds"] == 0:
+            self.nacked += request["ack_ids"]
+
+
+class FakeDB:
+    def __init__(self):
+        self.songs = {}
+        self.lock = threading.Lock()
+
+    def load_songs_to_tracks(self, song_infos):
+        return {info["Track URI"]: int(info["Track URI"]) for info in song_infos}
+
+    def add_songs(self, songs):
+        if any(title == "broken" for _, title, _ in songs):
+            raise RuntimeError("write failed")
+        with self.lock:
+            for song_id, title, fingerprints in songs:
+                self.songs[song_id] = len(fingerprints)
+
+
+def fake_lookup(job):
+    song = json.loads(job.data)
+    if not song.get("artist"):
+        raise SkipMessage("title or artist is missing")
+    job.title = song["title"]
+    return {"Track URI": song["uri"], "youtube_url": song["title"]}
+
+
+def fake_load_audio(url, key):
+    rng = np.random.default_rng(len(url))
+    return rng.standard_normal(22050 * 3).astype(np.float32), 22050
+
+
+def test_batch_worker_acks_committed_songs_only():
+    payloads = [
+        json.dumps({"title": f"song {i}", "artist": "a", "uri": str(i)}).encode()
+        for i in range(6)
+    ]
+    payloads.append(json.dumps({"title": "no artist", "uri": "7"}).encode())
+    payloads.append(json.dumps({"title": "broken", "artist": "a", "uri": "8"}).encode())
+    subscriber = FakeSubscriber(payloads)
+    db = FakeDB()
+    worker = BatchWorker(
+        subscriber,
+        "projects/p/subscriptions/s",
+        db,
+        lookup=fake_lookup,
+        load_audio=fake_load_audio,
+        fingerprint_workers=2,
+        batch_size=4,
+        batch_linger=0.2,
+        max_in_flight=5,
+    )
+    worker.run(idle_exit=True)
+
+    assert sorted(db.songs) == list(range(6))
+    assert all(n > 0 for n in db.songs.values())
+    # The message without an artist is dropped, the song that cannot be
+    # written is nacked without holding back the rest of its batch
+    assert sorted(subscriber.acked) == [f"ack-{i}" for i in range(7)]
+    assert subscriber.nacked == ["ack-7"]
+    stats = worker.stats()
+    assert stats["in_flight"] == 0
+    assert stats["stages"]["write"]["done"] == 6